@@ -106,6 +106,10 @@ export type ProctoringCheckResponse = {
   enrolledStudentId?: string;
   violationCount?: number;
   forceLogout?: boolean;
+  /** Chỉ có khi request gửi syncEnroll: kết quả cập nhật định danh từ cùng frame. */
+  enroll?: EnrollSyncResult;
+  /** Gợi ý của Gaze service: chờ bao lâu (ms) trước khi gửi frame tiếp theo. */
+  nextCaptureMs?: number;
   face?: {
     theta: number;
     phi: number;
@@ -127,6 +131,11 @@ type GazeApiFace = {
   direction?: string;
   looking_away?: boolean;
 };
+type EnrollSyncResult = {
+  enrolled: boolean;
+  detail?: string;
+  pose_complete?: boolean;
+};
 type GazeEstimateResponse = { faces?: GazeApiFace[] };
 type GazeEstimateResponseWithImage = GazeEstimateResponse & {
   annotated_image_base64?: string | null;
@@ -135,6 +144,8 @@ type GazeEstimateResponseWithImage = GazeEstimateResponse & {
   violation_type?: string;
   message?: string;
   enrolled_student_id?: string | null;
+  enroll?: EnrollSyncResult | null;
+  next_capture_ms?: number | null;
 };
 
 export async function POST(
@@ -151,6 +162,7 @@ export async function POST(
   try {
     const body = await req.json();
     const imageBase64 = typeof body?.imageBase64 === 'string' ? body.imageBase64 : '';
+    const syncEnroll = body?.syncEnroll === true;
 
     if (!imageBase64) {
       const strike = await recordProctoringViolation({
@@ -187,7 +199,9 @@ export async function POST(
     });
     const studentId = examineeRow?.mssv?.trim() ?? '';
 
-    const endpoint = `${serviceUrl.replace(/\/$/, '')}/gaze/estimate`;
+    // /proctoring/tick = enroll + estimate trên cùng frame (decode/detect/gaze một lần); chỉ cần khi còn phải đồng bộ định danh.
+    const useTick = syncEnroll && studentId !== '';
+    const endpoint = `${serviceUrl.replace(/\/$/, '')}${useTick ? '/proctoring/tick' : '/gaze/estimate'}`;
     let res: Response;
     try {
       const controller = new AbortController();
@@ -198,6 +212,7 @@ export async function POST(
         body: JSON.stringify({
           image_base64: imageBase64,
           ...(studentId ? { student_id: studentId } : {}),
+          ...(useTick ? { enroll: true } : {}),
         }),
         signal: controller.signal,
       }).finally(() => clearTimeout(timer));
@@ -234,6 +249,18 @@ export async function POST(
     const enrolledFromService =
       typeof data.enrolled_student_id === 'string' ? data.enrolled_student_id.trim() : '';
     const enrolledStudentId = enrolledFromService || undefined;
+    const enroll =
+      data.enroll && typeof data.enroll.enrolled === 'boolean'
+        ? {
+            enrolled: data.enroll.enrolled,
+            detail: data.enroll.detail,
+            pose_complete: data.enroll.pose_complete,
+          }
+        : undefined;
+    const nextCaptureMs =
+      typeof data.next_capture_ms === 'number' && Number.isFinite(data.next_capture_ms)
+        ? data.next_capture_ms
+        : undefined;
 
     let violationCount: number | undefined;
     let forceLogout = false;
@@ -293,6 +320,8 @@ export async function POST(
       enrolledStudentId,
       violationCount,
       forceLogout,
+      ...(enroll ? { enroll } : {}),
+      ...(nextCaptureMs !== undefined ? { nextCaptureMs } : {}),
     });
   } catch {
     return NextResponse.json({ error: 'Lỗi xử lý kiểm tra giám sát' }, { status: 500 });
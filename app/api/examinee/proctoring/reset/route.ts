@@ -2,7 +2,7 @@ import { NextResponse } from 'next/server';
 import { verifyExaminee } from '@/lib/auth';
 import { prisma } from '@/lib/prisma';
 
-/** Xóa trạng thái enroll (histogram + bước pose) trên Gaze service cho MSSV hiện tại — khi hủy hoặc làm lại chưa đủ bước. */
+/** Xóa trạng thái enroll (mô tả mặt + bước pose) trên Gaze service cho MSSV hiện tại — khi hủy hoặc làm lại chưa đủ bước. */
 export async function POST() {
   const auth = await verifyExaminee();
   if (!auth) {
@@ -65,7 +65,7 @@ export default function ExamineeHome({ examinee }: ExamineeHomeProps) {
     if (enrollVideoRef.current) enrollVideoRef.current.srcObject = null;
   }, []);
 
-  /** Reset histogram + bước enroll trên Gaze service (làm lại từ đầu khi chưa xong). Không gọi sau khi đã enroll thành công vào thi. */
+  /** Reset mô tả mặt + bước enroll trên Gaze service (làm lại từ đầu khi chưa xong). Không gọi sau khi đã enroll thành công vào thi. */
   const resetIncompleteEnrollOnServer = useCallback(async () => {
     try {
       await fetch('/api/examinee/proctoring/reset', { method: 'POST' });
@@ -41,6 +41,9 @@ const CAPTURE_INTERVAL_MS = (() => {
   // Default faster to feel realtime, but still reasonable load.
   return Number.isFinite(n) && n >= 200 ? n : 500;
 })();
+/** Giới hạn cho nextCaptureMs do Gaze service gợi ý (server giãn nhịp khi thí sinh yên, dồn nhịp khi đang đếm vi phạm). */
+const MIN_CAPTURE_INTERVAL_MS = 200;
+const MAX_CAPTURE_INTERVAL_MS = 5_000;
 const JPEG_QUALITY = 0.85;
 const MAX_WIDTH = 640;
 const CHECK_TIMEOUT_MS = 12_000;
@@ -59,7 +62,7 @@ export function useProctoring(enabled: boolean, options?: UseProctoringOptions)
 
   const videoRef = useRef<HTMLVideoElement | null>(null);
   const streamRef = useRef<MediaStream | null>(null);
-  const intervalRef = useRef<ReturnType<typeof setInterval> | null>(null);
+  const intervalRef = useRef<ReturnType<typeof setTimeout> | null>(null);
   const pendingCheckRef = useRef(false);
   const violationTimeoutRef = useRef<ReturnType<typeof setTimeout> | null>(null);
   const enrolledRef = useRef(false);
@@ -84,7 +87,7 @@ export function useProctoring(enabled: boolean, options?: UseProctoringOptions)
   useEffect(() => {
     if (!enabled) {
       if (intervalRef.current) {
-        clearInterval(intervalRef.current);
+        clearTimeout(intervalRef.current);
         intervalRef.current = null;
       }
       if (streamRef.current) {
@@ -124,36 +127,11 @@ export function useProctoring(enabled: boolean, options?: UseProctoringOptions)
         setActive(true);
 
         const canvas = document.createElement('canvas');
-
-        /** Đồng bộ histogram lên Gaze service (bắt buộc ít nhất 1 lần mỗi phiên proctoring).
-         *  Không được bỏ qua chỉ vì sessionStorage: restart service / worker khác làm mất bộ nhớ → không gán MSSV. */
-        const enrollOnce = async () => {
-          if (enrolledRef.current) return;
-          const v = videoRef.current;
-          const s = streamRef.current;
-          if (!v || !s || v.readyState !== 4 || v.videoWidth === 0) return;
-
-          const w = Math.min(v.videoWidth, MAX_WIDTH);
-          const h = Math.round((v.videoHeight * w) / v.videoWidth);
-          canvas.width = w;
-          canvas.height = h;
-          const ctx = canvas.getContext('2d');
-          if (!ctx) return;
-          drawVideoMirroredLikePreview(ctx, v, w, h);
-          const dataUrl = canvas.toDataURL('image/jpeg', JPEG_QUALITY);
-          const base64 = dataUrl.replace(/^data:image\/jpeg;base64,/, '');
-
-          const res = await fetch('/api/examinee/proctoring/enroll', {
-            method: 'POST',
-            headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({ imageBase64: base64 }),
-          });
-          if (res.ok) enrolledRef.current = true;
-        };
+        let nextCaptureMs = CAPTURE_INTERVAL_MS;
 
         const check = async () => {
+          nextCaptureMs = CAPTURE_INTERVAL_MS;
           if (pendingCheckRef.current) return;
-          await enrollOnce();
           const v = videoRef.current;
           const s = streamRef.current;
           if (!v || !s || v.readyState !== 4 || v.videoWidth === 0) return;
@@ -179,12 +157,21 @@ export function useProctoring(enabled: boolean, options?: UseProctoringOptions)
             const res = await fetch('/api/examinee/proctoring/check', {
               method: 'POST',
               headers: { 'Content-Type': 'application/json' },
-              body: JSON.stringify({ imageBase64: base64 }),
+              // Đồng bộ mô tả mặt lên Gaze service (bắt buộc ít nhất 1 lần mỗi phiên proctoring) — cùng request với check.
+              // Không được bỏ qua chỉ vì sessionStorage: restart service / worker khác làm mất bộ nhớ → không gán MSSV.
+              body: JSON.stringify({ imageBase64: base64, syncEnroll: !enrolledRef.current }),
               signal: controller.signal,
               credentials: 'same-origin',
             }).finally(() => clearTimeout(timer));
 
             const data = await res.json().catch(() => ({}));
+            if ((data as { enroll?: { enrolled?: unknown } }).enroll?.enrolled === true) {
+              enrolledRef.current = true;
+            }
+            const hintMs = (data as { nextCaptureMs?: unknown }).nextCaptureMs;
+            if (typeof hintMs === 'number' && Number.isFinite(hintMs)) {
+              nextCaptureMs = Math.min(MAX_CAPTURE_INTERVAL_MS, Math.max(MIN_CAPTURE_INTERVAL_MS, hintMs));
+            }
 
             if (!res.ok) {
               const msg =
@@ -296,8 +283,16 @@ export function useProctoring(enabled: boolean, options?: UseProctoringOptions)
           }
         };
 
-        intervalRef.current = setInterval(check, CAPTURE_INTERVAL_MS);
-        await check();
+        // Chuỗi setTimeout thay cho setInterval: mỗi frame chờ theo gợi ý của service cho frame trước.
+        const loop = async () => {
+          try {
+            await check();
+          } catch {
+            nextCaptureMs = CAPTURE_INTERVAL_MS;
+          }
+          if (!cancelled) intervalRef.current = setTimeout(loop, nextCaptureMs);
+        };
+        await loop();
       } catch {
         if (!cancelled) {
           setError('Không thể mở camera. Vui lòng cấp quyền camera để giám sát.');
@@ -309,7 +304,7 @@ export function useProctoring(enabled: boolean, options?: UseProctoringOptions)
     return () => {
       cancelled = true;
       if (intervalRef.current) {
-        clearInterval(intervalRef.current);
+        clearTimeout(intervalRef.current);
         intervalRef.current = null;
       }
       if (streamRef.current) {
@@ -1,18 +1,29 @@
+import asyncio
 import base64
 import math
 import os
-import threading
 import time
-from contextlib import asynccontextmanager
-from typing import Any, Optional
+from contextlib import asynccontextmanager, nullcontext
+from typing import Any, Callable, Literal, Optional
 
 import cv2
 import numpy as np
 import torch
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import Response
 from pydantic import BaseModel, Field
 
 from l2cs import Pipeline
+from l2cs.utils import crop_faces, rescale_faces, resize_for_detection
+from proctoring_batching import DetectBatcher, GazeBatcher
+from proctoring_cache import CacheStats, crop_signature, frame_thumbnail, signature_distance
+from proctoring_executor import BoundedInferenceExecutor, InferenceSaturated
+from proctoring_identity import IdentityStore, face_descriptors
+from proctoring_metrics import ServiceMetrics, counter, counts_histogram, gauge
+from proctoring_state import FrameObservation, SessionRegistry, SessionState
+from proctoring_store import EnrollmentRecord, EnrollmentStore
+from proctoring_tracking import motion_energy, propagate_boxes, tracking_gray
+from proctoring_workers import InferenceWorkerPool
 
 # Load environment variables from repo .env if present.
 try:
@@ -27,6 +38,10 @@ except Exception:
     pass
 
 
+AnnotateMode = Literal["never", "on_violation", "always"]
+_ANNOTATE_MODES: tuple[str, ...] = ("never", "on_violation", "always")
+
+
 class GazeEstimateRequest(BaseModel):
     image_base64: str | None = Field(None, description="Base64 JPEG/PNG without data URL prefix")
     student_id: str | None = Field(
@@ -34,6 +49,10 @@ class GazeEstimateRequest(BaseModel):
         max_length=64,
         description="Mã sinh viên (MSSV) từ app — hiển thị trên bbox/message, không dùng ID track",
     )
+    annotate: AnnotateMode = Field(
+        "on_violation",
+        description="Khi nào trả annotated_image_base64: never | on_violation | always",
+    )
 
 class EnrollRequest(BaseModel):
     student_id: str = Field(..., min_length=1, max_length=64)
@@ -68,21 +87,38 @@ class GazeEstimateResponse(BaseModel):
     violation_type: str = "ok"
     message: str = "OK"
     enrolled_student_id: str | None = None
+    # Gợi ý khoảng chờ (ms) trước frame tiếp theo: ngắn khi đang đếm dwell vi phạm, dài khi thí sinh yên / server tải cao.
+    next_capture_ms: int | None = None
 
 
-def _face_hist(gray_face_112: np.ndarray) -> np.ndarray:
-    hist = cv2.calcHist([gray_face_112], [0], None, [32], [0, 256])
-    hist = cv2.normalize(hist, hist).reshape(-1)
-    return hist
+class TickRequest(GazeEstimateRequest):
+    enroll: bool = Field(
+        True,
+        description="Cập nhật định danh (như /proctoring/enroll) từ chính frame này trước khi estimate; "
+        "client tắt sau khi đã đồng bộ để mẫu enroll không bị trộn với frame lúc thi",
+    )
 
 
-def _hist_similarity(a: np.ndarray, b: np.ndarray) -> float:
-    """So khớp mặt ổn định hơn: lấy max correl ∩ intersect (histogram đã normalize)."""
-    a32 = a.astype(np.float32)
-    b32 = b.astype(np.float32)
-    correl = float(cv2.compareHist(a32, b32, cv2.HISTCMP_CORREL))
-    inter = float(cv2.compareHist(a32, b32, cv2.HISTCMP_INTERSECT))
-    return max(correl, inter)
+class TickResponse(GazeEstimateResponse):
+    enroll: EnrollResponse | None = None
+
+
+def _face_descriptors(frame_bgr: np.ndarray, bboxes: list[list[float]]) -> tuple[np.ndarray, list[int]]:
+    """
+    Mô tả LBP (proctoring_identity.face_descriptors) cho nhiều bbox trong một lần.
+    Trả (descs (K, D) float32 đã chuẩn hoá L2, chỉ số bbox có crop hợp lệ).
+    """
+    crops: list[np.ndarray] = []
+    kept: list[int] = []
+    with _stage("identity"):
+        for i, bb in enumerate(bboxes):
+            gray112 = _crop_face_gray_112(frame_bgr, bb)
+            if gray112 is not None:
+                crops.append(gray112)
+                kept.append(i)
+        if not crops:
+            return face_descriptors(np.empty((0, 112, 112), dtype=np.uint8)), kept
+        return face_descriptors(np.stack(crops)), kept
 
 
 def _mssv_key(s: str | None) -> str:
@@ -93,8 +129,13 @@ def _mssv_key(s: str | None) -> str:
     return t.casefold() if t else ""
 
 
-def _hist_owner_matches_request(enrolled_sid: str, request_sid: str) -> bool:
-    """Có dùng histogram định danh đã lưu hay không: cùng thí sinh; request không gửi MSSV thì vẫn dùng (máy chủ đơn)."""
+def _session_key(student_id: str | None) -> str:
+    """Khoá SessionState trong registry: MSSV đã chuẩn hoá; "anon" khi request không có MSSV."""
+    return _mssv_key(student_id) or "anon"
+
+
+def _identity_owner_matches_request(enrolled_sid: str, request_sid: str) -> bool:
+    """Có dùng mô tả định danh đã lưu hay không: cùng thí sinh; request không gửi MSSV thì vẫn dùng (máy chủ đơn)."""
     ek = _mssv_key(enrolled_sid)
     rk = _mssv_key(request_sid)
     if not ek:
@@ -264,15 +305,6 @@ def _assign_face_ids(
     return new_ids, next_id
 
 
-def _tracks_from_state(app: FastAPI) -> list[dict[str, Any]]:
-    tracks = getattr(app.state, "_tracks", None)
-    return tracks if isinstance(tracks, list) else []
-
-
-def _save_tracks_to_state(app: FastAPI, tracks: list[dict[str, Any]]) -> None:
-    app.state._tracks = tracks
-
-
 def _update_tracks_with_detections(
     tracks: list[dict[str, Any]],
     new_bboxes: list[list[float]],
@@ -335,12 +367,27 @@ def _update_tracks_with_detections(
     return tracks, new_ids, next_id
 
 
+def _move_tracks(tracks: list[dict[str, Any]], ids: list[int] | None, bboxes: np.ndarray) -> None:
+    """Cập nhật bbox của track theo box đã dời bằng tracker (giữa hai lần detect) để lần IoU match sau khớp đúng."""
+    if not isinstance(ids, list):
+        return
+    by_id = {int(tid): bboxes[i] for i, tid in enumerate(ids) if i < int(bboxes.shape[0])}
+    for tr in tracks:
+        bb = by_id.get(int(tr["id"]))
+        if bb is not None:
+            tr["bbox"] = [float(v) for v in bb.tolist()]
+
+
 def _annotate_frame(frame_bgr: np.ndarray, faces: list[dict[str, Any]], arrow_multiplier: float) -> np.ndarray:
     """
     Draw bbox + gaze arrow + target dot, similar to service/l2cs/vis.py.
     Expects bbox in original frame coordinates.
     """
-    out = frame_bgr.copy()
+    with _stage("annotate"):
+        return _draw_faces(frame_bgr.copy(), faces, arrow_multiplier)
+
+
+def _draw_faces(out: np.ndarray, faces: list[dict[str, Any]], arrow_multiplier: float) -> np.ndarray:
     for f in faces:
         bbox = f.get("bbox")
         if not (isinstance(bbox, list) and len(bbox) >= 4):
@@ -374,7 +421,7 @@ def _annotate_frame(frame_bgr: np.ndarray, faces: list[dict[str, Any]], arrow_mu
             cv2.rectangle(out, (box_x1, box_y1), (box_x2, box_y2), (0, 255, 0), -1)
             cv2.putText(out, label, (box_x1 + pad, box_y2 - baseline - pad), font, font_scale, (0, 0, 0), thickness, cv2.LINE_AA)
 
-        # Mũi tên / điểm gaze chỉ cho mặt đã khớp định danh (histogram); người chưa định danh chỉ bbox.
+        # Mũi tên / điểm gaze chỉ cho mặt đã khớp định danh (mô tả LBP); người chưa định danh chỉ bbox.
         if not f.get("draw_gaze_arrow"):
             continue
         dx_raw = f.get("dx_px")
@@ -398,33 +445,34 @@ def _annotate_frame(frame_bgr: np.ndarray, faces: list[dict[str, Any]], arrow_mu
 
 
 def _encode_bgr_to_jpeg_base64(frame_bgr: np.ndarray) -> str:
-    ok, buf = cv2.imencode(".jpg", frame_bgr, [int(cv2.IMWRITE_JPEG_QUALITY), 90])
-    if not ok:
-        raise HTTPException(status_code=500, detail="Failed to encode annotated image")
-    return base64.b64encode(buf.tobytes()).decode("ascii")
+    with _stage("encode"):
+        ok, buf = cv2.imencode(".jpg", frame_bgr, [int(cv2.IMWRITE_JPEG_QUALITY), 90])
+        if not ok:
+            raise HTTPException(status_code=500, detail="Failed to encode annotated image")
+        return base64.b64encode(buf.tobytes()).decode("ascii")
 
 
-def _predict_from_bboxes(gaze_pipeline: Pipeline, frame_bgr: np.ndarray, bboxes: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
-    face_imgs: list[np.ndarray] = []
-    kept_idx: list[int] = []
-    h, w = frame_bgr.shape[:2]
-    for i, box in enumerate(bboxes):
-        x_min = max(0, int(box[0]))
-        y_min = max(0, int(box[1]))
-        x_max = min(w, int(box[2]))
-        y_max = min(h, int(box[3]))
-        if x_max <= x_min or y_max <= y_min:
-            continue
-        img = frame_bgr[y_min:y_max, x_min:x_max]
-        img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-        img = cv2.resize(img, (224, 224))
-        face_imgs.append(img)
-        kept_idx.append(i)
-
-    if len(face_imgs) == 0:
-        return np.empty((0, 1)), np.empty((0, 1))
-
-    pitch_arr, yaw_arr = gaze_pipeline.predict_gaze(np.stack(face_imgs))
+def _source_jpeg_base64(source: bytes | None, source_b64: str | None) -> str | None:
+    """Base64 của ảnh gốc nếu nó đã là JPEG (SOI marker FF D8), ngược lại None."""
+    if source is None or bytes(source[:2]) != b"\xff\xd8":
+        return None
+    if source_b64:
+        return source_b64
+    return base64.b64encode(source).decode("ascii")
+
+
+def _predict_from_bboxes(
+    predict_gaze: Callable[[np.ndarray], tuple[np.ndarray, np.ndarray]],
+    frame_bgr: np.ndarray,
+    bboxes: np.ndarray,
+    input_size: int = 448,
+) -> tuple[np.ndarray, np.ndarray]:
+    # Crop thẳng về cỡ input của mạng (trước đây 224 rồi prep_input_numpy phóng lên 448); BGR->RGB một lần cho cả stack.
+    with _stage("gaze"):
+        face_imgs, kept_idx = crop_faces(frame_bgr, bboxes, input_size)
+        if len(kept_idx) == 0:
+            return np.empty((0, 1)), np.empty((0, 1))
+        pitch_arr, yaw_arr = predict_gaze(face_imgs)
     # Expand back to original bbox count so indices stay aligned
     pitch_full = np.full((bboxes.shape[0], 1), np.nan, dtype=np.float32)
     yaw_full = np.full((bboxes.shape[0], 1), np.nan, dtype=np.float32)
@@ -544,13 +592,22 @@ def _enroll_gaze_direction_matches(
 
 
 def _decode_base64_image_to_bgr(image_base64: str) -> np.ndarray:
+    return _decode_image_bytes_to_bgr(_b64decode_payload(image_base64))
+
+
+def _b64decode_payload(image_base64: str) -> bytes:
     try:
-        raw = base64.b64decode(image_base64, validate=True)
+        with _stage("b64decode"):
+            return base64.b64decode(image_base64, validate=True)
     except Exception as e:  # noqa: BLE001
         raise HTTPException(status_code=400, detail="Invalid base64 payload") from e
 
-    arr = np.frombuffer(raw, dtype=np.uint8)
-    img = cv2.imdecode(arr, cv2.IMREAD_COLOR)
+
+def _decode_image_bytes_to_bgr(data: bytes | bytearray | memoryview) -> np.ndarray:
+    # np.frombuffer chỉ tạo view trên buffer của request — không copy trước khi imdecode.
+    arr = np.frombuffer(data, dtype=np.uint8)
+    with _stage("decode"):
+        img = cv2.imdecode(arr, cv2.IMREAD_COLOR)
     if img is None:
         raise HTTPException(status_code=400, detail="Invalid image data")
     return img
@@ -594,13 +651,95 @@ def _resolve_weights_path(weights: str) -> str:
     return weights
 
 
+def _restore_enrollments(store: EnrollmentStore, registry: SessionRegistry, identity_store: IdentityStore) -> None:
+    """Nạp enroll đã lưu vào SessionRegistry + IdentityStore; thí sinh enroll gần nhất làm default key."""
+    for rec in store.load():
+        if _restore_record(store, registry, identity_store, rec):
+            registry.set_default_key(rec.key)
+
+
+def _restore_record(
+    store: EnrollmentStore, registry: SessionRegistry, identity_store: IdentityStore, rec: EnrollmentRecord
+) -> bool:
+    if rec.descriptor_sum.size != identity_store.dim:
+        # Mô tả của phiên bản cũ (khác số chiều): bỏ, thí sinh enroll lại.
+        store.delete(rec.key)
+        return False
+    with registry.session(rec.key, student_id=rec.student_id) as sess:
+        sess.restore_checked = True
+        if sess.enrolled_samples > 0:
+            # Đã enroll lại trong lúc đọc DB: giữ bản mới.
+            return False
+        identity_store.restore(rec.key, rec.descriptor_sum, rec.samples)
+        sess.student_id = rec.student_id
+        sess.enrolled_samples = rec.samples
+        sess.enroll_seq = rec.enroll_seq
+    return True
+
+
+def _restore_evicted_enrollment(sess_key: str) -> None:
+    """
+    Session hết hạn idle chỉ bị xoá khỏi bộ nhớ, bản lưu vẫn còn: lần đầu thấy lại key thì nạp enroll từ
+    EnrollmentStore (một lần cho mỗi session, kể cả khi không có bản ghi).
+    """
+    store: Optional[EnrollmentStore] = getattr(app.state, "enrollment_store", None)
+    if store is None:
+        return
+    registry = _session_registry()
+    with registry.session(sess_key) as sess:
+        if sess.restore_checked or sess.enrolled_samples > 0:
+            return
+        sess.restore_checked = True
+    rec = store.get(sess_key)
+    if rec is not None:
+        _restore_record(store, registry, app.state.identity_store, rec)
+
+
+def _persist_enrollment(sess_key: str, sid: str, enroll_seq: dict[str, Any]) -> None:
+    store: Optional[EnrollmentStore] = getattr(app.state, "enrollment_store", None)
+    if store is None:
+        return
+    exported = app.state.identity_store.export(sess_key)
+    if exported is None:
+        return
+    descriptor_sum, samples = exported
+    # gaze_ok_since là time.monotonic() của tiến trình này — vô nghĩa sau restart.
+    seq = {**enroll_seq, "gaze_ok_since": None}
+    store.put(EnrollmentRecord(sess_key, sid, samples, descriptor_sum, seq))
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     weights = _resolve_weights_path(os.getenv("PROCTORING_WEIGHTS", "models/L2CSNet_gaze360.pkl"))
     arch = os.getenv("PROCTORING_ARCH", "ResNet50")
+    # Runtime của mạng gaze: eager (nn.Module), torchscript hoặc onnxruntime (file từ export_backend.py,
+    # export cùng --input_size với PROCTORING_INPUT_SIZE).
+    backend = (os.getenv("PROCTORING_BACKEND", "eager") or "eager").strip().lower()
+    backend_path = os.getenv("PROCTORING_BACKEND_PATH") or None
+    if backend_path:
+        backend_path = _resolve_weights_path(backend_path)
+    # Ngữ cảnh chạy của predict_gaze (luôn torch.inference_mode): channels_last (không đổi kết quả; với worker
+    # trọng số mmap chỉ đổi layout input để không tách bản sao trọng số riêng mỗi tiến trình),
+    # bf16 autocast chỉ bật được trên CPU hỗ trợ bf16 (sai khác ~0.01 rad), số luồng torch (0 = mặc định).
+    channels_last = str(os.getenv("PROCTORING_CHANNELS_LAST", "1") or "1").strip().lower() in ("1", "true", "yes")
+    bf16 = str(os.getenv("PROCTORING_BF16", "0") or "0").strip().lower() in ("1", "true", "yes")
+    torch_threads = max(0, _env_int("PROCTORING_TORCH_THREADS", 0))
     device = _parse_device(os.getenv("PROCTORING_DEVICE", "cpu"))
     confidence_threshold = float(os.getenv("PROCTORING_FACE_CONFIDENCE", "0.5"))
+    # "adaptive": detect theo từng thí sinh khi cảnh đổi (motion ngoài bbox, tracker mất dấu, mất khớp định danh)
+    # hoặc đã quá PROCTORING_DETECT_MAX_STALE_N frame; "fixed": mỗi PROCTORING_DETECT_EVERY_N frame.
+    app.state.detect_mode = (os.getenv("PROCTORING_DETECT_MODE", "adaptive") or "adaptive").strip().lower()
     app.state.detect_every_n = max(1, _env_int("PROCTORING_DETECT_EVERY_N", 10))
+    app.state.detect_max_stale_n = max(1, _env_int("PROCTORING_DETECT_MAX_STALE_N", 30))
+    # Ngưỡng trung bình |Δ mức xám| ngoài bbox (ảnh thu nhỏ) coi là cảnh thay đổi.
+    app.state.detect_motion_threshold = max(0.0, _env_float("PROCTORING_DETECT_MOTION_THRESHOLD", 6.0))
+    # Cạnh dài tối đa của ảnh đưa vào RetinaFace (0 = giữ nguyên độ phân giải).
+    app.state.detect_max_side = max(0, _env_int("PROCTORING_DETECT_MAX_SIDE", 480))
+    # Giữa hai lần detect: "lk" = dời bbox bằng optical flow (Lucas-Kanade) trên vùng mặt, "none" = giữ nguyên bbox cũ.
+    # Có tracker thì PROCTORING_DETECT_EVERY_N có thể tăng lên 30+ mà crop gaze vẫn bám mặt.
+    app.state.tracker = (os.getenv("PROCTORING_TRACKER", "lk") or "lk").strip().lower()
+    # Tỉ lệ điểm đặc trưng theo được tối thiểu; thấp hơn coi như mất dấu -> detect lại ngay.
+    app.state.tracker_min_conf = max(0.0, min(1.0, _env_float("PROCTORING_TRACKER_MIN_CONF", 0.3)))
     app.state.arrow_multiplier = _env_float("PROCTORING_ARROW_MULTIPLIER", 4.0)
     app.state.cheat_threshold_rad = _env_float("PROCTORING_CHEAT_THRESHOLD_RAD", 0.35)
     # Góc tối thiểu (rad) mới coi là "lệch quá mức".
@@ -614,16 +753,34 @@ async def lifespan(app: FastAPI):
     app.state.looking_away_false_grace_sec = max(
         0.0, _env_float("PROCTORING_LOOKING_AWAY_FALSE_GRACE_SEC", 2.0)
     )
-    app.state._looking_away_since = {}  # key: MSSV hoặc "anon" -> monotonic() lúc bắt đầu lệch
-    # Đã gửi violation looking_away cho lượt lệch hiện tại — reset khi nhìn lại / mất mặt; mỗi lượt 1 popup + 1 ảnh (tại boundary PROCTORING_LOOKING_AWAY_MIN_SEC).
-    app.state._looking_away_violation_emitted = {}
-    # Khi đang lệch mà bị đọc ngược (geo False) do jitter/crop, cho phép sai lệch trong thời gian ngắn.
-    # false_since: key (MSSV/anon) -> thời điểm bắt đầu "false streak".
-    app.state._looking_away_false_since = {}
-    app.state._no_face_since = {}
-    app.state._no_face_emitted = {}
-    app.state._multi_face_since = {}
-    app.state._multi_face_emitted = {}
+    # Trạng thái theo thí sinh (tracks, bước enroll, dwell timers, EMA gaze) nằm trong SessionState,
+    # lưu ở registry chia shard (mỗi shard một lock) thay vì một lock toàn cục.
+    # Mô tả mặt đã enroll của mọi thí sinh: một ma trận float32, khoá = key của SessionState;
+    # hàng được giải phóng khi session bị reset / hết hạn.
+    app.state.identity_store = IdentityStore()
+    # Enroll (mô tả mặt, số mẫu, bước pose) ghi nền xuống SQLite và nạp lại ở đây — restart giữa giờ thi
+    # không bắt thí sinh enroll lại. Mặc định tắt (mô tả mặt là dữ liệu sinh trắc): đặt đường dẫn tuyệt đối
+    # tới thư mục dữ liệu để bật; đường dẫn tương đối tính theo thư mục làm việc.
+    enroll_db = (os.getenv("PROCTORING_ENROLL_DB", "") or "").strip()
+    enrollment_store: Optional[EnrollmentStore] = None
+    if enroll_db:
+        enrollment_store = EnrollmentStore(
+            enroll_db, flush_interval_ms=_env_float("PROCTORING_ENROLL_DB_FLUSH_MS", 250.0)
+        )
+    app.state.enrollment_store = enrollment_store
+
+    def _on_session_removed(key: str) -> None:
+        # Chỉ giải phóng bộ nhớ: bản lưu bị xoá ở /proctoring/reset, còn session hết hạn idle được
+        # nạp lại khi thí sinh quay lại (_restore_evicted_enrollment).
+        app.state.identity_store.remove(key)
+
+    app.state.sessions = SessionRegistry(
+        num_shards=max(1, _env_int("PROCTORING_SESSION_SHARDS", 64)),
+        idle_ttl_sec=_env_float("PROCTORING_SESSION_IDLE_SEC", 3 * 3600.0),
+        on_remove=_on_session_removed,
+    )
+    if enrollment_store is not None:
+        _restore_enrollments(enrollment_store, app.state.sessions, app.state.identity_store)
     # Used only as fallback when bbox not available
     app.state.direction_threshold_deg = _env_float("PROCTORING_DIRECTION_THRESHOLD_DEG", 6.0)
     # Deadzone nhãn hướng (so với bbox width): tăng nhẹ so với 0.15 để bớt nhảy trái lên / trái xuống do nhiễu.
@@ -631,11 +788,15 @@ async def lifespan(app: FastAPI):
     app.state.max_faces = max(1, _env_int("PROCTORING_MAX_FACES", 1))
     app.state.track_iou_threshold = _env_float("PROCTORING_TRACK_IOU_THRESHOLD", 0.30)
     app.state.track_max_misses = max(0, _env_int("PROCTORING_TRACK_MAX_MISSES", 15))
-    _enroll_thr_hard = _env_float("PROCTORING_ENROLL_MATCH_THRESHOLD", 0.42)
-    _enroll_thr_soft_in = _env_float("PROCTORING_ENROLL_MATCH_THRESHOLD_SOFT", 0.32)
-    app.state.enroll_match_threshold = _enroll_thr_hard
-    # “Mềm” luôn < hard (một mặt trong khung); giảm false negative MSSV khi sáng/crop lệch.
-    app.state.enroll_match_threshold_soft = max(0.22, min(_enroll_thr_soft_in, _enroll_thr_hard - 0.01))
+    # Cosine giữa mô tả LBP của mặt và mô tả đã enroll. Cùng thí sinh, cùng webcam: ~0.87..0.97;
+    # khác phòng/thiết bị rơi về ~0.75..0.85 — nên enroll lại đầu mỗi phiên thi.
+    _identity_thr_hard = _env_float("PROCTORING_IDENTITY_MATCH_THRESHOLD", 0.85)
+    _identity_thr_soft_in = _env_float("PROCTORING_IDENTITY_MATCH_THRESHOLD_SOFT", 0.78)
+    app.state.identity_match_threshold = _identity_thr_hard
+    # Tái dùng độ khớp định danh của track khi box chưa trôi quá ngưỡng IoU này (giữa hai lần detect).
+    app.state.identity_cache_iou = max(0.0, min(1.0, _env_float("PROCTORING_IDENTITY_CACHE_IOU", 0.85)))
+    # “Mềm” luôn < hard (một mặt trong khung); giảm false negative MSSV khi crop lệch / xoay đầu.
+    app.state.identity_match_threshold_soft = max(0.5, min(_identity_thr_soft_in, _identity_thr_hard - 0.01))
     # Ngưỡng pose (rad) cho enroll đa góc — L2CS pitch/yaw.
     # Mặc định thoáng hơn để định danh nhanh; siết bằng env khi cần.
     app.state.enroll_pose_center_max_rad = _env_float("ENROLL_POSE_CENTER_MAX_RAD", 0.14)
@@ -649,24 +810,36 @@ async def lifespan(app: FastAPI):
     # Enroll: cùng hướng nhìn với thi; đủ thời gian giữ + đủ khung (liên tục).
     app.state.enroll_gaze_dwell_sec = max(0.25, _env_float("ENROLL_GAZE_DWELL_SEC", 1.15))
     app.state.enroll_pose_min_good_frames = max(1, _env_int("ENROLL_POSE_MIN_GOOD_FRAMES", 6))
-    app.state.enrolled_student_id = None
-    app.state.enrolled_hist = None
-    app.state.enrolled_hist_samples = 0
-    app.state._enroll_seq_by_student = {}
-    app.state._last_enrolled_bbox_idx = None
-    app.state._frame_counter = 0
-    app.state._last_bboxes = None
-    app.state._last_ids = None  # list[int] aligned with _last_bboxes
-    app.state._next_face_id = 1
-    app.state._tracks = []  # stable IDs across misses
-    app.state._lock = threading.Lock()
     # Làm mượt gaze (0 = tắt; 0.35–0.6 thường hợp lý) — giảm nhảy nhãn/mũi tên giữa các frame HTTP.
+    # Cache gaze theo track: crop gần như không đổi (trung bình |Δ xám| của ảnh 32x32 <= MAX_DIFF) thì dùng lại
+    # pitch/yaw thô, tối đa MAX_AGE_SEC (0 = tắt cache). Tỉ lệ hit ở /stats -> gaze_cache.
+    app.state.gaze_cache_max_age_sec = max(0.0, _env_float("PROCTORING_GAZE_CACHE_MAX_AGE_SEC", 1.0))
+    app.state.gaze_cache_max_diff = max(0.0, _env_float("PROCTORING_GAZE_CACHE_MAX_DIFF", 2.5))
+    app.state.gaze_cache_stats = CacheStats()
+    # Frame gần trùng (webcam thí sinh ngồi yên): so ảnh xám 1/8 (decode DC của JPEG) với frame xử lý đầy đủ gần nhất;
+    # trung bình |Δ xám| <= MAX_DIFF thì bỏ qua decode/detect/gaze, dùng lại quan sát cũ (dwell timer vẫn chạy).
+    # Tối đa MAX_REUSE frame liên tiếp và MAX_AGE_SEC kể từ frame đầy đủ (MAX_REUSE=0 = tắt). Đếm ở /stats -> duplicate_frames.
+    app.state.dup_max_reuse = max(0, _env_int("PROCTORING_DUP_MAX_REUSE", 3))
+    app.state.dup_max_age_sec = max(0.0, _env_float("PROCTORING_DUP_MAX_AGE_SEC", 2.0))
+    app.state.dup_max_diff = max(0.0, _env_float("PROCTORING_DUP_MAX_DIFF", 1.0))
+    app.state.dup_frame_stats = CacheStats()
+    # Histogram độ trễ theo stage (decode, detect, gaze, identity, annotate, encode...) + đếm detect/dùng lại cho /metrics.
+    app.state.metrics = ServiceMetrics()
     app.state.proctoring_gaze_smooth_alpha = max(
         0.0, min(1.0, _env_float("PROCTORING_GAZE_SMOOTH_ALPHA", 0.5))
     )
-    app.state._gaze_smooth_state = {}  # key "{sid}:{track_id}" -> (pitch, yaw)
 
-    if not os.path.exists(weights):
+    if backend != "eager" and not (backend_path and os.path.exists(backend_path)):
+        app.state.gaze_pipeline = None
+        app.state.gaze_weights_path = backend_path or ""
+        app.state.gaze_load_error = (
+            f"PROCTORING_BACKEND={backend} needs PROCTORING_BACKEND_PATH pointing to an exported model "
+            f"(got '{backend_path or ''}'); create it with export_backend.py."
+        )
+        yield
+        return
+
+    if backend == "eager" and not os.path.exists(weights):
         # Don't fail server startup; return 503 on inference until weights exist.
         app.state.gaze_pipeline = None
         app.state.gaze_weights_path = weights
@@ -678,60 +851,362 @@ async def lifespan(app: FastAPI):
         yield
         return
 
+    # PROCTORING_WORKERS > 0: K tiến trình suy luận (trọng số mmap dùng chung, input qua shared memory)
+    # thay cho một Pipeline trong tiến trình uvicorn.
+    num_workers = max(0, _env_int("PROCTORING_WORKERS", 0))
+    # Cỡ input của mạng gaze (crop mặt resize thẳng về cỡ này). 448 = cỡ lúc train Gaze360;
+    # 224 nhanh ~4x, đo sai số bằng benchmark_input_size.py trước khi hạ.
+    input_size = max(64, _env_int("PROCTORING_INPUT_SIZE", 448))
     try:
-        app.state.gaze_pipeline = Pipeline(
-            weights=weights,
-            arch=arch,
-            device=device,
-            include_detector=True,
-            confidence_threshold=confidence_threshold,
-        )
+        if num_workers > 0:
+            app.state.gaze_pipeline = InferenceWorkerPool(
+                num_workers=num_workers,
+                weights=weights,
+                arch=arch,
+                device=str(device),
+                confidence_threshold=confidence_threshold,
+                num_threads=max(1, _env_int("PROCTORING_WORKER_THREADS", (os.cpu_count() or 1) // num_workers)),
+                slot_bytes=max(1, _env_int("PROCTORING_WORKER_SLOT_MB", 16)) * 1024 * 1024,
+                # Worker treo quá chừng này giây bị kill và spawn lại (0 = chờ không giới hạn).
+                call_timeout_sec=max(0.0, _env_float("PROCTORING_WORKER_CALL_TIMEOUT_SEC", 60.0)),
+                input_size=input_size,
+                backend=backend,
+                backend_path=backend_path,
+                channels_last=channels_last,
+                bf16=bf16,
+            )
+        else:
+            app.state.gaze_pipeline = Pipeline(
+                weights=weights,
+                arch=arch,
+                device=device,
+                include_detector=True,
+                confidence_threshold=confidence_threshold,
+                input_size=input_size,
+                backend=backend,
+                backend_path=backend_path,
+                channels_last=channels_last,
+                bf16=bf16,
+                num_threads=torch_threads or None,
+            )
         app.state.gaze_weights_path = weights
         app.state.gaze_load_error = None
     except Exception as e:  # noqa: BLE001
         app.state.gaze_pipeline = None
         app.state.gaze_weights_path = weights
         app.state.gaze_load_error = f"Failed to load model: {e}"
-    yield
+        yield
+        return
+
+    # Gom crop mặt từ các request đồng thời vào một lần predict_gaze (1 = tắt batching).
+    gaze_batcher = GazeBatcher(
+        app.state.gaze_pipeline.predict_gaze,
+        max_batch=_env_int("PROCTORING_GAZE_BATCH_MAX", 16),
+        max_wait_ms=_env_float("PROCTORING_GAZE_BATCH_WAIT_MS", 4.0),
+        consumers=max(1, num_workers),
+    )
+    gaze_batcher.start()
+    app.state.gaze_batcher = gaze_batcher
+    # Tương tự cho RetinaFace: frame cùng cỡ (hoặc pad về cùng cỡ) từ nhiều phiên chạy chung một forward.
+    detect_batcher = DetectBatcher(
+        app.state.gaze_pipeline.detector,
+        max_batch=_env_int("PROCTORING_DETECT_BATCH_MAX", 8),
+        max_wait_ms=_env_float("PROCTORING_DETECT_BATCH_WAIT_MS", 4.0),
+        min_fill=_env_float("PROCTORING_DETECT_BATCH_MIN_FILL", 0.75),
+        consumers=max(1, num_workers),
+    )
+    detect_batcher.start()
+    app.state.detect_batcher = detect_batcher
+    # Executor riêng cho decode/detect/gaze. Mỗi "phần" torch (torch.get_num_threads() core) phục vụ
+    # một batch tại một thời điểm, nên mặc định đủ worker để lấp đầy một batch gaze cho mỗi phần.
+    if num_workers > 0:
+        torch_partitions = num_workers
+    else:
+        torch_partitions = max(1, (os.cpu_count() or 1) // max(1, torch.get_num_threads()))
+    workers = max(1, _env_int("PROCTORING_INFERENCE_WORKERS", torch_partitions * gaze_batcher.max_batch))
+    inference_executor = BoundedInferenceExecutor(
+        workers=workers,
+        max_queue=max(0, _env_int("PROCTORING_MAX_QUEUE", 2 * workers)),
+    )
+    app.state.inference_executor = inference_executor
+    app.state.retry_after_sec = max(1, _env_int("PROCTORING_RETRY_AFTER_SEC", 1))
+    # Nhịp chụp do server điều khiển (next_capture_ms): MIN khi đang đếm dwell vi phạm, BASE bình thường,
+    # giãn dần tới MAX sau PROCTORING_CAPTURE_RAMP_SEC giây yên; nhân thêm tối đa 2x khi executor gần đầy.
+    # MAX = BASE để tắt giãn nhịp.
+    capture_base = max(50, _env_int("PROCTORING_CAPTURE_BASE_MS", 500))
+    app.state.capture_base_ms = capture_base
+    app.state.capture_min_ms = max(50, min(capture_base, _env_int("PROCTORING_CAPTURE_MIN_MS", 250)))
+    app.state.capture_max_ms = max(capture_base, _env_int("PROCTORING_CAPTURE_MAX_MS", 1500))
+    app.state.capture_ramp_sec = max(0.0, _env_float("PROCTORING_CAPTURE_RAMP_SEC", 15.0))
+    # Chưa start (model lỗi ở trên) thì put/delete ghi đồng bộ — vẫn đúng, chỉ không gộp lô.
+    if enrollment_store is not None:
+        enrollment_store.start()
+    try:
+        yield
+    finally:
+        inference_executor.shutdown()
+        detect_batcher.stop()
+        gaze_batcher.stop()
+        if enrollment_store is not None:
+            enrollment_store.stop()
+        if isinstance(app.state.gaze_pipeline, InferenceWorkerPool):
+            app.state.gaze_pipeline.close()
 
 
 app = FastAPI(title="Proctoring Gaze Service", version="1.0.0", lifespan=lifespan)
 
 
+def _session_registry() -> SessionRegistry:
+    return getattr(app.state, "sessions")
+
+
+def _gaze_predict_fn(gaze_pipeline: Pipeline) -> Callable[[np.ndarray], tuple[np.ndarray, np.ndarray]]:
+    batcher: Optional[GazeBatcher] = getattr(app.state, "gaze_batcher", None)
+    return batcher.predict if batcher is not None else gaze_pipeline.predict_gaze
+
+
+def _detect_faces(gaze_pipeline: Pipeline, frame_bgr: np.ndarray) -> list[Any]:
+    """RetinaFace trên bản thu nhỏ (PROCTORING_DETECT_MAX_SIDE); box trả về theo toạ độ frame gốc
+    để crop gaze vẫn lấy từ ảnh nét."""
+    with _stage("detect"):
+        small, scale = resize_for_detection(frame_bgr, int(getattr(app.state, "detect_max_side", 0)))
+        batcher: Optional[DetectBatcher] = getattr(app.state, "detect_batcher", None)
+        if batcher is not None:
+            faces = batcher.detect(small)
+        else:
+            faces = gaze_pipeline.detector(small)
+        return rescale_faces(faces, scale)
+
+
+def _stage(name: str) -> Any:
+    """Context manager đo một stage vào proctoring_stage_seconds (nhãn path lấy từ request đang chạy)."""
+    metrics: Optional[ServiceMetrics] = getattr(app.state, "metrics", None)
+    return metrics.stage(name) if metrics is not None else nullcontext()
+
+
+async def _run_inference(fn: Callable[[], Any], path: str = "other") -> Any:
+    """Chạy *fn* trên executor suy luận; 429 + Retry-After khi hàng đợi đầy. *path*: nhãn endpoint cho /metrics."""
+    executor: Optional[BoundedInferenceExecutor] = getattr(app.state, "inference_executor", None)
+    metrics: Optional[ServiceMetrics] = getattr(app.state, "metrics", None)
+    if executor is None:
+        # Model chưa load: fn sẽ tự trả 503 qua _require_pipeline.
+        return fn()
+    if metrics is not None:
+        submitted = time.perf_counter()
+        inner = fn
+
+        def fn() -> Any:
+            metrics.queue_wait_seconds.observe(time.perf_counter() - submitted, path)
+            with metrics.request(path):
+                return inner()
+
+    try:
+        return await executor.run(fn)
+    except InferenceSaturated:
+        retry_after = int(getattr(app.state, "retry_after_sec", 1))
+        raise HTTPException(
+            status_code=429,
+            detail="Dịch vụ giám sát đang quá tải, thử lại sau.",
+            headers={"Retry-After": str(retry_after)},
+        ) from None
+
+
+def _require_pipeline() -> Pipeline:
+    # Pipeline hoặc InferenceWorkerPool (cùng các thuộc tính server dùng).
+    gaze_pipeline: Optional[Pipeline] = getattr(app.state, "gaze_pipeline", None)
+    if gaze_pipeline is None:
+        err = getattr(app.state, "gaze_load_error", None)
+        raise HTTPException(status_code=503, detail=str(err or "Model not initialized"))
+    return gaze_pipeline
+
+
+def _no_frame_response() -> GazeEstimateResponse:
+    # Behavior: no frame
+    return GazeEstimateResponse(
+        faces=[],
+        faces_count=0,
+        annotated_image_base64=None,
+        violation=True,
+        violation_type="no_frame",
+        message="Không có ảnh từ camera.",
+    )
+
+
+def _frame_student_id(request: Request) -> str:
+    """MSSV cho các endpoint nhận ảnh nhị phân: header X-Student-Id, fallback query ?student_id=."""
+    raw = request.headers.get("x-student-id") or request.query_params.get("student_id") or ""
+    sid = raw.strip()
+    if len(sid) > 64:
+        raise HTTPException(status_code=422, detail="student_id too long")
+    return sid
+
+
+async def _read_frame_body(request: Request) -> bytes:
+    content_type = request.headers.get("content-type", "")
+    if content_type.startswith("multipart/form-data"):
+        form = await request.form()
+        part = form.get("image")
+        if part is None or isinstance(part, str):
+            return b""
+        return await part.read()
+    return await request.body()
+
+
 @app.get("/health")
 def health() -> dict[str, str]:
     ok = getattr(app.state, "gaze_pipeline", None) is not None
     weights = getattr(app.state, "gaze_weights_path", "")
     err = getattr(app.state, "gaze_load_error", None)
+    registry = _session_registry()
+    enrolled_sid = ""
+    default_key = registry.default_key
+    if default_key:
+        with registry.peek(default_key) as st:
+            if st is not None and st.enrolled_samples > 0:
+                enrolled_sid = st.student_id or ""
     return {
         "status": "ok",
         "model_loaded": "true" if ok else "false",
         "weights_path": str(weights),
         "error": "" if not err else str(err),
-        "enrolled_student_id": str(getattr(app.state, "enrolled_student_id", "") or ""),
+        "enrolled_student_id": enrolled_sid,
+        "active_sessions": str(len(registry)),
     }
 
 
-@app.post("/proctoring/enroll", response_model=EnrollResponse)
-def enroll(payload: EnrollRequest) -> EnrollResponse:
-    gaze_pipeline: Optional[Pipeline] = getattr(app.state, "gaze_pipeline", None)
-    if gaze_pipeline is None:
-        err = getattr(app.state, "gaze_load_error", None)
-        raise HTTPException(status_code=503, detail=str(err or "Model not initialized"))
+@app.get("/stats")
+def stats() -> dict[str, Any]:
+    gaze_batcher: Optional[GazeBatcher] = getattr(app.state, "gaze_batcher", None)
+    detect_batcher: Optional[DetectBatcher] = getattr(app.state, "detect_batcher", None)
+    executor: Optional[BoundedInferenceExecutor] = getattr(app.state, "inference_executor", None)
+    cache_stats: Optional[CacheStats] = getattr(app.state, "gaze_cache_stats", None)
+    dup_stats: Optional[CacheStats] = getattr(app.state, "dup_frame_stats", None)
+    enrollment_store: Optional[EnrollmentStore] = getattr(app.state, "enrollment_store", None)
+    return {
+        "active_sessions": len(_session_registry()),
+        "enrolled_identities": len(getattr(app.state, "identity_store", ())),
+        "inference": executor.stats() if executor is not None else None,
+        "gaze_batch": gaze_batcher.stats() if gaze_batcher is not None else None,
+        "detect_batch": detect_batcher.stats() if detect_batcher is not None else None,
+        "gaze_cache": cache_stats.stats() if cache_stats is not None else None,
+        "duplicate_frames": dup_stats.stats() if dup_stats is not None else None,
+        "enrollment_store": enrollment_store.stats() if enrollment_store is not None else None,
+    }
+
+
+@app.get("/metrics")
+def metrics() -> Response:
+    """Prometheus text format: histogram độ trễ theo stage/endpoint, hàng đợi, batch, cache, phiên."""
+    gaze_batcher: Optional[GazeBatcher] = getattr(app.state, "gaze_batcher", None)
+    detect_batcher: Optional[DetectBatcher] = getattr(app.state, "detect_batcher", None)
+    executor: Optional[BoundedInferenceExecutor] = getattr(app.state, "inference_executor", None)
+    service_metrics: Optional[ServiceMetrics] = getattr(app.state, "metrics", None)
+    enrollment_store: Optional[EnrollmentStore] = getattr(app.state, "enrollment_store", None)
+
+    lines: list[str] = []
+    lines += gauge("proctoring_active_sessions", "Proctoring sessions held in memory.", {(): len(_session_registry())})
+    lines += gauge(
+        "proctoring_enrolled_identities",
+        "Students with an enrolled face descriptor.",
+        {(): len(getattr(app.state, "identity_store", ()))},
+    )
+    if executor is not None:
+        ex = executor.stats()
+        lines += gauge("proctoring_inference_in_flight", "Requests running on an inference worker.", {(): ex["in_flight"]})
+        lines += gauge("proctoring_inference_queue_depth", "Requests waiting for an inference worker.", {(): ex["queue_depth"]})
+        lines += gauge("proctoring_inference_capacity", "Inference workers plus queue slots.", {(): executor.capacity})
+
+    batchers = {name: b.stats() for name, b in (("gaze", gaze_batcher), ("detect", detect_batcher)) if b is not None}
+    if batchers:
+        lines += gauge(
+            "proctoring_batch_queue_depth",
+            "Inputs waiting for the next model batch.",
+            {(name,): st["queue_depth"] for name, st in batchers.items()},
+            ("model",),
+        )
+        lines += counts_histogram(
+            "proctoring_batch_size",
+            "Inputs per model call.",
+            {(name,): st["batch_size_counts"] for name, st in batchers.items()},
+            ("model",),
+        )
+
+    caches = {
+        name: st.stats()
+        for name, st in (
+            ("gaze", getattr(app.state, "gaze_cache_stats", None)),
+            ("duplicate_frame", getattr(app.state, "dup_frame_stats", None)),
+        )
+        if st is not None
+    }
+    if caches:
+        lookups: dict[tuple, int] = {}
+        for name, st in caches.items():
+            lookups[(name, "hit")] = st["hits"]
+            for reason, n in st["miss_reasons"].items():
+                lookups[(name, reason)] = n
+        lines += counter(
+            "proctoring_cache_lookups",
+            "Cache lookups by result: hit or the miss reason.",
+            lookups,
+            ("cache", "result"),
+        )
 
+    if enrollment_store is not None:
+        es = enrollment_store.stats()
+        lines += gauge("proctoring_enrollment_store_pending", "Enrollment writes not yet flushed.", {(): es["pending"]})
+        lines += counter("proctoring_enrollment_store_errors", "Failed enrollment write batches.", {(): es["errors"]})
+
+    if service_metrics is not None:
+        lines += service_metrics.collect()
+    return Response("\n".join(lines) + "\n", media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@app.post("/proctoring/enroll", response_model=EnrollResponse)
+async def enroll(payload: EnrollRequest) -> EnrollResponse:
+    _require_pipeline()
     sid = payload.student_id.strip()
-    frame_bgr = _decode_base64_image_to_bgr(payload.image_base64)
-    faces_det = gaze_pipeline.detector(frame_bgr) if getattr(gaze_pipeline, "include_detector", True) else None
+    return await _run_inference(
+        lambda: _enroll_frame(_decode_base64_image_to_bgr(payload.image_base64), sid), path="enroll"
+    )
+
+
+@app.post("/proctoring/enroll/frame", response_model=EnrollResponse)
+async def enroll_frame(request: Request) -> EnrollResponse:
+    """Như /proctoring/enroll nhưng body là ảnh nhị phân (image/jpeg) hoặc multipart (part `image`)."""
+    sid = _frame_student_id(request)
+    if not sid:
+        raise HTTPException(status_code=422, detail="Missing student_id (header X-Student-Id or query)")
+    _require_pipeline()
+    data = await _read_frame_body(request)
+    if not data:
+        raise HTTPException(status_code=400, detail="Missing image body")
+    return await _run_inference(lambda: _enroll_frame(_decode_image_bytes_to_bgr(data), sid), path="enroll")
+
+
+def _enroll_frame(frame_bgr: np.ndarray, sid: str) -> EnrollResponse:
+    gaze_pipeline = _require_pipeline()
+    faces_det = _detect_faces(gaze_pipeline, frame_bgr) if getattr(gaze_pipeline, "include_detector", True) else None
+    return _enroll_with_detections(frame_bgr, sid, faces_det)[0]
+
+
+def _enroll_with_detections(
+    frame_bgr: np.ndarray, sid: str, faces_det: list[Any] | None
+) -> tuple[EnrollResponse, tuple[list[float], float, float] | None]:
+    """
+    Lõi của /proctoring/enroll trên kết quả RetinaFace đã có. Trả thêm (bbox, pitch, yaw thô) của mặt đã enroll
+    (None khi không có / gaze NaN) để /proctoring/tick dùng lại thay vì chạy gaze lần hai trên cùng crop.
+    """
+    gaze_pipeline = _require_pipeline()
+    sess_key = _session_key(sid)
+    registry = _session_registry()
+    _restore_evicted_enrollment(sess_key)
 
     def _seq_snapshot() -> tuple[dict[str, bool], int, bool, list[str], str | None, str]:
-        lock_s: threading.Lock = getattr(app.state, "_lock")
-        with lock_s:
-            seq_map_s = getattr(app.state, "_enroll_seq_by_student", None)
-            if not isinstance(seq_map_s, dict):
-                seq_map_s = {}
-            st_s = seq_map_s.get(sid)
-            if isinstance(st_s, dict):
-                step_i = max(0, min(_ENROLL_STEPS_N, int(st_s.get("step", 0))))
+        with registry.peek(sess_key) as st_s:
+            seq_s = st_s.enroll_seq if st_s is not None else None
+            if isinstance(seq_s, dict):
+                step_i = max(0, min(_ENROLL_STEPS_N, int(seq_s.get("step", 0))))
             else:
                 step_i = 0
         cov_s = _coverage_from_step_index(step_i)
@@ -756,7 +1231,7 @@ def enroll(payload: EnrollRequest) -> EnrollResponse:
             enroll_step_total=len(_ENROLL_POSE_KEYS),
             enroll_target_key=tk,
             enroll_hint_vn=hint_vn,
-        )
+        ), None
 
     # pick best score
     best = max(faces_det, key=lambda x: float(x[2]))
@@ -777,12 +1252,17 @@ def enroll(payload: EnrollRequest) -> EnrollResponse:
             enroll_step_total=len(_ENROLL_POSE_KEYS),
             enroll_target_key=tk,
             enroll_hint_vn=hint_vn,
-        )
+        ), None
 
     pitch_raw: float | None = None
     yaw_raw: float | None = None
     try:
-        p_arr, y_arr = _predict_from_bboxes(gaze_pipeline, frame_bgr, np.array([bbox], dtype=np.float32))
+        p_arr, y_arr = _predict_from_bboxes(
+            _gaze_predict_fn(gaze_pipeline),
+            frame_bgr,
+            np.array([bbox], dtype=np.float32),
+            input_size=int(getattr(gaze_pipeline, "input_size", 448)),
+        )
         if p_arr.size > 0 and np.isfinite(p_arr[0, 0]) and np.isfinite(y_arr[0, 0]):
             pitch_raw = float(p_arr[0, 0])
             yaw_raw = float(y_arr[0, 0])
@@ -794,36 +1274,23 @@ def enroll(payload: EnrollRequest) -> EnrollResponse:
     if pitch_raw is not None and yaw_raw is not None:
         adj_pitch, adj_yaw = _proctoring_pitchyaw_from_raw(app, pitch_raw, yaw_raw)
 
-    hist = _face_hist(gray112)
-    lock: threading.Lock = getattr(app.state, "_lock")
-    with lock:
-        seq_map = getattr(app.state, "_enroll_seq_by_student", None)
-        if not isinstance(seq_map, dict):
-            seq_map = {}
-
-        # Cộng dồn/average histogram từ nhiều ảnh để định danh bền hơn.
-        # Khi student_id đổi, reset bộ tích lũy.
-        prev_student_id = getattr(app.state, "enrolled_student_id", None)
-        prev_samples = int(getattr(app.state, "enrolled_hist_samples", 0) or 0)
-
-        if prev_student_id != sid:
-            prev_samples = 0
-
-        if prev_samples <= 0 or getattr(app.state, "enrolled_hist", None) is None:
-            seq_map[sid] = {"step": 0, "step_good": 0, "gaze_ok_since": None}
-            app.state.enrolled_hist = hist
-            prev_samples = 1
+    with _stage("identity"):
+        descriptor = face_descriptors(gray112)[0]
+    identity_store: IdentityStore = app.state.identity_store
+    with registry.session(sess_key, student_id=sid) as sess:
+        sess.student_id = sid
+        # Cộng dồn mô tả từ nhiều ảnh (mỗi góc pose) vào trung bình trong IdentityStore để định danh bền hơn.
+        prev_samples = int(sess.enrolled_samples or 0)
+
+        if prev_samples <= 0 or sess_key not in identity_store:
+            sess.enroll_seq = {"step": 0, "step_good": 0, "gaze_ok_since": None}
+            prev_samples = identity_store.enroll(sess_key, descriptor, reset=True)
         else:
-            prev_hist = getattr(app.state, "enrolled_hist")
-            # Weighted average: (prev_hist * n + hist) / (n + 1)
-            app.state.enrolled_hist = (prev_hist.astype(np.float32) * prev_samples + hist.astype(np.float32)) / (prev_samples + 1)
-            prev_samples = prev_samples + 1
-            if sid not in seq_map or not isinstance(seq_map.get(sid), dict):
-                seq_map[sid] = {"step": 0, "step_good": 0, "gaze_ok_since": None}
-
-        st = seq_map.get(sid)
-        if not isinstance(st, dict):
-            st = {"step": 0, "step_good": 0, "gaze_ok_since": None}
+            prev_samples = identity_store.enroll(sess_key, descriptor)
+            if not isinstance(sess.enroll_seq, dict):
+                sess.enroll_seq = {"step": 0, "step_good": 0, "gaze_ok_since": None}
+
+        st = sess.enroll_seq
         step_idx = max(0, min(_ENROLL_STEPS_N, int(st.get("step", 0))))
         step_good = max(0, int(st.get("step_good", 0)))
         gaze_ok_since_raw = st.get("gaze_ok_since")
@@ -868,21 +1335,21 @@ def enroll(payload: EnrollRequest) -> EnrollResponse:
                 step_good = 0
                 gaze_ok_since = None
 
-        seq_map[sid] = {
+        sess.enroll_seq = {
             "step": step_idx,
             "step_good": step_good,
             "gaze_ok_since": gaze_ok_since,
         }
-        app.state._enroll_seq_by_student = seq_map
-        app.state.enrolled_student_id = sid
-        app.state.enrolled_hist_samples = prev_samples
-        app.state._last_enrolled_bbox_idx = None
+        sess.enrolled_samples = prev_samples
+        sess.last_enrolled_bbox_idx = None
+    registry.set_default_key(sess_key)
+    _persist_enrollment(sess_key, sid, {"step": step_idx, "step_good": step_good, "gaze_ok_since": gaze_ok_since})
 
-        cov_final = _coverage_from_step_index(step_idx)
-        pose_complete = step_idx >= _ENROLL_STEPS_N
-        pose_missing = _enroll_remaining_labels_vn(step_idx)
-        target_key = None if step_idx >= _ENROLL_STEPS_N else _ENROLL_POSE_KEYS[step_idx]
-        hint_vn = _ENROLL_HINTS_VN[target_key] if target_key else "Đã đủ các góc. Hoàn tất định danh."
+    cov_final = _coverage_from_step_index(step_idx)
+    pose_complete = step_idx >= _ENROLL_STEPS_N
+    pose_missing = _enroll_remaining_labels_vn(step_idx)
+    target_key = None if step_idx >= _ENROLL_STEPS_N else _ENROLL_POSE_KEYS[step_idx]
+    hint_vn = _ENROLL_HINTS_VN[target_key] if target_key else "Đã đủ các góc. Hoàn tất định danh."
 
     return EnrollResponse(
         enrolled=True,
@@ -897,7 +1364,7 @@ def enroll(payload: EnrollRequest) -> EnrollResponse:
         enroll_step_total=len(_ENROLL_POSE_KEYS),
         enroll_target_key=target_key,
         enroll_hint_vn=hint_vn,
-    )
+    ), ((bbox, pitch_raw, yaw_raw) if pitch_raw is not None and yaw_raw is not None else None)
 
 
 @app.post("/proctoring/reset")
@@ -906,94 +1373,413 @@ def reset_proctoring(payload: ResetRequest | None = None) -> dict[str, Any]:
     if payload and isinstance(payload.student_id, str):
         req_sid = payload.student_id.strip()
 
-    lock: threading.Lock = getattr(app.state, "_lock")
-    with lock:
-        # Reset enrolled identity state for this student (or all when no sid provided).
-        cur_sid = getattr(app.state, "enrolled_student_id", None)
-        if not req_sid or (isinstance(cur_sid, str) and cur_sid.strip() == req_sid):
-            app.state.enrolled_student_id = None
-            app.state.enrolled_hist = None
-            app.state.enrolled_hist_samples = 0
-            app.state._last_enrolled_bbox_idx = None
-
-        seq_map_reset = getattr(app.state, "_enroll_seq_by_student", None)
-        if isinstance(seq_map_reset, dict):
-            if req_sid:
-                seq_map_reset.pop(req_sid, None)
-            else:
-                seq_map_reset.clear()
-            app.state._enroll_seq_by_student = seq_map_reset
-
-        # Clear per-student dwell/emit states so logout starts a fresh lượt.
-        for key_name in (
-            "_looking_away_since",
-            "_looking_away_false_since",
-            "_looking_away_violation_emitted",
-            "_no_face_since",
-            "_no_face_emitted",
-            "_multi_face_since",
-            "_multi_face_emitted",
-        ):
-            raw = getattr(app.state, key_name, None)
-            if isinstance(raw, dict):
-                d = dict(raw)
-                if req_sid:
-                    d.pop(req_sid, None)
-                else:
-                    d.clear()
-                setattr(app.state, key_name, d)
+    registry = _session_registry()
+    store: Optional[EnrollmentStore] = getattr(app.state, "enrollment_store", None)
+    # Reset enrolled identity + dwell/emit states cho thí sinh này (hoặc tất cả khi không gửi sid)
+    # để logout bắt đầu một lượt mới.
+    if req_sid:
+        key = _session_key(req_sid)
+        registry.remove(key)
+        if store is not None:
+            store.delete(key)
+    else:
+        registry.clear()
+        if store is not None:
+            store.clear()
 
     return {"status": "ok", "student_id": req_sid or None}
 
 
 @app.post("/gaze/estimate", response_model=GazeEstimateResponse)
-def gaze_estimate(payload: GazeEstimateRequest) -> GazeEstimateResponse:
+async def gaze_estimate(payload: GazeEstimateRequest) -> GazeEstimateResponse:
+    request_student_id = (payload.student_id or "").strip() if isinstance(payload.student_id, str) else ""
+    image_b64 = payload.image_base64.strip() if isinstance(payload.image_base64, str) else ""
+    if not image_b64:
+        return _no_frame_response()
+
+    _require_pipeline()
+
+    def _run() -> GazeEstimateResponse:
+        raw = _b64decode_payload(image_b64)
+        return _gaze_estimate_bytes(raw, request_student_id, annotate=payload.annotate, source_b64=image_b64)
+
+    return await _run_inference(_run, path="gaze_estimate")
+
+
+@app.post("/proctoring/tick", response_model=TickResponse)
+async def proctoring_tick(payload: TickRequest) -> TickResponse:
+    """
+    /proctoring/enroll + /gaze/estimate cho cùng một frame trong một request: decode một lần,
+    RetinaFace một lần, gaze của mặt đã enroll dùng lại cho estimate.
+    """
     request_student_id = (payload.student_id or "").strip() if isinstance(payload.student_id, str) else ""
     image_b64 = payload.image_base64.strip() if isinstance(payload.image_base64, str) else ""
     if not image_b64:
-        # Behavior: no frame
-        return GazeEstimateResponse(
-            faces=[],
-            faces_count=0,
-            annotated_image_base64=None,
-            violation=True,
-            violation_type="no_frame",
-            message="Không có ảnh từ camera.",
+        return TickResponse(**_no_frame_response().model_dump())
+
+    gaze_pipeline = _require_pipeline()
+    sync_enroll = payload.enroll and request_student_id != ""
+
+    def _run() -> TickResponse:
+        raw = _b64decode_payload(image_b64)
+        if not sync_enroll:
+            est_only = _gaze_estimate_bytes(raw, request_student_id, annotate=payload.annotate, source_b64=image_b64)
+            return TickResponse(**est_only.model_dump())
+        frame_bgr = _decode_image_bytes_to_bgr(raw)
+        enroll_resp: EnrollResponse | None = None
+        detections: list[Any] | None = None
+        gaze_hint: tuple[list[float], float, float] | None = None
+        if getattr(gaze_pipeline, "include_detector", True):
+            detections = _detect_faces(gaze_pipeline, frame_bgr)
+            enroll_resp, gaze_hint = _enroll_with_detections(frame_bgr, request_student_id, detections)
+        est = _gaze_estimate_frame(
+            frame_bgr,
+            request_student_id,
+            annotate=payload.annotate,
+            source=raw,
+            source_b64=image_b64,
+            detections=detections,
+            gaze_hint=gaze_hint,
         )
+        return TickResponse(**est.model_dump(), enroll=enroll_resp)
+
+    return await _run_inference(_run, path="tick")
+
+
+@app.post("/gaze/estimate/frame", response_model=GazeEstimateResponse)
+async def gaze_estimate_frame(request: Request) -> GazeEstimateResponse:
+    """Như /gaze/estimate nhưng body là ảnh nhị phân (image/jpeg) hoặc multipart (part `image`);
+    MSSV qua header X-Student-Id hoặc query student_id; ?annotate=never|on_violation|always."""
+    request_student_id = _frame_student_id(request)
+    annotate = request.query_params.get("annotate", "on_violation")
+    if annotate not in _ANNOTATE_MODES:
+        raise HTTPException(status_code=422, detail=f"annotate must be one of {', '.join(_ANNOTATE_MODES)}")
+    data = await _read_frame_body(request)
+    if not data:
+        return _no_frame_response()
+    _require_pipeline()
+    return await _run_inference(
+        lambda: _gaze_estimate_bytes(data, request_student_id, annotate=annotate), path="gaze_estimate"
+    )
 
-    frame_bgr = _decode_base64_image_to_bgr(image_b64)
 
-    gaze_pipeline: Optional[Pipeline] = getattr(app.state, "gaze_pipeline", None)
-    if gaze_pipeline is None:
-        err = getattr(app.state, "gaze_load_error", None)
-        raise HTTPException(status_code=503, detail=str(err or "Model not initialized"))
+@app.websocket("/ws/proctoring/{student_id}")
+async def proctoring_ws(websocket: WebSocket, student_id: str) -> None:
+    """
+    Kênh giám sát liên tục: client gửi frame JPEG dạng binary, server trả verdict JSON gọn.
+    Chỉ giữ frame mới nhất — frame đến trong lúc đang xử lý sẽ thay frame chờ cũ (đếm vào `dropped`)
+    thay vì xếp hàng, nên client chậm/server bận không làm trễ dồn.
+    """
+    sid = student_id.strip()
+    if not sid or len(sid) > 64:
+        await websocket.close(code=1008)
+        return
+    await websocket.accept()
+
+    pending: list[bytes | None] = [None]
+    frame_ready = asyncio.Event()
+    disconnected = False
+    dropped = 0
+
+    async def _receive_frames() -> None:
+        nonlocal disconnected, dropped
+        try:
+            while True:
+                msg = await websocket.receive()
+                if msg.get("type") == "websocket.disconnect":
+                    break
+                data = msg.get("bytes")
+                if not data:
+                    continue
+                if pending[0] is not None:
+                    dropped += 1
+                pending[0] = data
+                frame_ready.set()
+        finally:
+            disconnected = True
+            frame_ready.set()
+
+    receiver = asyncio.create_task(_receive_frames())
+    try:
+        while True:
+            await frame_ready.wait()
+            frame_ready.clear()
+            data, pending[0] = pending[0], None
+            if data is None:
+                if disconnected:
+                    break
+                continue
+            try:
+                _require_pipeline()
+                resp = await _run_inference(
+                    lambda: _gaze_estimate_bytes(data, sid, annotate="on_violation"), path="ws"
+                )
+            except HTTPException as e:
+                # 429: bỏ frame này (backpressure) — client cứ gửi frame tiếp, không cần retry.
+                await websocket.send_json({"error": str(e.detail), "status_code": e.status_code})
+                continue
+            await websocket.send_json(_ws_verdict(resp, dropped))
+    except WebSocketDisconnect:
+        pass
+    finally:
+        receiver.cancel()
+
+
+def _ws_verdict(resp: GazeEstimateResponse, dropped: int) -> dict[str, Any]:
+    faces = [
+        {k: f[k] for k in ("id", "bbox", "theta", "phi", "dx_px", "dy_px", "direction", "looking_away") if k in f}
+        for f in resp.faces
+    ]
+    out: dict[str, Any] = {
+        "faces": faces,
+        "faces_count": resp.faces_count,
+        "violation": resp.violation,
+        "violation_type": resp.violation_type,
+        "message": resp.message,
+        "enrolled_student_id": resp.enrolled_student_id,
+        "dropped": dropped,
+    }
+    # Ảnh chỉ cần khi ghi vi phạm (snapshot).
+    if resp.violation and resp.annotated_image_base64:
+        out["annotated_image_base64"] = resp.annotated_image_base64
+    return out
 
-    lock: threading.Lock = getattr(app.state, "_lock")
-    with lock:
-        app.state._frame_counter = int(getattr(app.state, "_frame_counter", 0)) + 1
-        frame_idx = int(app.state._frame_counter)
-        last_bboxes = getattr(app.state, "_last_bboxes", None)
+
+def _next_capture_ms(sess: SessionState, now: float, calm: bool) -> int:
+    """
+    Khoảng chờ tới frame kế tiếp cho thí sinh này. Gọi khi đang giữ lock của session, sau khi cập nhật dwell timer.
+    Dwell đang chạy (chưa báo) -> MIN để mốc đủ thời gian được thấy sớm; frame yên liên tục -> giãn tuyến tính tới MAX.
+    """
+    base = int(getattr(app.state, "capture_base_ms", 500))
+    lo = int(getattr(app.state, "capture_min_ms", base))
+    hi = int(getattr(app.state, "capture_max_ms", base))
+    ramp_sec = float(getattr(app.state, "capture_ramp_sec", 0.0))
+    dwell_running = (
+        (sess.looking_away_since is not None and not sess.looking_away_violation_emitted)
+        or (sess.no_face_since is not None and not sess.no_face_emitted)
+        or (sess.multi_face_since is not None and not sess.multi_face_emitted)
+    )
+    if dwell_running or not calm:
+        sess.calm_since = None
+        interval = float(lo if dwell_running else base)
+    else:
+        if sess.calm_since is None:
+            sess.calm_since = now
+        ramp = min(1.0, (now - sess.calm_since) / ramp_sec) if ramp_sec > 0 else 1.0
+        interval = base + (hi - base) * ramp
+    executor: Optional[BoundedInferenceExecutor] = getattr(app.state, "inference_executor", None)
+    if executor is not None:
+        # Quá nửa sức chứa: giãn mọi thí sinh (tới 2x khi đầy) thay vì để request sau bị 429.
+        interval *= 1.0 + max(0.0, executor.load() - 0.5) * 2.0
+    return int(round(min(float(2 * hi), max(float(lo), interval))))
+
+
+def _cached_gaze(
+    gaze_pipeline: Pipeline,
+    registry: SessionRegistry,
+    sess_key: str,
+    track_id: int,
+    frame_bgr: np.ndarray,
+    bb: list[float],
+) -> tuple[float, float] | None:
+    """
+    (pitch, yaw) thô cho một bbox. Dùng lại kết quả của track khi chữ ký crop gần như không đổi
+    (PROCTORING_GAZE_CACHE_MAX_DIFF) và chưa quá PROCTORING_GAZE_CACHE_MAX_AGE_SEC; None nếu gaze NaN.
+    """
+    max_age: float = float(getattr(app.state, "gaze_cache_max_age_sec", 0.0))
+    max_diff: float = float(getattr(app.state, "gaze_cache_max_diff", 0.0))
+    cache_stats: Optional[CacheStats] = getattr(app.state, "gaze_cache_stats", None)
+    sig = crop_signature(frame_bgr, bb) if max_age > 0 else None
+    if sig is not None:
+        with registry.session(sess_key) as sess:
+            cached = sess.gaze_cache.get(track_id)
+        now = time.monotonic()
+        if cached is None:
+            reason = "cold"
+        elif now - cached[3] > max_age:
+            reason = "expired"
+        elif signature_distance(sig, cached[0]) > max_diff:
+            reason = "changed"
+        else:
+            reason = None
+        if cache_stats is not None:
+            if reason is None:
+                cache_stats.hit()
+            else:
+                cache_stats.miss(reason)
+        if reason is None:
+            return cached[1], cached[2]
+
+    pitch_arr, yaw_arr = _predict_from_bboxes(
+        _gaze_predict_fn(gaze_pipeline),
+        frame_bgr,
+        np.array([bb], dtype=np.float32),
+        input_size=int(getattr(gaze_pipeline, "input_size", 448)),
+    )
+    if not (np.isfinite(pitch_arr[0]).all() and np.isfinite(yaw_arr[0]).all()):
+        return None
+    pitch_raw = float(pitch_arr[0])
+    yaw_raw = float(yaw_arr[0])
+    if sig is not None:
+        with registry.session(sess_key) as sess:
+            live = set(sess.last_ids or [])
+            for tid in [t for t in sess.gaze_cache if t not in live and t != track_id]:
+                del sess.gaze_cache[tid]
+            sess.gaze_cache[track_id] = (sig, pitch_raw, yaw_raw, time.monotonic())
+    return pitch_raw, yaw_raw
+
+
+def _estimate_session_key(request_student_id: str) -> str:
+    # Request không gửi MSSV: dùng phiên enroll gần nhất (máy chủ đơn, hành vi cũ).
+    return _mssv_key(request_student_id) or _session_registry().default_key or "anon"
+
+
+def _count_frame(source: str) -> None:
+    metrics: Optional[ServiceMetrics] = getattr(app.state, "metrics", None)
+    if metrics is not None:
+        metrics.frame(source)
+
+
+def _reuse_duplicate_frame(sess_key: str, thumb: np.ndarray) -> FrameObservation | None:
+    """Quan sát của frame đầy đủ gần nhất nếu *thumb* gần như y hệt nó và còn trong cửa sổ dùng lại; else None."""
+    max_reuse = int(getattr(app.state, "dup_max_reuse", 0))
+    if max_reuse <= 0:
+        return None
+    max_age = float(getattr(app.state, "dup_max_age_sec", 0.0))
+    max_diff = float(getattr(app.state, "dup_max_diff", 0.0))
+    stats: Optional[CacheStats] = getattr(app.state, "dup_frame_stats", None)
+    with _session_registry().session(sess_key) as sess:
+        obs = sess.dup_observation
+        if obs is None or sess.dup_thumb is None:
+            reason = "cold"
+        elif sess.dup_identity_version != int(sess.enrolled_samples):
+            reason = "identity"
+        elif sess.dup_reuse >= max_reuse:
+            reason = "max_reuse"
+        elif time.monotonic() - sess.dup_at > max_age:
+            reason = "expired"
+        elif signature_distance(thumb, sess.dup_thumb) > max_diff:
+            reason = "changed"
+        else:
+            reason = None
+            sess.dup_reuse += 1
+    if stats is not None:
+        if reason is None:
+            stats.hit()
+        else:
+            stats.miss(reason)
+    return obs if reason is None else None
+
+
+def _gaze_estimate_bytes(
+    data: bytes,
+    request_student_id: str,
+    annotate: str = "on_violation",
+    source_b64: str | None = None,
+) -> GazeEstimateResponse:
+    """/gaze/estimate trên bytes ảnh: frame gần trùng frame trước thì bỏ qua decode đầy đủ / detect / gaze."""
+    thumb: np.ndarray | None = None
+    if int(getattr(app.state, "dup_max_reuse", 0)) > 0:
+        with _stage("thumbnail"):
+            thumb = frame_thumbnail(data)
+    if thumb is not None:
+        sess_key = _estimate_session_key(request_student_id)
+        obs = _reuse_duplicate_frame(sess_key, thumb)
+        if obs is not None:
+            _count_frame("duplicate")
+            return _estimate_verdict(obs, _session_registry(), sess_key, None, annotate, data, source_b64)
+    return _gaze_estimate_frame(
+        _decode_image_bytes_to_bgr(data),
+        request_student_id,
+        annotate=annotate,
+        source=data,
+        source_b64=source_b64,
+        thumb=thumb,
+    )
+
+
+def _gaze_estimate_frame(
+    frame_bgr: np.ndarray,
+    request_student_id: str,
+    annotate: str = "on_violation",
+    source: bytes | None = None,
+    source_b64: str | None = None,
+    detections: list[Any] | None = None,
+    gaze_hint: tuple[list[float], float, float] | None = None,
+    thumb: np.ndarray | None = None,
+) -> GazeEstimateResponse:
+    """
+    Lõi của /gaze/estimate (mọi biến thể). *source*/*source_b64*: ảnh gốc đã mã hoá —
+    trả lại nguyên vẹn khi không có gì để vẽ, thay vì encode lại frame.
+    *detections*: kết quả RetinaFace đã chạy trên chính frame này (dùng thay cho detect);
+    *gaze_hint*: (bbox, pitch, yaw thô) đã tính cho một bbox trong *detections* — dùng lại nếu mặt đó được chọn.
+    *thumb*: ảnh thu nhỏ của frame (frame_thumbnail) — lưu kèm quan sát để frame gần trùng sau đó dùng lại.
+    """
+    gaze_pipeline = _require_pipeline()
+
+    registry = _session_registry()
+    sess_key = _estimate_session_key(request_student_id)
+    _restore_evicted_enrollment(sess_key)
+    with registry.session(sess_key, student_id=request_student_id or None) as sess:
+        sess.frame_counter += 1
+        frame_idx = int(sess.frame_counter)
+        last_bboxes = sess.last_bboxes
+        last_detect_frame = int(sess.last_detect_frame)
+        force_detect = bool(sess.force_detect)
+        prev_gray = sess.track_gray
+        prev_scale = sess.track_gray_scale
 
     detect_every_n: int = int(getattr(app.state, "detect_every_n", 10))
-    arrow_multiplier: float = float(getattr(app.state, "arrow_multiplier", 4.0))
     looking_away_rad: float = float(getattr(app.state, "looking_away_rad", 0.45))
-    looking_away_min_sec: float = float(getattr(app.state, "looking_away_min_sec", 8.0))
-    looking_away_false_grace_sec: float = float(
-        getattr(app.state, "looking_away_false_grace_sec", 2.0)
-    )
     direction_threshold_deg: float = float(getattr(app.state, "direction_threshold_deg", 6.0))
     direction_threshold_frac: float = float(getattr(app.state, "direction_threshold_frac", 0.15))
     max_faces: int = int(getattr(app.state, "max_faces", 1))
     track_iou_threshold: float = float(getattr(app.state, "track_iou_threshold", 0.30))
     track_max_misses: int = int(getattr(app.state, "track_max_misses", 15))
-    do_detect = (frame_idx % detect_every_n == 1) or last_bboxes is None
-
+    use_tracker = str(getattr(app.state, "tracker", "lk")) == "lk"
+    adaptive = str(getattr(app.state, "detect_mode", "adaptive")) == "adaptive"
+    if adaptive:
+        # Lịch theo từng thí sinh: detect khi cảnh đổi (motion / mất dấu / mất khớp định danh),
+        # tối đa PROCTORING_DETECT_MAX_STALE_N frame không detect.
+        detect_max_stale_n: int = int(getattr(app.state, "detect_max_stale_n", 30))
+        do_detect = last_bboxes is None or force_detect or (frame_idx - last_detect_frame) >= detect_max_stale_n
+    else:
+        do_detect = (frame_idx % detect_every_n == 1) or last_bboxes is None
+    if detections is not None:
+        do_detect = True
+
+    track_gray: np.ndarray | None = None
+    track_scale = 1.0
+    with _stage("track"):
+        if use_tracker or adaptive:
+            track_gray, track_scale = tracking_gray(frame_bgr)
+        have_prev = prev_gray is not None and track_gray is not None and prev_scale == track_scale
+        known_boxes = last_bboxes if isinstance(last_bboxes, np.ndarray) else np.empty((0, 4), dtype=np.float32)
+
+        if adaptive and not do_detect and have_prev:
+            motion_threshold: float = float(getattr(app.state, "detect_motion_threshold", 6.0))
+            if motion_energy(prev_gray, track_gray, known_boxes, track_scale) > motion_threshold:
+                do_detect = True
+        if use_tracker and not do_detect and have_prev and known_boxes.size > 0:
+            # Giữa hai lần RetinaFace: dời bbox theo optical flow; mất dấu mặt nào thì detect ngay frame này.
+            tracker_min_conf: float = float(getattr(app.state, "tracker_min_conf", 0.3))
+            moved, conf = propagate_boxes(prev_gray, track_gray, known_boxes, track_scale)
+            if bool((conf < tracker_min_conf).any()):
+                do_detect = True
+            else:
+                with registry.session(sess_key) as sess:
+                    sess.last_bboxes = moved
+                    _move_tracks(sess.tracks, sess.last_ids, moved)
+    if track_gray is not None:
+        with registry.session(sess_key) as sess:
+            sess.track_gray = track_gray
+            sess.track_gray_scale = track_scale
+
+    _count_frame("detect" if do_detect else "tracked")
     faces: list[dict[str, Any]] = []
     if do_detect:
         # Detection only (RetinaFace). We'll run gaze only for the enrolled face.
-        faces_det = gaze_pipeline.detector(frame_bgr)
-        if faces_det is None:
-            faces_det = []
+        faces_det = detections if detections is not None else _detect_faces(gaze_pipeline, frame_bgr)
 
         # apply confidence threshold and collect boxes
         det_boxes: list[list[float]] = []
@@ -1007,33 +1793,34 @@ def gaze_estimate(payload: GazeEstimateRequest) -> GazeEstimateResponse:
         bboxes_arr = np.array(det_boxes, dtype=np.float32) if len(det_boxes) > 0 else np.empty((0, 4), dtype=np.float32)
         new_bboxes: list[list[float]] = det_boxes
 
-        with lock:
-            tracks = _tracks_from_state(app)
-            next_id = int(getattr(app.state, "_next_face_id", 1))
+        with registry.session(sess_key) as sess:
             tracks, new_ids, next_id = _update_tracks_with_detections(
-                tracks=tracks,
+                tracks=sess.tracks,
                 new_bboxes=new_bboxes,
-                next_id=next_id,
+                next_id=int(sess.next_face_id),
                 iou_threshold=track_iou_threshold,
                 max_misses=track_max_misses,
             )
-            app.state._next_face_id = next_id
-            _save_tracks_to_state(app, tracks)
-            app.state._last_bboxes = bboxes_arr
-            app.state._last_ids = new_ids
-            app.state._last_enrolled_bbox_idx = None
+            sess.next_face_id = next_id
+            sess.tracks = tracks
+            sess.last_bboxes = bboxes_arr
+            sess.last_ids = new_ids
+            sess.last_enrolled_bbox_idx = None
+            sess.last_detect_frame = frame_idx
+            sess.force_detect = False
 
         # Build face list (bbox + track id). No gaze yet.
         for i, bb in enumerate(new_bboxes):
             f: dict[str, Any] = {"bbox": bb}
-            if i < len(getattr(app.state, "_last_ids", []) or []):
-                f["id"] = int(app.state._last_ids[i])
+            if i < len(new_ids):
+                f["id"] = int(new_ids[i])
             if i < len(det_scores):
                 f["score"] = float(det_scores[i])
             faces.append(f)
     else:
-        bboxes = last_bboxes
-        ids = getattr(app.state, "_last_ids", None)
+        with registry.session(sess_key) as sess:
+            bboxes = sess.last_bboxes
+            ids = sess.last_ids
         if isinstance(bboxes, np.ndarray) and bboxes.size > 0:
             # Reuse bboxes; no gaze for non-enrolled faces
             for i in range(int(bboxes.shape[0])):
@@ -1044,44 +1831,75 @@ def gaze_estimate(payload: GazeEstimateRequest) -> GazeEstimateResponse:
                 faces.append(f)
 
     # ---- Enrolled face selection + gaze only for that face ----
-    enrolled_student_id = getattr(app.state, "enrolled_student_id", None)
-    enrolled_hist = getattr(app.state, "enrolled_hist", None)
-    enroll_match_threshold: float = float(getattr(app.state, "enroll_match_threshold", 0.42))
-    enroll_match_threshold_soft: float = float(getattr(app.state, "enroll_match_threshold_soft", 0.32))
+    identity_store: IdentityStore = app.state.identity_store
+    with registry.session(sess_key) as sess:
+        identity_version = int(sess.enrolled_samples)
+        enrolled_student_id = sess.student_id if identity_version > 0 else None
+    identity_match_threshold: float = float(getattr(app.state, "identity_match_threshold", 0.85))
+    identity_match_threshold_soft: float = float(getattr(app.state, "identity_match_threshold_soft", 0.78))
 
     _enr_stored = (enrolled_student_id.strip() if isinstance(enrolled_student_id, str) else "")
     _req_sid = request_student_id.strip() if request_student_id else ""
-    _hist_owner_ok = _hist_owner_matches_request(_enr_stored, request_student_id or "")
+    _identity_owner_ok = _identity_owner_matches_request(_enr_stored, request_student_id or "")
 
     selected_idx: int | None = None
-    enrolled_face_matched: bool = False  # True chỉ khi có mặt khớp histogram định danh (>= ngưỡng)
-    if _enr_stored != "" and isinstance(enrolled_hist, np.ndarray) and _hist_owner_ok:
-        best_sim = -1.0
-        best_i = -1
+    enrolled_face_matched: bool = False  # True chỉ khi có mặt khớp mô tả định danh (>= ngưỡng)
+    if _enr_stored != "" and identity_version > 0 and _identity_owner_ok:
+        # Độ khớp định danh cache theo track id: chỉ tính lại ở frame detect, khi box đã trôi
+        # (IoU với box lúc tính < PROCTORING_IDENTITY_CACHE_IOU) hoặc mô tả enroll đổi.
+        identity_cache_iou: float = float(getattr(app.state, "identity_cache_iou", 0.85))
+        with registry.session(sess_key) as sess:
+            identity_cache = dict(sess.identity_cache)
+        sims: list[float | None] = [None] * len(faces)
+        todo: list[int] = []
         for i, f in enumerate(faces):
             bb = f.get("bbox")
             if not (isinstance(bb, list) and len(bb) >= 4):
                 continue
-            gray112 = _crop_face_gray_112(frame_bgr, bb)
-            if gray112 is None:
-                continue
-            sim = _hist_similarity(_face_hist(gray112), enrolled_hist)
-            if sim > best_sim:
+            tid = f.get("id")
+            hit = identity_cache.get(tid) if isinstance(tid, int) and not do_detect else None
+            if hit is not None and hit[2] == identity_version and _iou(bb, hit[0]) >= identity_cache_iou:
+                sims[i] = hit[1]
+            else:
+                todo.append(i)
+        if todo:
+            descs, kept = _face_descriptors(frame_bgr, [faces[i]["bbox"] for i in todo])
+            values = identity_store.similarities(sess_key, descs) if len(kept) > 0 else None
+            if values is None:
+                kept = []
+            for j, k in enumerate(kept):
+                i = todo[k]
+                sims[i] = float(values[j])
+                tid = faces[i].get("id")
+                if isinstance(tid, int):
+                    identity_cache[tid] = (list(faces[i]["bbox"]), sims[i], identity_version)
+            live_ids = {f.get("id") for f in faces}
+            with registry.session(sess_key) as sess:
+                sess.identity_cache = {t: v for t, v in identity_cache.items() if t in live_ids}
+
+        best_sim = -1.0
+        best_i = -1
+        for i, sim in enumerate(sims):
+            if sim is not None and sim > best_sim:
                 best_sim = sim
                 best_i = i
 
         if best_i != -1:
             selected_idx = best_i
             single_face_ok = len(faces) == 1 and max_faces <= 1
-            if best_sim >= enroll_match_threshold:
+            if best_sim >= identity_match_threshold:
                 enrolled_face_matched = True
-            elif single_face_ok and best_sim >= enroll_match_threshold_soft:
+            elif single_face_ok and best_sim >= identity_match_threshold_soft:
                 enrolled_face_matched = True
             if enrolled_face_matched:
-                with lock:
-                    app.state._last_enrolled_bbox_idx = int(best_i)
+                with registry.session(sess_key) as sess:
+                    sess.last_enrolled_bbox_idx = int(best_i)
         else:
             selected_idx = None
+        if not do_detect and not enrolled_face_matched and len(faces) > 0:
+            # Bbox cũ/đã dời không còn khớp định danh: có thể đổi người hoặc box trôi -> detect ở frame sau.
+            with registry.session(sess_key) as sess:
+                sess.force_detect = True
     else:
         # Not enrolled: fall back to first face for gaze
         selected_idx = 0 if len(faces) > 0 else None
@@ -1090,30 +1908,25 @@ def gaze_estimate(payload: GazeEstimateRequest) -> GazeEstimateResponse:
     if selected_idx is not None and 0 <= selected_idx < len(faces):
         bb = faces[selected_idx].get("bbox")
         if isinstance(bb, list) and len(bb) >= 4:
-            # Run gaze for this bbox only
-            pitch_arr, yaw_arr = _predict_from_bboxes(gaze_pipeline, frame_bgr, np.array([bb], dtype=np.float32))
-            if np.isfinite(pitch_arr[0]).all() and np.isfinite(yaw_arr[0]).all():
-                pitch_raw = float(pitch_arr[0])
-                yaw_raw = float(yaw_arr[0])
+            tid_raw = faces[selected_idx].get("id")
+            track_id = int(tid_raw) if isinstance(tid_raw, int) else 0
+            # Run gaze for this bbox only (hoặc dùng lại kết quả khi crop gần như không đổi / đã tính lúc enroll)
+            if gaze_hint is not None and bb == gaze_hint[0]:
+                raw = (gaze_hint[1], gaze_hint[2])
+            else:
+                raw = _cached_gaze(gaze_pipeline, registry, sess_key, track_id, frame_bgr, bb)
+            if raw is not None:
+                pitch_raw, yaw_raw = raw
                 # Góc predict_gaze + EMA; ENROLL_POSE_FLIP_YAW=1 nếu trái/phải vẫn ngược so với camera.
-                tid_raw = faces[selected_idx].get("id")
-                track_id = int(tid_raw) if isinstance(tid_raw, int) else 0
-                sk_sm = (_req_sid or _enr_stored or "anon").strip() or "anon"
-                smooth_key = f"{sk_sm}:{track_id}"
                 alpha = float(getattr(app.state, "proctoring_gaze_smooth_alpha", 0.0))
-                lock_sm = getattr(app.state, "_lock")
-                with lock_sm:
-                    smap = getattr(app.state, "_gaze_smooth_state", None)
-                    if not isinstance(smap, dict):
-                        smap = {}
-                    prev = smap.get(smooth_key)
+                with registry.session(sess_key) as sess:
+                    prev = sess.gaze_smooth.get(track_id)
                     if alpha <= 0.0 or prev is None:
                         p_s, y_s = pitch_raw, yaw_raw
                     else:
                         p_s = alpha * pitch_raw + (1.0 - alpha) * float(prev[0])
                         y_s = alpha * yaw_raw + (1.0 - alpha) * float(prev[1])
-                    smap[smooth_key] = (p_s, y_s)
-                    app.state._gaze_smooth_state = smap
+                    sess.gaze_smooth[track_id] = (p_s, y_s)
                 pitch, yaw = _proctoring_pitchyaw_from_raw(app, p_s, y_s)
                 dx, dy = _pitchyaw_to_dxdy(pitch, yaw)
                 bbox_width = float(bb[2] - bb[0])
@@ -1140,111 +1953,137 @@ def gaze_estimate(payload: GazeEstimateRequest) -> GazeEstimateResponse:
                     }
                 )
 
-    # Chỉ gán MSSV lên mặt đã chọn khi đã khớp định danh (histogram); khi gaze NaN vẫn gán để popup/ảnh có MSSV đúng.
+    # Chỉ gán MSSV lên mặt đã chọn khi đã khớp định danh (mô tả LBP); khi gaze NaN vẫn gán để popup/ảnh có MSSV đúng.
     mssv_for_face = (_req_sid or _enr_stored).strip()
     if enrolled_face_matched and selected_idx is not None and 0 <= selected_idx < len(faces) and mssv_for_face:
         faces[selected_idx]["id"] = mssv_for_face
 
+    obs = FrameObservation(
+        faces=faces,
+        selected_idx=selected_idx,
+        enrolled_face_matched=enrolled_face_matched,
+        geo_looking_away=geo_looking_away,
+        mssv_for_face=mssv_for_face,
+    )
+    if thumb is not None:
+        # Frame kế tiếp gần như y hệt frame này thì dùng lại quan sát (xem _reuse_duplicate_frame).
+        with registry.session(sess_key) as sess:
+            sess.dup_thumb = thumb
+            sess.dup_observation = obs
+            sess.dup_at = time.monotonic()
+            sess.dup_reuse = 0
+            sess.dup_identity_version = int(sess.enrolled_samples)
+    return _estimate_verdict(obs, registry, sess_key, frame_bgr, annotate, source, source_b64)
+
+
+def _estimate_verdict(
+    obs: FrameObservation,
+    registry: SessionRegistry,
+    sess_key: str,
+    frame_bgr: np.ndarray | None,
+    annotate: str,
+    source: bytes | None,
+    source_b64: str | None,
+) -> GazeEstimateResponse:
+    """
+    Phần sau quan sát của /gaze/estimate: dwell timer, vi phạm, message, ảnh annotate.
+    Cũng chạy cho frame gần trùng (dùng lại *obs* của frame trước) — timer vẫn trôi theo thời gian thực.
+    *frame_bgr* None: chỉ decode *source* khi cần vẽ ảnh.
+    """
+    faces = [dict(f) for f in obs.faces]
+    selected_idx = obs.selected_idx
+    enrolled_face_matched = obs.enrolled_face_matched
+    geo_looking_away = obs.geo_looking_away
+    mssv_for_face = obs.mssv_for_face
+    arrow_multiplier: float = float(getattr(app.state, "arrow_multiplier", 4.0))
+    looking_away_min_sec: float = float(getattr(app.state, "looking_away_min_sec", 8.0))
+    looking_away_false_grace_sec: float = float(
+        getattr(app.state, "looking_away_false_grace_sec", 2.0)
+    )
+    max_faces: int = int(getattr(app.state, "max_faces", 1))
     faces_count = len(faces)
 
-    # Thời gian lệch liên tục (HTTP mỗi frame; lưu monotonic trên server theo MSSV)
-    sid_key = _req_sid or _enr_stored
-    state_key = sid_key if sid_key else "anon"
+    # Thời gian lệch liên tục (HTTP mỗi frame; lưu monotonic trong SessionState của thí sinh)
     # Bộ đếm looking_away_min_sec (mặc định 8s): chỉ reset khi mất mặt hoặc gaze chắc chắn KHÔNG lệch (geo False).
     # Frame gaze NaN/None trước đây làm pop timer → không bao giờ đủ thời gian + không set looking_away → mất popup/ảnh.
     looking_away_sustained = False
     emit_looking_away_violation = False
     emit_no_face = False
     emit_multi_face = False
-    with lock:
-        store_raw = getattr(app.state, "_looking_away_since", None)
-        store: dict[str, float] = dict(store_raw) if isinstance(store_raw, dict) else {}
-        false_raw = getattr(app.state, "_looking_away_false_since", None)
-        false_since: dict[str, float] = dict(false_raw) if isinstance(false_raw, dict) else {}
-        emitted_raw = getattr(app.state, "_looking_away_violation_emitted", None)
-        emitted: dict[str, bool] = dict(emitted_raw) if isinstance(emitted_raw, dict) else {}
+    with registry.session(sess_key) as sess:
         now = time.monotonic()
         if faces_count == 0:
-            store.pop(state_key, None)
-            false_since.pop(state_key, None)
-            emitted.pop(state_key, None)
+            sess.looking_away_since = None
+            sess.looking_away_false_since = None
+            sess.looking_away_violation_emitted = False
         elif geo_looking_away is True:
-            false_since.pop(state_key, None)
-            t0 = store.get(state_key)
+            sess.looking_away_false_since = None
+            t0 = sess.looking_away_since
             if t0 is None:
-                store[state_key] = now
+                sess.looking_away_since = now
                 looking_away_sustained = False
             else:
                 looking_away_sustained = (now - t0) >= looking_away_min_sec
         elif geo_looking_away is False:
             # Khi đang lệch mà bị đọc ngược 1 vài frame (geo False) do crop/gaze jitter,
             # không reset ngay; chỉ reset nếu False kéo dài quá ngưỡng.
-            if state_key in store:
-                if state_key not in false_since:
-                    false_since[state_key] = now
-                if (now - false_since[state_key]) >= looking_away_false_grace_sec:
-                    store.pop(state_key, None)
-                    false_since.pop(state_key, None)
-                    emitted.pop(state_key, None)
-            t0 = store.get(state_key)
+            if sess.looking_away_since is not None:
+                if sess.looking_away_false_since is None:
+                    sess.looking_away_false_since = now
+                if (now - sess.looking_away_false_since) >= looking_away_false_grace_sec:
+                    sess.looking_away_since = None
+                    sess.looking_away_false_since = None
+                    sess.looking_away_violation_emitted = False
+            t0 = sess.looking_away_since
             looking_away_sustained = t0 is not None and (now - t0) >= looking_away_min_sec
         else:
             # geo_looking_away is None — giữ mốc thời gian, thời thực vẫn trôi
             # (đồng thời xóa cờ "false streak" nếu từng bị đọc ngược trước đó).
-            false_since.pop(state_key, None)
-            t0 = store.get(state_key)
+            sess.looking_away_false_since = None
+            t0 = sess.looking_away_since
             looking_away_sustained = t0 is not None and (now - t0) >= looking_away_min_sec
-        app.state._looking_away_since = store
-        app.state._looking_away_false_since = false_since
 
         # Một lần vi phạm / một ảnh mỗi lượt: frame tại boundary đủ looking_away_min_sec.
         if (
             looking_away_sustained
-            and not emitted.get(state_key, False)
+            and not sess.looking_away_violation_emitted
             and faces_count > 0
             and faces_count <= max_faces
         ):
             emit_looking_away_violation = True
-            emitted[state_key] = True
-        app.state._looking_away_violation_emitted = emitted
+            sess.looking_away_violation_emitted = True
 
         # no_face / multi_face: cùng thời gian chờ như looking_away; 1 violation + 1 ảnh mỗi lượt tình huống.
         viol_dwell = float(looking_away_min_sec)
-        nf_sr = getattr(app.state, "_no_face_since", None)
-        nf_since: dict[str, float] = dict(nf_sr) if isinstance(nf_sr, dict) else {}
-        nf_er = getattr(app.state, "_no_face_emitted", None)
-        nf_emitted: dict[str, bool] = dict(nf_er) if isinstance(nf_er, dict) else {}
-        mf_sr = getattr(app.state, "_multi_face_since", None)
-        mf_since: dict[str, float] = dict(mf_sr) if isinstance(mf_sr, dict) else {}
-        mf_er = getattr(app.state, "_multi_face_emitted", None)
-        mf_emitted: dict[str, bool] = dict(mf_er) if isinstance(mf_er, dict) else {}
-
         if faces_count == 0:
-            if state_key not in nf_since:
-                nf_since[state_key] = now
-            if (now - nf_since[state_key]) >= viol_dwell and not nf_emitted.get(state_key, False):
+            if sess.no_face_since is None:
+                sess.no_face_since = now
+            if (now - sess.no_face_since) >= viol_dwell and not sess.no_face_emitted:
                 emit_no_face = True
-                nf_emitted[state_key] = True
-            mf_since.pop(state_key, None)
-            mf_emitted.pop(state_key, None)
+                sess.no_face_emitted = True
+            sess.multi_face_since = None
+            sess.multi_face_emitted = False
         elif faces_count > max_faces:
-            nf_since.pop(state_key, None)
-            nf_emitted.pop(state_key, None)
-            if state_key not in mf_since:
-                mf_since[state_key] = now
-            if (now - mf_since[state_key]) >= viol_dwell and not mf_emitted.get(state_key, False):
+            sess.no_face_since = None
+            sess.no_face_emitted = False
+            if sess.multi_face_since is None:
+                sess.multi_face_since = now
+            if (now - sess.multi_face_since) >= viol_dwell and not sess.multi_face_emitted:
                 emit_multi_face = True
-                mf_emitted[state_key] = True
+                sess.multi_face_emitted = True
         else:
-            nf_since.pop(state_key, None)
-            nf_emitted.pop(state_key, None)
-            mf_since.pop(state_key, None)
-            mf_emitted.pop(state_key, None)
-
-        app.state._no_face_since = nf_since
-        app.state._no_face_emitted = nf_emitted
-        app.state._multi_face_since = mf_since
-        app.state._multi_face_emitted = mf_emitted
+            sess.no_face_since = None
+            sess.no_face_emitted = False
+            sess.multi_face_since = None
+            sess.multi_face_emitted = False
+
+        calm = (
+            faces_count == 1
+            and enrolled_face_matched
+            and geo_looking_away is not True
+            and sess.looking_away_since is None
+        )
+        next_capture_ms = _next_capture_ms(sess, now, calm)
 
     if selected_idx is not None and 0 <= selected_idx < len(faces):
         # Dùng theo streak đã tính (looking_away_sustained) để popup/message nhất quán,
@@ -1334,20 +2173,27 @@ def gaze_estimate(payload: GazeEstimateRequest) -> GazeEstimateResponse:
     else:
         response_faces = []
 
-    # Annotate: bbox cho mọi mặt; mũi tên gaze chỉ khi đã khớp định danh đúng mặt đó.
-    annotate_faces: list[dict[str, Any]] = []
-    for i, f in enumerate(faces):
-        af = dict(f)
-        af["draw_gaze_arrow"] = bool(
-            enrolled_face_matched and selected_idx is not None and i == selected_idx
-        )
-        annotate_faces.append(af)
+    # Ảnh annotate chỉ tạo khi cần (mặc định: chỉ khi frame này có vi phạm — app chỉ upload snapshot lúc đó).
+    want_image = annotate == "always" or (annotate == "on_violation" and violation)
+    annotated_b64: str | None = None
+    if want_image and frame_bgr is None:
+        frame_bgr = _decode_image_bytes_to_bgr(source if source is not None else _b64decode_payload(source_b64 or ""))
+    if want_image and frame_bgr is not None:
+        # Annotate: bbox cho mọi mặt; mũi tên gaze chỉ khi đã khớp định danh đúng mặt đó.
+        annotate_faces: list[dict[str, Any]] = []
+        for i, f in enumerate(faces):
+            af = dict(f)
+            af["draw_gaze_arrow"] = bool(
+                enrolled_face_matched and selected_idx is not None and i == selected_idx
+            )
+            annotate_faces.append(af)
 
-    if len(annotate_faces) > 0:
-        annotated = _annotate_frame(frame_bgr, annotate_faces, arrow_multiplier=arrow_multiplier)
-        annotated_b64 = _encode_bgr_to_jpeg_base64(annotated)
-    else:
-        annotated_b64 = _encode_bgr_to_jpeg_base64(frame_bgr)
+        if len(annotate_faces) > 0:
+            annotated = _annotate_frame(frame_bgr, annotate_faces, arrow_multiplier=arrow_multiplier)
+            annotated_b64 = _encode_bgr_to_jpeg_base64(annotated)
+        else:
+            # Frame không bị vẽ gì: trả lại ảnh gốc (nếu là JPEG), không encode lại.
+            annotated_b64 = _source_jpeg_base64(source, source_b64) or _encode_bgr_to_jpeg_base64(frame_bgr)
 
     # enrolled_student_id trong JSON chỉ khi frame này có mặt khớp định danh — không gán MSSV app khi chưa khớp.
     response_student_id: str | None = None
@@ -1362,5 +2208,6 @@ def gaze_estimate(payload: GazeEstimateRequest) -> GazeEstimateResponse:
         violation_type=violation_type,
         message=message,
         enrolled_student_id=response_student_id,
+        next_capture_ms=next_capture_ms,
     )
 
@@ -0,0 +1,122 @@
+import argparse
+import os
+import time
+
+import numpy as np
+import torch
+import torch.nn as nn
+from torchvision import transforms
+
+from l2cs import Gaze360, angular, gazeto3d, getArch
+from l2cs.utils import load_state_dict, prep_input_numpy
+
+
+def parse_args():
+    """Parse input arguments."""
+    parser = argparse.ArgumentParser(
+        description='Latency / Gaze360 accuracy of L2CS-Net at several input resolutions.')
+    parser.add_argument(
+        '--snapshot', dest='snapshot', help='Path of model snapshot.',
+        default='models/L2CSNet_gaze360.pkl', type=str)
+    parser.add_argument(
+        '--arch', dest='arch', help='Network architecture.',
+        default='ResNet50', type=str)
+    parser.add_argument(
+        '--device', dest='device', help='cpu, cuda, cuda:0 ...',
+        default='cpu', type=str)
+    parser.add_argument(
+        '--sizes', dest='sizes', help='Comma separated input sizes.',
+        default='224,320,448', type=str)
+    parser.add_argument(
+        '--batch_size', dest='batch_size', help='Faces per forward pass for the latency run.',
+        default=1, type=int)
+    parser.add_argument(
+        '--iters', dest='iters', help='Timed iterations per size.',
+        default=30, type=int)
+    parser.add_argument(
+        '--gaze360image_dir', dest='gaze360image_dir', help='Directory path for gaze images.',
+        default='datasets/Gaze360/Image', type=str)
+    parser.add_argument(
+        '--gaze360label_dir', dest='gaze360label_dir', help='Directory path for gaze labels.',
+        default='datasets/Gaze360/Label/test.label', type=str)
+    parser.add_argument(
+        '--eval_batch_size', dest='eval_batch_size', help='Batch size for the accuracy run.',
+        default=64, type=int)
+    parser.add_argument(
+        '--max_samples', dest='max_samples', help='Limit Gaze360 test samples (0 = all).',
+        default=0, type=int)
+    return parser.parse_args()
+
+
+def _decode(gaze_pitch, gaze_yaw, softmax, idx_tensor):
+    pitch = torch.sum(softmax(gaze_pitch) * idx_tensor, 1) * 4 - 180
+    yaw = torch.sum(softmax(gaze_yaw) * idx_tensor, 1) * 4 - 180
+    return pitch * np.pi / 180, yaw * np.pi / 180
+
+
+def bench_latency(model, device, size, batch_size, iters):
+    """Median ms per forward, including numpy -> tensor preprocessing like Pipeline.predict_gaze."""
+    rng = np.random.default_rng(0)
+    faces = rng.integers(0, 256, size=(batch_size, size, size, 3), dtype=np.uint8)
+    times = []
+    with torch.no_grad():
+        for i in range(iters + 3):
+            t0 = time.perf_counter()
+            model(prep_input_numpy(faces, device, size))
+            if device.type == 'cuda':
+                torch.cuda.synchronize()
+            if i >= 3:
+                times.append((time.perf_counter() - t0) * 1000.0)
+    return float(np.median(times))
+
+
+def eval_gaze360(model, device, size, args):
+    """Mean angular error (degrees) on the Gaze360 test split with crops resized to *size*."""
+    transformations = transforms.Compose([
+        transforms.Resize(size),
+        transforms.ToTensor(),
+        transforms.Normalize(
+            mean=[0.485, 0.456, 0.406],
+            std=[0.229, 0.224, 0.225]
+        )
+    ])
+    dataset = Gaze360(args.gaze360label_dir, args.gaze360image_dir, transformations, 180, 4, train=False)
+    if args.max_samples > 0:
+        dataset = torch.utils.data.Subset(dataset, range(min(args.max_samples, len(dataset))))
+    loader = torch.utils.data.DataLoader(dataset, batch_size=args.eval_batch_size, shuffle=False, num_workers=4)
+
+    softmax = nn.Softmax(dim=1)
+    idx_tensor = torch.arange(90, dtype=torch.float32, device=device)
+    total = 0
+    avg_error = .0
+    with torch.no_grad():
+        for images, _labels, cont_labels, _name in loader:
+            gaze_pitch, gaze_yaw = model(images.to(device))
+            pitch, yaw = _decode(gaze_pitch, gaze_yaw, softmax, idx_tensor)
+            label_pitch = cont_labels[:, 0].float() * np.pi / 180
+            label_yaw = cont_labels[:, 1].float() * np.pi / 180
+            for p, y, pl, yl in zip(pitch.cpu(), yaw.cpu(), label_pitch, label_yaw):
+                avg_error += angular(gazeto3d([p, y]), gazeto3d([pl, yl]))
+            total += cont_labels.size(0)
+    return avg_error / total if total else float('nan')
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    device = torch.device(args.device)
+    sizes = [int(s) for s in args.sizes.split(',') if s.strip()]
+
+    model = getArch(args.arch, 90)
+    model.load_state_dict(load_state_dict(args.snapshot, device))
+    model.to(device)
+    model.eval()
+
+    have_gaze360 = os.path.isfile(args.gaze360label_dir) and os.path.isdir(args.gaze360image_dir)
+    if not have_gaze360:
+        print(f"Gaze360 not found at '{args.gaze360label_dir}' — reporting latency only.")
+
+    print(f"{'size':>6} {'ms/batch':>10} {'ms/face':>9} {'MAE(deg)':>9}")
+    for size in sizes:
+        ms = bench_latency(model, device, size, args.batch_size, args.iters)
+        mae = eval_gaze360(model, device, size, args) if have_gaze360 else float('nan')
+        print(f"{size:>6} {ms:>10.2f} {ms / args.batch_size:>9.2f} {mae:>9.3f}")
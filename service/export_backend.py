@@ -0,0 +1,94 @@
+import argparse
+import time
+
+import numpy as np
+import torch
+
+from l2cs import getArch
+from l2cs.backends import export_onnx, export_torchscript, load_backend
+from l2cs.utils import load_state_dict
+
+
+def parse_args():
+    """Parse input arguments."""
+    parser = argparse.ArgumentParser(
+        description='Export L2CS-Net to TorchScript / ONNX for PROCTORING_BACKEND.')
+    parser.add_argument(
+        '--snapshot', dest='snapshot', help='Path of model snapshot.',
+        default='models/L2CSNet_gaze360.pkl', type=str)
+    parser.add_argument(
+        '--arch', dest='arch', help='Network architecture.',
+        default='ResNet50', type=str)
+    parser.add_argument(
+        '--format', dest='format', help='torchscript or onnx',
+        default='onnx', choices=['torchscript', 'onnx'], type=str)
+    parser.add_argument(
+        '--output', dest='output', help='Output file (default: snapshot name + .pt / .onnx).',
+        default=None, type=str)
+    parser.add_argument(
+        '--input_size', dest='input_size', help='Network input resolution (PROCTORING_INPUT_SIZE).',
+        default=448, type=int)
+    parser.add_argument(
+        '--verify', dest='verify', help='Compare predict_gaze angles with eager at several batch sizes.',
+        action='store_true')
+    parser.add_argument(
+        '--tolerance_deg', dest='tolerance_deg', help='Max allowed pitch/yaw difference in --verify.',
+        default=0.05, type=float)
+    return parser.parse_args()
+
+
+def _angles(model, img):
+    """Same decoding as Pipeline.predict_gaze, in degrees."""
+    idx_tensor = torch.arange(90, dtype=torch.float32)
+    with torch.no_grad():
+        gaze_pitch, gaze_yaw = model(img)
+    pitch = torch.sum(torch.softmax(gaze_pitch, dim=1) * idx_tensor, dim=1) * 4 - 180
+    yaw = torch.sum(torch.softmax(gaze_yaw, dim=1) * idx_tensor, dim=1) * 4 - 180
+    return pitch.numpy(), yaw.numpy()
+
+
+def verify(eager, exported, input_size, tolerance_deg):
+    """Parity of exported vs eager predict_gaze output; also prints median latency per batch size."""
+    ok = True
+    print(f"{'batch':>5} {'max|dpitch|':>12} {'max|dyaw|':>10} {'eager ms':>9} {'export ms':>10}")
+    for batch in (1, 4, 8):
+        img = torch.randn(batch, 3, input_size, input_size)
+        p0, y0 = _angles(eager, img)
+        p1, y1 = _angles(exported, img)
+        dp = float(np.max(np.abs(p0 - p1)))
+        dy = float(np.max(np.abs(y0 - y1)))
+        times = []
+        for model in (eager, exported):
+            ts = []
+            for i in range(8):
+                t0 = time.perf_counter()
+                with torch.no_grad():
+                    model(img)
+                if i >= 2:
+                    ts.append((time.perf_counter() - t0) * 1000.0)
+            times.append(float(np.median(ts)))
+        print(f"{batch:>5} {dp:>12.5f} {dy:>10.5f} {times[0]:>9.1f} {times[1]:>10.1f}")
+        ok = ok and dp <= tolerance_deg and dy <= tolerance_deg
+    return ok
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    output = args.output or args.snapshot.rsplit('.', 1)[0] + ('.pt' if args.format == 'torchscript' else '.onnx')
+
+    model = getArch(args.arch, 90)
+    model.load_state_dict(load_state_dict(args.snapshot, 'cpu'))
+    model.eval()
+
+    if args.format == 'torchscript':
+        export_torchscript(model, output, args.input_size)
+        backend = 'torchscript'
+    else:
+        export_onnx(model, output, args.input_size)
+        backend = 'onnxruntime'
+    print(f"Exported {args.arch} -> {output} (PROCTORING_BACKEND={backend}, PROCTORING_BACKEND_PATH={output})")
+
+    if args.verify:
+        if not verify(model, load_backend(backend, output), args.input_size, args.tolerance_deg):
+            raise SystemExit(f"Parity check failed: difference above {args.tolerance_deg} deg")
+        print("Parity OK")
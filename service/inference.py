@@ -22,11 +22,15 @@ def main():
         print(f"\n[LỖI] Không tìm thấy file video: '{args.video_path}'\n")
         return
         
+    MAX_DIMENSION = 720
+
     print("Đang khởi tạo bộ não AI (L2CS-Net)...")
     gaze_pipeline = Pipeline(
         weights=args.snapshot,
         arch='ResNet50',
-        device=torch.device(args.device)
+        device=torch.device(args.device),
+        # Adaptive scaling: RetinaFace chạy trên ảnh thu nhỏ, crop gaze vẫn lấy từ frame gốc
+        detect_max_side=None if args.disable_scaling else MAX_DIMENSION
     )
     
     cap = cv2.VideoCapture(args.video_path)
@@ -43,19 +47,14 @@ def main():
         video_fps = 30.0 
     
     # ---------------------------------------------------------
-    # LOGIC CỦA MODULE ADAPTIVE SCALING
+    # LOGIC CỦA MODULE ADAPTIVE SCALING (nằm trong Pipeline.detect)
     # ---------------------------------------------------------
     width = orig_width
     height = orig_height
-    MAX_DIMENSION = 720 
     
     if not args.disable_scaling:
-        # Nếu KHÔNG bị tắt -> Chạy thuật toán tối ưu
-        if max(width, height) > MAX_DIMENSION:
-            scale = MAX_DIMENSION / max(width, height)
-            width = int(width * scale)
-            height = int(height * scale)
-        print(f"\n[CHẾ ĐỘ TỐI ƯU] Kích thước: {orig_width}x{orig_height} -> Nén về: {width}x{height}")
+        # Nếu KHÔNG bị tắt -> chỉ ảnh đưa vào detector bị thu nhỏ, video ra giữ độ phân giải gốc
+        print(f"\n[CHẾ ĐỘ TỐI ƯU] Kích thước: {orig_width}x{orig_height} -> Detect ở cạnh dài tối đa {MAX_DIMENSION}px")
     else:
         print(f"\n[CHẾ ĐỘ GỐC] Giữ nguyên độ phân giải khổng lồ: {width}x{height}. Cảnh báo: Sẽ rất chậm!")
 
@@ -73,10 +72,6 @@ def main():
         if not success:
             break
             
-        # Áp dụng nội suy kích thước nếu module được bật
-        if not args.disable_scaling:
-            frame = cv2.resize(frame, (width, height))
-        
         # AI phân tích (Nút thắt cổ chai phần cứng nằm ở đây)
         results = gaze_pipeline.step(frame)
         frame = render(frame, results)
@@ -1,12 +1,13 @@
 from .utils import select_device, natural_keys, gazeto3d, angular, getArch
 from .vis import draw_gaze, render
-from .model import L2CS
+from .model import L2CS, L2CSMobileNet
 from .pipeline import Pipeline
 from .datasets import Gaze360, Mpiigaze
 
 __all__ = [
     # Classes
     'L2CS',
+    'L2CSMobileNet',
     'Pipeline',
     'Gaze360',
     'Mpiigaze',
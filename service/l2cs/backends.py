@@ -0,0 +1,72 @@
+import numpy as np
+import torch
+
+BACKENDS = ('eager', 'torchscript', 'onnxruntime')
+
+
+class OnnxRuntimeModel:
+    """ONNX Runtime session with the same call signature as L2CS: NCHW tensor -> (pitch logits, yaw logits)."""
+
+    def __init__(self, path, num_threads=None):
+        try:
+            import onnxruntime as ort
+        except ImportError as e:
+            raise ImportError("The onnxruntime backend needs 'pip install onnxruntime'") from e
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads:
+            options.intra_op_num_threads = int(num_threads)
+        self.session = ort.InferenceSession(str(path), sess_options=options, providers=['CPUExecutionProvider'])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def __call__(self, img):
+        x = img.detach().cpu().contiguous().numpy() if isinstance(img, torch.Tensor) else np.ascontiguousarray(img)
+        pitch, yaw = self.session.run(None, {self.input_name: x.astype(np.float32, copy=False)})
+        return torch.from_numpy(pitch), torch.from_numpy(yaw)
+
+    def eval(self):
+        return self
+
+    def to(self, device):
+        return self
+
+
+def load_backend(backend, path, device='cpu'):
+    """Load an exported L2CS graph (see export_backend.py) for Pipeline(backend=...)."""
+    if backend == 'torchscript':
+        model = torch.jit.load(str(path), map_location=device)
+        model.eval()
+        return model
+    if backend == 'onnxruntime':
+        if torch.device(device).type != 'cpu':
+            raise ValueError("The onnxruntime backend only runs on CPU")
+        return OnnxRuntimeModel(path, num_threads=torch.get_num_threads())
+    raise ValueError(f"Unknown backend {backend!r}, expected one of {BACKENDS}")
+
+
+def export_torchscript(model, path, input_size=448):
+    """Trace L2CS.forward; traced convolutions are batch-size agnostic."""
+    example = torch.randn(1, 3, input_size, input_size)
+    with torch.no_grad():
+        traced = torch.jit.trace(model, example)
+    traced = torch.jit.freeze(traced)
+    traced.save(str(path))
+    return path
+
+
+def export_onnx(model, path, input_size=448, opset=17):
+    """Export L2CS.forward to ONNX with a dynamic batch dimension."""
+    example = torch.randn(1, 3, input_size, input_size)
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            example,
+            str(path),
+            input_names=['input'],
+            output_names=['pitch', 'yaw'],
+            dynamic_axes={'input': {0: 'batch'}, 'pitch': {0: 'batch'}, 'yaw': {0: 'batch'}},
+            opset_version=opset,
+            dynamo=False,
+        )
+    return path
@@ -3,6 +3,7 @@ import torch.nn as nn
 from torch.autograd import Variable
 import math
 import torch.nn.functional as F
+import torchvision
 
 
 class L2CS(nn.Module):
@@ -70,4 +71,28 @@ class L2CS(nn.Module):
         return pre_yaw_gaze, pre_pitch_gaze
 
 
+class L2CSMobileNet(nn.Module):
+    """Lightweight L2CS: MobileNetV3 backbone with the same two 90-bin gaze heads (distillation student)."""
 
+    def __init__(self, variant, num_bins):
+        super(L2CSMobileNet, self).__init__()
+        if variant == 'small':
+            backbone = torchvision.models.mobilenet_v3_small()
+        else:
+            backbone = torchvision.models.mobilenet_v3_large()
+        self.features = backbone.features
+        self.avgpool = nn.AdaptiveAvgPool2d((1, 1))
+        num_features = backbone.classifier[0].in_features
+
+        self.fc_yaw_gaze = nn.Linear(num_features, num_bins)
+        self.fc_pitch_gaze = nn.Linear(num_features, num_bins)
+
+    def forward(self, x):
+        x = self.features(x)
+        x = self.avgpool(x)
+        x = torch.flatten(x, 1)
+
+        # gaze
+        pre_yaw_gaze = self.fc_yaw_gaze(x)
+        pre_pitch_gaze = self.fc_pitch_gaze(x)
+        return pre_yaw_gaze, pre_pitch_gaze
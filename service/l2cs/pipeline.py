@@ -8,10 +8,19 @@ import torch.nn as nn
 from dataclasses import dataclass
 from face_detection import RetinaFace
 
-from .utils import prep_input_numpy, getArch
+from .utils import prep_input_numpy, crop_faces, getArch, DEFAULT_INPUT_SIZE, load_state_dict, resize_for_detection, rescale_faces
+from .backends import load_backend
+from .quantization import is_quantized_arch
 from .results import GazeResultContainer
 
 
+def cpu_supports_bf16() -> bool:
+    try:
+        return bool(torch.backends.mkldnn.is_available() and torch.ops.mkldnn._is_mkldnn_bf16_supported())
+    except (AttributeError, RuntimeError):
+        return False
+
+
 class Pipeline:
 
     def __init__(
@@ -20,7 +29,15 @@ class Pipeline:
         arch: str,
         device: str = 'cpu', 
         include_detector:bool = True,
-        confidence_threshold:float = 0.5
+        confidence_threshold:float = 0.5,
+        mmap_weights:bool = False,
+        detect_max_side:int = None,
+        input_size:int = DEFAULT_INPUT_SIZE,
+        backend:str = 'eager',
+        backend_path:pathlib.Path = None,
+        channels_last:bool = False,
+        bf16:bool = False,
+        num_threads:int = None
         ):
 
         # Save input parameters
@@ -28,11 +45,40 @@ class Pipeline:
         self.include_detector = include_detector
         self.device = device
         self.confidence_threshold = confidence_threshold
+        # Run RetinaFace on a downscaled copy; gaze crops still come from the full frame.
+        self.detect_max_side = detect_max_side
+        # Face crops are resized straight to the network input (no 224 -> 448 upsample).
+        self.input_size = int(input_size)
+
+        # Execution context for predict_gaze (always under torch.inference_mode)
+        if num_threads:
+            torch.set_num_threads(int(num_threads))
+        self.channels_last = channels_last
+        # bf16 autocast only where the CPU has native bf16 support (AVX512-BF16 / AMX) and the model is eager FP32
+        self.bf16 = (
+            bf16 and backend == 'eager' and not is_quantized_arch(arch)
+            and torch.device(device).type == 'cpu' and cpu_supports_bf16()
+        )
 
-        # Create L2CS model
-        self.model = getArch(arch, 90)
-        self.model.load_state_dict(torch.load(self.weights, map_location=device))
+        # Create L2CS model (eager), or load a graph exported by export_backend.py
+        self.backend = backend
+        if backend == 'eager':
+            # Packed INT8 params are rebuilt on load, so mmap/assign only applies to float checkpoints.
+            mmap_weights = mmap_weights and not is_quantized_arch(arch)
+            self.model = getArch(arch, 90)
+            self.model.load_state_dict(
+                load_state_dict(self.weights, device, mmap=mmap_weights),
+                assign=mmap_weights
+            )
+        else:
+            if backend_path is None:
+                raise ValueError(f"backend={backend!r} needs backend_path (see export_backend.py)")
+            self.model = load_backend(backend, backend_path, device)
         self.model.to(self.device)
+        # Converting the module re-allocates every conv weight, which would turn mmap'd (shared) weights into
+        # a private copy per process; in that case only the input batch is made channels_last.
+        if self.channels_last and isinstance(self.model, nn.Module) and not (backend == 'eager' and mmap_weights):
+            self.model.to(memory_format=torch.channels_last)
         self.model.eval()
 
         # Create RetinaFace if requested
@@ -43,20 +89,19 @@ class Pipeline:
             else:
                 self.detector = RetinaFace(gpu_id=device.index)
 
-            self.softmax = nn.Softmax(dim=1)
-            self.idx_tensor = [idx for idx in range(90)]
-            self.idx_tensor = torch.FloatTensor(self.idx_tensor).to(self.device)
+        self.softmax = nn.Softmax(dim=1)
+        self.idx_tensor = [idx for idx in range(90)]
+        self.idx_tensor = torch.FloatTensor(self.idx_tensor).to(self.device)
 
     def step(self, frame: np.ndarray) -> GazeResultContainer:
 
         # Creating containers
-        face_imgs = []
         bboxes = []
         landmarks = []
         scores = []
 
         if self.include_detector:
-            faces = self.detector(frame)
+            faces = self.detect(frame)
 
             if faces is not None: 
                 for box, landmark, score in faces:
@@ -65,30 +110,20 @@ class Pipeline:
                     if score < self.confidence_threshold:
                         continue
 
-                    # Extract safe min and max of x,y
-                    x_min=int(box[0])
-                    if x_min < 0:
-                        x_min = 0
-                    y_min=int(box[1])
-                    if y_min < 0:
-                        y_min = 0
-                    x_max=int(box[2])
-                    y_max=int(box[3])
-                    
-                    # Crop image
-                    img = frame[y_min:y_max, x_min:x_max]
-                    img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-                    img = cv2.resize(img, (224, 224))
-                    face_imgs.append(img)
-
                     # Save data
                     bboxes.append(box)
                     landmarks.append(landmark)
                     scores.append(score)
 
+                # Crop (clamped to the frame), resize and BGR->RGB as one batch
+                face_imgs, kept = crop_faces(frame, bboxes, self.input_size)
+                bboxes = [bboxes[i] for i in kept]
+                landmarks = [landmarks[i] for i in kept]
+                scores = [scores[i] for i in kept]
+
                 # Predict gaze
                 if len(face_imgs) > 0:
-                    pitch, yaw = self.predict_gaze(np.stack(face_imgs))
+                    pitch, yaw = self.predict_gaze(face_imgs)
                 else:
                     pitch = np.empty((0, 1))
                     yaw = np.empty((0, 1))
@@ -112,20 +147,29 @@ class Pipeline:
 
         return results
 
+    def detect(self, frame: np.ndarray):
+        """RetinaFace at detect_max_side resolution, boxes/landmarks in full-frame coordinates."""
+        small, scale = resize_for_detection(frame, self.detect_max_side)
+        return rescale_faces(self.detector(small), scale)
+
+    @torch.inference_mode()
     def predict_gaze(self, frame: Union[np.ndarray, torch.Tensor]):
         
         # Prepare input
         if isinstance(frame, np.ndarray):
-            img = prep_input_numpy(frame, self.device)
+            img = prep_input_numpy(frame, self.device, self.input_size, channels_last=self.channels_last)
         elif isinstance(frame, torch.Tensor):
             img = frame
+            if self.channels_last and img.dim() == 4:
+                img = img.contiguous(memory_format=torch.channels_last)
         else:
             raise RuntimeError("Invalid dtype for input")
     
         # Predict 
-        gaze_pitch, gaze_yaw = self.model(img)
-        pitch_predicted = self.softmax(gaze_pitch)
-        yaw_predicted = self.softmax(gaze_yaw)
+        with torch.autocast('cpu', dtype=torch.bfloat16, enabled=self.bf16):
+            gaze_pitch, gaze_yaw = self.model(img)
+        pitch_predicted = self.softmax(gaze_pitch.float())
+        yaw_predicted = self.softmax(gaze_yaw.float())
         
         # Get continuous predictions in degrees.
         pitch_predicted = torch.sum(pitch_predicted.data * self.idx_tensor, dim=1) * 4 - 180
@@ -0,0 +1,100 @@
+import torch
+from torch.ao.quantization import DeQuantStub, QuantStub, convert, get_default_qconfig, prepare
+from torchvision.models.quantization.resnet import QuantizableBasicBlock, QuantizableBottleneck
+
+from .model import L2CS
+
+INT8_SUFFIX = '-int8'
+
+_BLOCKS = {
+    'ResNet18': (QuantizableBasicBlock, [2, 2, 2, 2]),
+    'ResNet34': (QuantizableBasicBlock, [3, 4, 6, 3]),
+    'ResNet50': (QuantizableBottleneck, [3, 4, 6, 3]),
+    'ResNet101': (QuantizableBottleneck, [3, 4, 23, 3]),
+    'ResNet152': (QuantizableBottleneck, [3, 8, 36, 3]),
+}
+
+
+def default_engine():
+    engines = torch.backends.quantized.supported_engines
+    for engine in ('x86', 'fbgemm', 'qnnpack'):
+        if engine in engines:
+            return engine
+    raise RuntimeError('No quantized engine available in this PyTorch build')
+
+
+class QuantizableL2CS(L2CS):
+    """L2CS with an INT8 backbone; the pitch/yaw heads stay FP32 so the bin softmax keeps its resolution."""
+
+    def __init__(self, block, layers, num_bins):
+        super(QuantizableL2CS, self).__init__(block, layers, num_bins)
+        self.quant = QuantStub()
+        self.dequant = DeQuantStub()
+
+    def forward(self, x):
+        x = self.quant(x)
+        x = self.conv1(x)
+        x = self.bn1(x)
+        x = self.relu(x)
+        x = self.maxpool(x)
+
+        x = self.layer1(x)
+        x = self.layer2(x)
+        x = self.layer3(x)
+        x = self.layer4(x)
+        x = self.avgpool(x)
+        x = self.dequant(x)
+        x = torch.flatten(x, 1)
+
+        # gaze
+        pre_yaw_gaze = self.fc_yaw_gaze(x)
+        pre_pitch_gaze = self.fc_pitch_gaze(x)
+        return pre_yaw_gaze, pre_pitch_gaze
+
+    def fuse_model(self):
+        torch.ao.quantization.fuse_modules(self, [['conv1', 'bn1', 'relu']], inplace=True)
+        for m in self.modules():
+            if type(m) in (QuantizableBasicBlock, QuantizableBottleneck):
+                m.fuse_model()
+
+
+def _prepared(arch, bins, engine, float_state_dict=None):
+    if arch not in _BLOCKS:
+        raise ValueError(f'No quantized variant for {arch!r}, expected one of {sorted(_BLOCKS)}')
+    block, layers = _BLOCKS[arch]
+    model = QuantizableL2CS(block, layers, bins)
+    if float_state_dict is not None:
+        # Before fusion: BatchNorm statistics are folded into the conv weights.
+        model.load_state_dict(float_state_dict)
+    model.eval()
+    model.fuse_model()
+    model.qconfig = get_default_qconfig(engine)
+    for head in (model.fc_yaw_gaze, model.fc_pitch_gaze, model.fc_finetune):
+        head.qconfig = None
+    torch.backends.quantized.engine = engine
+    return prepare(model, inplace=True)
+
+
+def quantize_l2cs(float_state_dict, arch, bins, calibration, engine=None):
+    """Post-training static quantization: fuse conv-bn-relu, observe *calibration* batches
+    (iterable of normalized NCHW tensors), convert. Returns the INT8 model."""
+    engine = engine or default_engine()
+    model = _prepared(arch, bins, engine, float_state_dict)
+    with torch.no_grad():
+        for batch in calibration:
+            model(batch)
+    return convert(model, inplace=True)
+
+
+def quantized_arch(arch, bins, engine=None):
+    """Empty converted INT8 model, ready for load_state_dict of a checkpoint saved by quantize.py."""
+    engine = engine or default_engine()
+    return convert(_prepared(arch, bins, engine), inplace=True)
+
+
+def is_quantized_arch(arch):
+    return arch.endswith(INT8_SUFFIX)
+
+
+def base_arch(arch):
+    return arch[:-len(INT8_SUFFIX)] if is_quantized_arch(arch) else arch
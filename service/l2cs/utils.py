@@ -5,6 +5,7 @@ from math import cos, sin
 from pathlib import Path
 import subprocess
 import re
+import warnings
 
 import numpy as np
 import torch
@@ -14,11 +15,16 @@ import cv2
 import torchvision
 from torchvision import transforms
 
-from .model import L2CS
+from .model import L2CS, L2CSMobileNet
+from .quantization import base_arch, is_quantized_arch, quantized_arch
         
+# Resolution the Gaze360 / MPIIGaze checkpoints were trained at.
+DEFAULT_INPUT_SIZE = 448
+
+# PIL reference of the preprocessing (training / evaluation scripts); inference uses prep_input_numpy.
 transformations = transforms.Compose([
     transforms.ToPILImage(),
-    transforms.Resize(448),
+    transforms.Resize(DEFAULT_INPUT_SIZE),
     transforms.ToTensor(),
     transforms.Normalize(
         mean=[0.485, 0.456, 0.406],
@@ -26,6 +32,10 @@ transformations = transforms.Compose([
     )
 ])
 
+# ImageNet mean/std on the 0..255 scale, NCHW-broadcastable: normalize = (x - mean) * inv_std.
+_MEAN_255 = torch.tensor([0.485, 0.456, 0.406]).view(1, 3, 1, 1) * 255.0
+_INV_STD_255 = 1.0 / (torch.tensor([0.229, 0.224, 0.225]).view(1, 3, 1, 1) * 255.0)
+
 def atoi(text):
     return int(text) if text.isdigit() else text
 
@@ -37,23 +47,86 @@ def natural_keys(text):
     '''
     return [ atoi(c) for c in re.split(r'(\d+)', text) ]
 
-def prep_input_numpy(img:np.ndarray, device:str):
-    """Preparing a Numpy Array as input to L2CS-Net."""
-
-    if len(img.shape) == 4:
-        imgs = []
-        for im in img:
-            imgs.append(transformations(im))
-        img = torch.stack(imgs)
-    else:
-        img = transformations(img)
-
-    img = img.to(device)
-
-    if len(img.shape) == 3:
-        img = img.unsqueeze(0)
-
-    return img
+def prep_input_numpy(img:np.ndarray, device:str, input_size:int = DEFAULT_INPUT_SIZE, channels_last:bool = False):
+    """Preparing a Numpy Array as input to L2CS-Net.
+
+    uint8 RGB HWC / NHWC -> normalized float NCHW on *device* in one batched pass
+    (same result as `transformations` without the per-face PIL round trip).
+    Crops should already be input_size x input_size; otherwise the shorter side
+    is resized to input_size like transforms.Resize."""
+
+    if img.ndim == 3:
+        img = img[None]
+    x = torch.from_numpy(np.ascontiguousarray(img)).to(device, non_blocking=True)
+    # NHWC view -> contiguous NCHW float in a single copy; normalization then runs in place.
+    x = x.permute(0, 3, 1, 2).to(torch.float32, memory_format=torch.contiguous_format)
+
+    h, w = x.shape[-2:]
+    if min(h, w) != input_size:
+        if h <= w:
+            size = (input_size, int(input_size * w / h))
+        else:
+            size = (int(input_size * h / w), input_size)
+        x = torch.nn.functional.interpolate(x, size=size, mode='bilinear', align_corners=False, antialias=True)
+
+    x.sub_(_MEAN_255.to(x.device)).mul_(_INV_STD_255.to(x.device))
+    if channels_last:
+        x = x.contiguous(memory_format=torch.channels_last)
+    return x
+
+def crop_faces(frame_bgr:np.ndarray, boxes, input_size:int = DEFAULT_INPUT_SIZE):
+    """Crop *boxes* (x1, y1, x2, y2 in frame pixels) from a BGR frame, resize each to
+    input_size x input_size and convert the whole stack to RGB with one cvtColor call.
+    Returns (uint8 (N, S, S, 3) RGB stack, indices of the boxes that gave a non-empty crop)."""
+    h, w = frame_bgr.shape[:2]
+    out = np.empty((len(boxes), input_size, input_size, 3), dtype=np.uint8)
+    kept = []
+    for i, box in enumerate(boxes):
+        x_min = max(0, int(box[0]))
+        y_min = max(0, int(box[1]))
+        x_max = min(w, int(box[2]))
+        y_max = min(h, int(box[3]))
+        if x_max <= x_min or y_max <= y_min:
+            continue
+        cv2.resize(frame_bgr[y_min:y_max, x_min:x_max], (input_size, input_size), dst=out[len(kept)])
+        kept.append(i)
+    out = out[:len(kept)]
+    if len(kept) > 0:
+        flat = out.reshape(len(kept) * input_size, input_size, 3)
+        cv2.cvtColor(flat, cv2.COLOR_BGR2RGB, dst=flat)
+    return out, kept
+
+def load_state_dict(weights, device, mmap=False):
+    """Load a checkpoint; with mmap=True tensors stay backed by the file's page cache,
+    so several processes loading the same weights share one physical copy."""
+    if mmap and torch.device(device).type == 'cpu':
+        try:
+            return torch.load(weights, map_location='cpu', mmap=True)
+        except RuntimeError as e:
+            # Legacy (non-zip) checkpoints cannot be memory-mapped.
+            warnings.warn(f'mmap load failed for {weights}, falling back to a regular load: {e}')
+    return torch.load(weights, map_location=device)
+
+def resize_for_detection(frame, max_side):
+    """Downscale *frame* so its longest side is at most *max_side* (no-op when max_side is falsy
+    or the frame is already small). Returns (frame, scale) with original = resized * scale."""
+    h, w = frame.shape[:2]
+    if not max_side or max(h, w) <= max_side:
+        return frame, 1.0
+    scale = max(h, w) / float(max_side)
+    size = (max(1, int(round(w / scale))), max(1, int(round(h / scale))))
+    return cv2.resize(frame, size, interpolation=cv2.INTER_AREA), scale
+
+def rescale_faces(faces, scale):
+    """Map RetinaFace (box, landmarks, score) results back to full-resolution coordinates."""
+    if faces is None:
+        return []
+    if scale == 1.0:
+        return list(faces)
+    return [
+        (np.asarray(box, dtype=np.float32) * scale, np.asarray(landmark, dtype=np.float32) * scale, score)
+        for box, landmark, score in faces
+    ]
 
 def gazeto3d(gaze):
     gaze_gt = np.zeros([3])
@@ -128,8 +201,15 @@ def git_describe(path=Path(__file__).parent):  # path must be a directory
         return ''  # not a git repository
         
 def getArch(arch,bins):
+    # INT8 checkpoint written by quantize.py, e.g. 'ResNet50-int8'
+    if is_quantized_arch(arch):
+        return quantized_arch(base_arch(arch), bins)
     # Base network structure
-    if arch == 'ResNet18':
+    if arch in ('MobileNetV3', 'MobileNetV3_Large'):
+        model = L2CSMobileNet('large', bins)
+    elif arch == 'MobileNetV3_Small':
+        model = L2CSMobileNet('small', bins)
+    elif arch == 'ResNet18':
         model = L2CS( torchvision.models.resnet.BasicBlock,[2, 2,  2, 2], bins)
     elif arch == 'ResNet34':
         model = L2CS( torchvision.models.resnet.BasicBlock,[3, 4,  6, 3], bins)
@@ -0,0 +1,248 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable
+
+import cv2
+import numpy as np
+
+
+class MicroBatcher:
+    """
+    Gom input từ nhiều request đồng thời thành một lần gọi model.
+
+    Một batch được chạy khi đủ *max_batch* phần tử (theo _item_size) hoặc hết *max_wait_ms* kể từ phần tử đầu tiên.
+    Lớp con cài _run_batch(items) -> list kết quả (cùng thứ tự với items).
+    """
+
+    def __init__(self, name: str, max_batch: int = 16, max_wait_ms: float = 4.0, consumers: int = 1):
+        self.name = name
+        self.max_batch = max(1, int(max_batch))
+        self.max_wait_sec = max(0.0, float(max_wait_ms)) / 1000.0
+        # Số batch chạy song song (vd. một cho mỗi tiến trình suy luận trong worker pool).
+        self.consumers = max(1, int(consumers))
+        self._queue: "queue.Queue[tuple[Any, Future] | None]" = queue.Queue()
+        self._threads: list[threading.Thread] = []
+        self._stats_lock = threading.Lock()
+        self._batches = 0
+        self._items = 0
+        self._size_counts: dict[int, int] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_batch > 1
+
+    def start(self) -> None:
+        if not self.enabled or self._threads:
+            return
+        for i in range(self.consumers):
+            t = threading.Thread(target=self._loop, name=f"{self.name}-batcher-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def stop(self) -> None:
+        if not self._threads:
+            return
+        for _ in self._threads:
+            self._queue.put(None)
+        for t in self._threads:
+            t.join(timeout=5.0)
+        self._threads = []
+        self._fail_pending()
+
+    def _fail_pending(self) -> None:
+        """Item còn trong hàng đợi (sau sentinel dừng) không còn consumer: báo lỗi để submit() không chờ mãi."""
+        while True:
+            try:
+                entry = self._queue.get_nowait()
+            except queue.Empty:
+                return
+            if entry is not None:
+                entry[1].set_exception(RuntimeError(f"{self.name} batcher stopped"))
+
+    def submit(self, item: Any) -> Any:
+        """Chặn tới khi batch chứa *item* chạy xong; trả kết quả của riêng item đó."""
+        if not self._threads:
+            # Tắt batching (max_batch=1) hoặc chưa start: chạy ngay trên thread gọi.
+            result = self._run_batch([item])[0]
+            self._record(self._item_size(item))
+            return result
+        fut: Future = Future()
+        self._queue.put((item, fut))
+        if not self._threads:
+            # stop() chạy xong giữa lúc kiểm tra và put: không ai còn lấy item này.
+            self._fail_pending()
+        return fut.result()
+
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    def stats(self) -> dict[str, Any]:
+        with self._stats_lock:
+            return {
+                "max_batch": self.max_batch,
+                "max_wait_ms": self.max_wait_sec * 1000.0,
+                "batches": self._batches,
+                "items": self._items,
+                "mean_batch_size": (self._items / self._batches) if self._batches else 0.0,
+                "batch_size_counts": dict(sorted(self._size_counts.items())),
+                "queue_depth": self.queue_depth(),
+            }
+
+    def _record(self, size: int) -> None:
+        with self._stats_lock:
+            self._batches += 1
+            self._items += size
+            self._size_counts[size] = self._size_counts.get(size, 0) + 1
+
+    def _collect(self, first: tuple[Any, Future]) -> tuple[list[tuple[Any, Future]], bool]:
+        batch = [first]
+        size = self._item_size(first[0])
+        deadline = time.monotonic() + self.max_wait_sec
+        while size < self.max_batch:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                nxt = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if nxt is None:
+                return batch, True
+            batch.append(nxt)
+            size += self._item_size(nxt[0])
+        return batch, False
+
+    def _loop(self) -> None:
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            batch, stopping = self._collect(first)
+            items = [it for it, _ in batch]
+            try:
+                results = self._run_batch(items)
+            except BaseException as e:  # noqa: BLE001
+                for _, fut in batch:
+                    fut.set_exception(e)
+            else:
+                if len(results) != len(batch):
+                    err = RuntimeError(f"{self.name} batch returned {len(results)} results for {len(batch)} items")
+                    for _, fut in batch:
+                        fut.set_exception(err)
+                else:
+                    for (_, fut), res in zip(batch, results):
+                        fut.set_result(res)
+            self._record(sum(self._item_size(it) for it in items))
+            if stopping:
+                return
+
+    def _item_size(self, item: Any) -> int:
+        return 1
+
+    def _run_batch(self, items: list[Any]) -> list[Any]:
+        raise NotImplementedError
+
+
+class GazeBatcher(MicroBatcher):
+    """
+    Batch cho Pipeline.predict_gaze: mỗi request gửi một stack crop (N, H, W, 3) RGB,
+    nhận lại (pitch, yaw) của riêng nó.
+    """
+
+    def __init__(self, predict_fn: Callable[[np.ndarray], tuple[np.ndarray, np.ndarray]], **kwargs: Any):
+        super().__init__("gaze", **kwargs)
+        self._predict_fn = predict_fn
+
+    def predict(self, face_imgs: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        return self.submit(face_imgs)
+
+    def _item_size(self, item: np.ndarray) -> int:
+        return int(item.shape[0])
+
+    def _run_batch(self, items: list[np.ndarray]) -> list[tuple[np.ndarray, np.ndarray]]:
+        stacked = items[0] if len(items) == 1 else np.concatenate(items, axis=0)
+        pitch, yaw = self._predict_fn(stacked)
+        out: list[tuple[np.ndarray, np.ndarray]] = []
+        start = 0
+        for it in items:
+            end = start + int(it.shape[0])
+            out.append((pitch[start:end], yaw[start:end]))
+            start = end
+        return out
+
+
+def _letterbox_groups(shapes: list[tuple[int, int]], min_fill: float) -> list[list[int]]:
+    """
+    Chia frame thành nhóm có kích thước gần nhau; mỗi nhóm được pad (phải/dưới) về cùng (H, W).
+    Một frame chỉ vào nhóm khi diện tích của nó >= min_fill * diện tích sau pad (tránh tốn phép tính cho viền đen).
+    """
+    order = sorted(range(len(shapes)), key=lambda i: shapes[i][0] * shapes[i][1], reverse=True)
+    groups: list[tuple[int, int, list[int]]] = []  # (H, W, indices)
+    for i in order:
+        h, w = shapes[i]
+        placed = False
+        for gi, (gh, gw, idx) in enumerate(groups):
+            nh, nw = max(gh, h), max(gw, w)
+            if all(shapes[j][0] * shapes[j][1] >= min_fill * nh * nw for j in idx + [i]):
+                groups[gi] = (nh, nw, idx + [i])
+                placed = True
+                break
+        if not placed:
+            groups.append((h, w, [i]))
+    return [idx for _, _, idx in groups]
+
+
+class DetectBatcher(MicroBatcher):
+    """
+    Batch cho RetinaFace: frame từ nhiều phiên được nhóm theo kích thước, pad về chung shape
+    (góc trên-trái giữ nguyên nên toạ độ không cần đổi), chạy một lần detector rồi trả
+    (box, landmarks, score) của đúng frame cho từng request.
+    """
+
+    def __init__(self, detect_fn: Callable[[Any], Any], min_fill: float = 0.75, **kwargs: Any):
+        super().__init__("detect", **kwargs)
+        self._detect_fn = detect_fn
+        self.min_fill = max(0.0, min(1.0, float(min_fill)))
+
+    def detect(self, frame_bgr: np.ndarray) -> list[Any]:
+        return self.submit(frame_bgr)
+
+    def _run_batch(self, items: list[np.ndarray]) -> list[list[Any]]:
+        if len(items) == 1:
+            faces = self._detect_fn(items[0])
+            return [list(faces) if faces is not None else []]
+
+        shapes = [(int(f.shape[0]), int(f.shape[1])) for f in items]
+        out: list[list[Any]] = [[] for _ in items]
+        for idx in _letterbox_groups(shapes, self.min_fill):
+            gh = max(shapes[i][0] for i in idx)
+            gw = max(shapes[i][1] for i in idx)
+            frames: list[np.ndarray] = []
+            for i in idx:
+                f = items[i]
+                if f.shape[0] != gh or f.shape[1] != gw:
+                    f = cv2.copyMakeBorder(f, 0, gh - f.shape[0], 0, gw - f.shape[1], cv2.BORDER_CONSTANT, value=(0, 0, 0))
+                frames.append(f)
+            if len(frames) == 1:
+                results = [self._detect_fn(frames[0])]
+            else:
+                results = self._detect_fn(frames)
+            for i, faces in zip(idx, results):
+                out[i] = _clip_faces(faces, shapes[i])
+        return out
+
+
+def _clip_faces(faces: Any, shape: tuple[int, int]) -> list[Any]:
+    """Kẹp box/landmark về kích thước frame gốc (phần pad không thuộc ảnh thật)."""
+    if faces is None:
+        return []
+    h, w = shape
+    clipped = []
+    for box, landmarks, score in faces:
+        box = np.asarray(box, dtype=np.float32).copy()
+        box[0::2] = np.clip(box[0::2], 0, w)
+        box[1::2] = np.clip(box[1::2], 0, h)
+        clipped.append((box, landmarks, score))
+    return clipped
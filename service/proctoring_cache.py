@@ -0,0 +1,70 @@
+import threading
+from typing import Any
+
+import cv2
+import numpy as np
+
+# Cạnh của chữ ký crop: đủ để thấy mắt/mí dịch vài pixel trên mặt webcam, vẫn chỉ ~1k phép so sánh.
+SIGNATURE_SIZE = 32
+
+
+def crop_signature(frame_bgr: np.ndarray, bbox: list[float], size: int = SIGNATURE_SIZE) -> np.ndarray | None:
+    """Ảnh xám size x size (float32) của vùng mặt — dùng để nhận ra crop gần như không đổi giữa các frame."""
+    h, w = frame_bgr.shape[:2]
+    x1, y1 = max(0, int(bbox[0])), max(0, int(bbox[1]))
+    x2, y2 = min(w, int(bbox[2])), min(h, int(bbox[3]))
+    if x2 - x1 < 4 or y2 - y1 < 4:
+        return None
+    gray = cv2.cvtColor(frame_bgr[y1:y2, x1:x2], cv2.COLOR_BGR2GRAY)
+    sig = cv2.resize(gray, (size, size), interpolation=cv2.INTER_AREA).astype(np.float32)
+    # Bỏ thay đổi sáng tổng thể (auto-exposure webcam) — chỉ so cấu trúc.
+    sig -= float(sig.mean())
+    return sig
+
+
+def frame_thumbnail(data: bytes | bytearray | memoryview) -> np.ndarray | None:
+    """
+    Ảnh xám 1/8 kích thước từ bytes ảnh (float32, đã trừ trung bình). Với JPEG, libjpeg chỉ giải DC của
+    mỗi khối 8x8 (IMREAD_REDUCED_GRAYSCALE_8) — rẻ hơn nhiều so với decode màu đầy đủ.
+    """
+    thumb = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_REDUCED_GRAYSCALE_8)
+    if thumb is None or thumb.size == 0:
+        return None
+    thumb = thumb.astype(np.float32)
+    thumb -= float(thumb.mean())
+    return thumb
+
+
+def signature_distance(a: np.ndarray, b: np.ndarray) -> float:
+    """Trung bình |Δ mức xám| giữa hai chữ ký."""
+    if a.shape != b.shape:
+        return float("inf")
+    return float(np.abs(a - b).mean())
+
+
+class CacheStats:
+    """Đếm hit / miss (theo lý do) của cache gaze, cho /stats."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses: dict[str, int] = {}
+
+    def hit(self) -> None:
+        with self._lock:
+            self._hits += 1
+
+    def miss(self, reason: str) -> None:
+        with self._lock:
+            self._misses[reason] = self._misses.get(reason, 0) + 1
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            misses = sum(self._misses.values())
+            total = self._hits + misses
+            return {
+                "hits": self._hits,
+                "misses": misses,
+                "miss_reasons": dict(sorted(self._misses.items())),
+                "hit_rate": (self._hits / total) if total else 0.0,
+            }
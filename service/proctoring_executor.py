@@ -0,0 +1,80 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, TypeVar
+
+T = TypeVar("T")
+
+
+class InferenceSaturated(Exception):
+    """Hàng đợi suy luận đã đầy — endpoint nên trả 429 + Retry-After."""
+
+
+class BoundedInferenceExecutor:
+    """
+    Thread pool riêng cho decode/detect/gaze với admission control:
+    tối đa *workers* việc chạy song song + *max_queue* việc chờ; vượt quá thì từ chối ngay
+    (InferenceSaturated) thay vì để request dồn tới khi client timeout.
+    """
+
+    def __init__(self, workers: int, max_queue: int):
+        self.workers = max(1, int(workers))
+        self.max_queue = max(0, int(max_queue))
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="inference")
+        self._lock = threading.Lock()
+        self._pending = 0  # đang chạy + đang chờ
+
+    @property
+    def capacity(self) -> int:
+        return self.workers + self.max_queue
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    @property
+    def in_flight(self) -> int:
+        return min(self._pending, self.workers)
+
+    @property
+    def queue_depth(self) -> int:
+        return max(0, self._pending - self.workers)
+
+    def load(self) -> float:
+        """Tỉ lệ đã dùng của capacity, 0..1."""
+        return self._pending / self.capacity
+
+    def _try_acquire(self) -> bool:
+        with self._lock:
+            if self._pending >= self.capacity:
+                return False
+            self._pending += 1
+            return True
+
+    def _release(self) -> None:
+        with self._lock:
+            self._pending -= 1
+
+    async def run(self, fn: Callable[..., T], *args: Any) -> T:
+        if not self._try_acquire():
+            raise InferenceSaturated()
+        try:
+            fut = self._pool.submit(fn, *args)
+        except BaseException:
+            self._release()
+            raise
+        # Trả slot khi job trong pool thực sự xong — không phải khi coroutine chờ bị huỷ (client ngắt kết nối),
+        # nếu không _pending đếm thiếu việc đang chạy và admission cho vượt capacity.
+        fut.add_done_callback(lambda _f: self._release())
+        return await asyncio.wrap_future(fut)
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "max_queue": self.max_queue,
+            "in_flight": self.in_flight,
+            "queue_depth": self.queue_depth,
+        }
+
+    def shutdown(self) -> None:
+        self._pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,160 @@
+import threading
+
+import numpy as np
+
+# Mô tả mặt: LBP 8 lân cận (uniform, 59 bin) trên lưới GRID x GRID của crop xám 112x112.
+# LBP chỉ so sánh pixel với tâm nên bất biến với thay đổi sáng đơn điệu (auto-exposure, đèn bàn),
+# lưới ô giữ được bố cục mắt/mũi/miệng mà histogram mức xám toàn mặt bỏ mất.
+GRID = 4
+LBP_BINS = 59
+DESCRIPTOR_DIM = GRID * GRID * LBP_BINS
+
+# Thứ tự vòng quanh tâm (dy, dx) — cần liên tục để đếm số lần chuyển 0/1 của mẫu uniform.
+_NEIGHBOURS = ((-1, -1), (-1, 0), (-1, 1), (0, 1), (1, 1), (1, 0), (1, -1), (0, -1))
+
+
+def _uniform_lut() -> np.ndarray:
+    """Mã LBP 8 bit -> bin: 58 mẫu uniform (<= 2 lần chuyển 0/1) giữ riêng, còn lại gộp vào bin cuối."""
+    lut = np.full(256, LBP_BINS - 1, dtype=np.intp)
+    nxt = 0
+    for code in range(256):
+        rotated = ((code << 1) | (code >> 7)) & 0xFF
+        if bin(code ^ rotated).count("1") <= 2:
+            lut[code] = nxt
+            nxt += 1
+    return lut
+
+
+_LUT = _uniform_lut()
+
+
+def face_descriptors(gray_faces: np.ndarray) -> np.ndarray:
+    """
+    (N, 112, 112) uint8 -> (N, DESCRIPTOR_DIM) float32, mỗi hàng chuẩn hoá L2 (cosine = tích vô hướng).
+    Một lần bincount cho cả lô; mỗi ô chuẩn hoá L1 rồi sqrt (Hellinger) để ô nhiều texture không lấn át.
+    """
+    g = np.asarray(gray_faces, dtype=np.int16)
+    if g.ndim == 2:
+        g = g[None]
+    n, h, w = g.shape
+    if n == 0:
+        return np.empty((0, DESCRIPTOR_DIM), dtype=np.float32)
+    center = g[:, 1:-1, 1:-1]
+    codes = np.zeros(center.shape, dtype=np.intp)
+    for bit, (dy, dx) in enumerate(_NEIGHBOURS):
+        codes |= (g[:, 1 + dy:h - 1 + dy, 1 + dx:w - 1 + dx] >= center).astype(np.intp) << bit
+
+    # Cắt phần dư để các ô bằng nhau (112 -> 110 mã -> 108 = 4 x 27).
+    ch, cw = (h - 2) // GRID, (w - 2) // GRID
+    oy, ox = ((h - 2) - ch * GRID) // 2, ((w - 2) - cw * GRID) // 2
+    codes = codes[:, oy:oy + ch * GRID, ox:ox + cw * GRID]
+    cell = (np.arange(ch * GRID)[:, None] // ch) * GRID + (np.arange(cw * GRID)[None, :] // cw)
+
+    bins = _LUT[codes] + (cell * LBP_BINS)[None]
+    bins += (np.arange(n, dtype=np.intp) * DESCRIPTOR_DIM)[:, None, None]
+    hists = np.bincount(bins.ravel(), minlength=n * DESCRIPTOR_DIM).astype(np.float32)
+    desc = np.sqrt(hists / float(ch * cw)).reshape(n, DESCRIPTOR_DIM)
+    desc /= np.maximum(np.linalg.norm(desc, axis=1, keepdims=True), np.float32(1e-12))
+    return desc
+
+
+class IdentityStore:
+    """
+    Mô tả mặt đã enroll của mọi thí sinh trong tiến trình: một ma trận float32 liên tục (hàng = thí sinh,
+    đã chuẩn hoá L2) + dict khoá -> hàng. Tra một thí sinh O(1); so một lô mặt với mô tả đó là một phép nhân ma trận.
+    """
+
+    def __init__(self, dim: int = DESCRIPTOR_DIM, capacity: int = 64):
+        self.dim = int(dim)
+        self._lock = threading.Lock()
+        cap = max(1, int(capacity))
+        self._emb = np.zeros((cap, self.dim), dtype=np.float32)
+        # Tổng chưa chuẩn hoá của các mẫu enroll — trung bình chạy không bị lệch bởi chuẩn hoá lặp.
+        self._sums = np.zeros((cap, self.dim), dtype=np.float32)
+        self._counts = np.zeros(cap, dtype=np.int64)
+        self._keys: list[str] = []
+        self._rows: dict[str, int] = {}
+
+    def _grow(self) -> None:
+        cap = self._emb.shape[0] * 2
+        for name in ("_emb", "_sums"):
+            old = getattr(self, name)
+            new = np.zeros((cap, self.dim), dtype=np.float32)
+            new[: old.shape[0]] = old
+            setattr(self, name, new)
+        counts = np.zeros(cap, dtype=np.int64)
+        counts[: self._counts.shape[0]] = self._counts
+        self._counts = counts
+
+    def enroll(self, key: str, descriptor: np.ndarray, reset: bool = False) -> int:
+        """Cộng một mẫu vào trung bình của *key* (tạo mới khi chưa có / *reset*). Trả số mẫu."""
+        d = np.asarray(descriptor, dtype=np.float32).reshape(self.dim)
+        with self._lock:
+            row = self._rows.get(key)
+            if row is None:
+                if len(self._keys) >= self._emb.shape[0]:
+                    self._grow()
+                row = len(self._keys)
+                self._keys.append(key)
+                self._rows[key] = row
+                reset = True
+            if reset:
+                self._sums[row] = d
+                self._counts[row] = 1
+            else:
+                self._sums[row] += d
+                self._counts[row] += 1
+            s = self._sums[row]
+            self._emb[row] = s / max(float(np.linalg.norm(s)), 1e-12)
+            return int(self._counts[row])
+
+    def export(self, key: str) -> tuple[np.ndarray, int] | None:
+        """(tổng mô tả chưa chuẩn hoá, số mẫu) của *key* — để lưu bền và restore() sau restart."""
+        with self._lock:
+            row = self._rows.get(key)
+            if row is None:
+                return None
+            return self._sums[row].copy(), int(self._counts[row])
+
+    def restore(self, key: str, descriptor_sum: np.ndarray, samples: int) -> None:
+        """Nạp lại trạng thái đã export(); trung bình chạy tiếp tục như chưa restart."""
+        s = np.asarray(descriptor_sum, dtype=np.float32).reshape(self.dim)
+        self.enroll(key, s, reset=True)
+        with self._lock:
+            self._counts[self._rows[key]] = max(1, int(samples))
+
+    def remove(self, key: str) -> None:
+        """Xoá *key*: chuyển hàng cuối vào chỗ trống để ma trận vẫn liên tục."""
+        with self._lock:
+            row = self._rows.pop(key, None)
+            if row is None:
+                return
+            last = len(self._keys) - 1
+            if row != last:
+                moved = self._keys[last]
+                self._emb[row] = self._emb[last]
+                self._sums[row] = self._sums[last]
+                self._counts[row] = self._counts[last]
+                self._keys[row] = moved
+                self._rows[moved] = row
+            self._keys.pop()
+            self._emb[last] = 0.0
+            self._sums[last] = 0.0
+            self._counts[last] = 0
+
+    def similarities(self, key: str, descriptors: np.ndarray) -> np.ndarray | None:
+        """Cosine của từng hàng *descriptors* (đã chuẩn hoá) với mô tả của *key*; None khi chưa enroll."""
+        with self._lock:
+            row = self._rows.get(key)
+            if row is None:
+                return None
+            ref = self._emb[row].copy()
+        return np.asarray(descriptors, dtype=np.float32).reshape(-1, self.dim) @ ref
+
+    def __contains__(self, key: object) -> bool:
+        with self._lock:
+            return key in self._rows
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._keys)
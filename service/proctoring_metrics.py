@@ -0,0 +1,246 @@
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Any, Iterable
+
+# Mốc histogram độ trễ (giây): từ base64/thumbnail (~0.1 ms) tới RetinaFace/gaze trên CPU tải cao (vài giây).
+LATENCY_BUCKETS: tuple[float, ...] = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+)
+
+# Endpoint đang xử lý trên thread hiện tại — nhãn `path` cho mọi stage đo bên trong (xem ServiceMetrics.request).
+_PATH: ContextVar[str] = ContextVar("proctoring_metrics_path", default="other")
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Iterable[str], values: Iterable[Any]) -> str:
+    pairs = [f'{n}="{_escape(str(v))}"' for n, v in zip(names, values)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _num(value: float | int) -> str:
+    if isinstance(value, int):
+        return str(value)
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+
+def render_family(name: str, kind: str, help_text: str, samples: list[tuple[str, str, float | int]]) -> list[str]:
+    """Một metric family theo text format của Prometheus; *samples*: (hậu tố tên, chuỗi nhãn, giá trị)."""
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+    lines.extend(f"{name}{suffix}{labels} {_num(value)}" for suffix, labels, value in samples)
+    return lines
+
+
+def gauge(name: str, help_text: str, values: dict[tuple, float | int], labelnames: tuple[str, ...] = ()) -> list[str]:
+    return render_family(
+        name, "gauge", help_text, [("", _labels(labelnames, key), v) for key, v in sorted(values.items())]
+    )
+
+
+def counter(name: str, help_text: str, values: dict[tuple, int], labelnames: tuple[str, ...] = ()) -> list[str]:
+    """Counter từ giá trị tích luỹ đã có sẵn ở nơi khác (vd. CacheStats)."""
+    return render_family(
+        name, "counter", help_text, [("_total", _labels(labelnames, key), v) for key, v in sorted(values.items())]
+    )
+
+
+class _ThreadShards:
+    """
+    Mỗi thread ghi vào dict riêng (không lock trên đường nóng); lock chỉ dùng khi thread đăng ký lần đầu
+    và khi scrape lấy danh sách shard. Scrape cộng các shard — có thể lệch một vài quan sát đang ghi, chấp nhận được.
+    """
+
+    def __init__(self) -> None:
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._shards: list[dict[tuple, list]] = []
+
+    def local(self) -> dict[tuple, list]:
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = {}
+            with self._lock:
+                self._shards.append(shard)
+            self._local.shard = shard
+        return shard
+
+    def merged(self, width: int) -> dict[tuple, list]:
+        with self._lock:
+            shards = list(self._shards)
+        out: dict[tuple, list] = {}
+        for shard in shards:
+            for key, row in list(shard.items()):
+                acc = out.setdefault(key, [0] * width)
+                for i, v in enumerate(list(row)):
+                    acc[i] += v
+        return out
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = labelnames
+        self._shards = _ThreadShards()
+
+    def inc(self, *labelvalues: str, amount: int = 1) -> None:
+        shard = self._shards.local()
+        row = shard.get(labelvalues)
+        if row is None:
+            row = shard[labelvalues] = [0]
+        row[0] += amount
+
+    def collect(self) -> list[str]:
+        merged = self._shards.merged(1)
+        return render_family(
+            self.name,
+            "counter",
+            self.help,
+            [("_total", _labels(self.labelnames, key), row[0]) for key, row in sorted(merged.items())],
+        )
+
+
+class Histogram:
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = LATENCY_BUCKETS,
+    ):
+        self.name = name
+        self.help = help_text
+        self.labelnames = labelnames
+        self.buckets = tuple(sorted(float(b) for b in buckets))
+        self._shards = _ThreadShards()
+
+    def observe(self, value: float, *labelvalues: str) -> None:
+        # Hàng: [đếm theo từng mốc (không cộng dồn)..., đếm > mốc cuối, tổng].
+        shard = self._shards.local()
+        row = shard.get(labelvalues)
+        if row is None:
+            row = shard[labelvalues] = [0] * (len(self.buckets) + 1) + [0.0]
+        row[bisect_left(self.buckets, value)] += 1
+        row[-1] += value
+
+    def collect(self) -> list[str]:
+        merged = self._shards.merged(len(self.buckets) + 2)
+        samples: list[tuple[str, str, float | int]] = []
+        names = self.labelnames + ("le",)
+        for key, row in sorted(merged.items()):
+            cumulative = 0
+            for le, n in zip(self.buckets + (float("inf"),), row[:-1]):
+                cumulative += n
+                samples.append(("_bucket", _labels(names, key + (_num(le),)), cumulative))
+            samples.append(("_sum", _labels(self.labelnames, key), float(row[-1])))
+            samples.append(("_count", _labels(self.labelnames, key), cumulative))
+        return render_family(self.name, "histogram", self.help, samples)
+
+
+def counts_histogram(
+    name: str, help_text: str, series: dict[tuple, dict[int, int]], labelnames: tuple[str, ...] = ()
+) -> list[str]:
+    """Histogram từ bảng {giá trị nguyên: số lần} đã có sẵn (vd. batch_size_counts của MicroBatcher); mốc lũy thừa 2."""
+    samples: list[tuple[str, str, float | int]] = []
+    names = labelnames + ("le",)
+    for key, counts in sorted(series.items()):
+        top = max(counts, default=1)
+        bounds = [1]
+        while bounds[-1] < top:
+            bounds.append(bounds[-1] * 2)
+        for le in bounds:
+            below = sum(n for v, n in counts.items() if v <= le)
+            samples.append(("_bucket", _labels(names, key + (_num(float(le)),)), below))
+        total = sum(counts.values())
+        samples.append(("_bucket", _labels(names, key + ("+Inf",)), total))
+        samples.append(("_sum", _labels(labelnames, key), float(sum(v * n for v, n in counts.items()))))
+        samples.append(("_count", _labels(labelnames, key), total))
+    return render_family(name, "histogram", help_text, samples)
+
+
+class _Timer:
+    __slots__ = ("_hist", "_labels", "_t0")
+
+    def __init__(self, hist: Histogram, labels: tuple[str, ...]):
+        self._hist = hist
+        self._labels = labels
+
+    def __enter__(self) -> "_Timer":
+        self._t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self._hist.observe(time.perf_counter() - self._t0, *self._labels)
+
+
+class _RequestScope:
+    __slots__ = ("_metrics", "_path", "_token", "_t0")
+
+    def __init__(self, metrics: "ServiceMetrics", path: str):
+        self._metrics = metrics
+        self._path = path
+
+    def __enter__(self) -> "_RequestScope":
+        self._token = _PATH.set(self._path)
+        self._t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type: Any, *exc: Any) -> None:
+        elapsed = time.perf_counter() - self._t0
+        _PATH.reset(self._token)
+        self._metrics.request_seconds.observe(elapsed, self._path)
+        if exc_type is not None:
+            self._metrics.request_errors.inc(self._path, exc_type.__name__)
+
+
+class ServiceMetrics:
+    """Histogram/counter của service cho /metrics; các gauge (hàng đợi, phiên, batch) đọc lúc scrape ở api_server."""
+
+    def __init__(self) -> None:
+        self.stage_seconds = Histogram(
+            "proctoring_stage_seconds",
+            "Time spent in one processing stage of a request.",
+            ("path", "stage"),
+        )
+        self.request_seconds = Histogram(
+            "proctoring_request_seconds",
+            "Time a request spends on an inference worker (excludes queue wait).",
+            ("path",),
+        )
+        self.queue_wait_seconds = Histogram(
+            "proctoring_queue_wait_seconds",
+            "Time a request waits for an inference worker.",
+            ("path",),
+        )
+        self.request_errors = Counter(
+            "proctoring_request_errors",
+            "Requests that raised while on an inference worker.",
+            ("path", "error"),
+        )
+        self.frames = Counter(
+            "proctoring_frames",
+            "Estimate frames by how face boxes were obtained: detect, tracked (reused/propagated boxes) or duplicate.",
+            ("path", "source"),
+        )
+
+    def stage(self, name: str) -> _Timer:
+        return _Timer(self.stage_seconds, (_PATH.get(), name))
+
+    def request(self, path: str) -> _RequestScope:
+        """Đặt nhãn `path` cho các stage bên trong và đo tổng thời gian xử lý."""
+        return _RequestScope(self, path)
+
+    def frame(self, source: str) -> None:
+        self.frames.inc(_PATH.get(), source)
+
+    def collect(self) -> list[str]:
+        lines: list[str] = []
+        for metric in (self.request_seconds, self.queue_wait_seconds, self.stage_seconds, self.request_errors, self.frames):
+            lines.extend(metric.collect())
+        return lines
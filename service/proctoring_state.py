@@ -0,0 +1,168 @@
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Callable, Iterator, Optional
+
+import numpy as np
+
+
+@dataclass
+class FrameObservation:
+    """Kết quả detect/định danh/gaze của một frame — đủ để chạy lại phần dwell/vi phạm cho frame gần trùng."""
+
+    faces: list[dict[str, Any]]
+    selected_idx: int | None
+    enrolled_face_matched: bool
+    geo_looking_away: bool | None
+    mssv_for_face: str
+
+
+@dataclass
+class SessionState:
+    """Trạng thái giám sát của một thí sinh (một MSSV) trên tiến trình uvicorn."""
+
+    key: str
+    student_id: str | None = None
+
+    # Tracking / detection cadence
+    frame_counter: int = 0
+    last_bboxes: np.ndarray | None = None
+    last_ids: list[int] | None = None  # aligned with last_bboxes
+    next_face_id: int = 1
+    tracks: list[dict[str, Any]] = field(default_factory=list)
+    last_enrolled_bbox_idx: int | None = None
+    # Ảnh xám thu nhỏ của frame trước (optical flow / motion energy) + scale so với frame gốc
+    track_gray: np.ndarray | None = None
+    track_gray_scale: float = 1.0
+    # Lịch detect thích ứng: frame detect gần nhất + cờ detect ngay ở frame sau (vd. mất khớp định danh)
+    last_detect_frame: int = 0
+    force_detect: bool = False
+
+    # Identity + enroll progress. Mô tả mặt nằm ở IdentityStore (proctoring_identity), khoá = key;
+    # ở đây chỉ giữ số mẫu đã enroll (0 = chưa enroll) — cũng là "phiên bản" cho identity_cache.
+    enrolled_samples: int = 0
+    enroll_seq: dict[str, Any] | None = None
+    # Đã thử nạp lại enroll từ EnrollmentStore cho session này (session mới sau khi bị evict vì idle).
+    restore_checked: bool = False
+    # Độ khớp định danh per track id -> (bbox lúc tính, similarity, enrolled_samples lúc tính)
+    identity_cache: dict[int, tuple[list[float], float, int]] = field(default_factory=dict)
+
+    # Dwell timers (monotonic) / emitted flags per violation kind
+    looking_away_since: float | None = None
+    looking_away_false_since: float | None = None
+    looking_away_violation_emitted: bool = False
+    no_face_since: float | None = None
+    no_face_emitted: bool = False
+    multi_face_since: float | None = None
+    multi_face_emitted: bool = False
+    # Mốc bắt đầu chuỗi frame "yên" (một mặt, khớp định danh, không lệch) — để giãn nhịp chụp (next_capture_ms).
+    calm_since: float | None = None
+
+    # EMA gaze per track id -> (pitch, yaw)
+    gaze_smooth: dict[int, tuple[float, float]] = field(default_factory=dict)
+    # Cache gaze thô per track id -> (chữ ký crop, pitch, yaw, monotonic lúc tính)
+    gaze_cache: dict[int, tuple[np.ndarray, float, float, float]] = field(default_factory=dict)
+    # Frame gần trùng: ảnh thu nhỏ + quan sát của frame xử lý đầy đủ gần nhất, monotonic lúc đó,
+    # số lần đã dùng lại liên tiếp, enrolled_samples lúc đó.
+    dup_thumb: np.ndarray | None = None
+    dup_observation: FrameObservation | None = None
+    dup_at: float = 0.0
+    dup_reuse: int = 0
+    dup_identity_version: int = 0
+
+    last_seen: float = field(default_factory=time.monotonic)
+
+
+class _Shard:
+    __slots__ = ("lock", "sessions")
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.sessions: dict[str, SessionState] = {}
+
+
+class SessionRegistry:
+    """
+    SessionState theo MSSV, chia thành nhiều shard — mỗi shard một lock.
+    Request của các thí sinh khác shard không chờ nhau; cùng shard chỉ chờ trong đoạn cập nhật ngắn.
+    """
+
+    def __init__(
+        self,
+        num_shards: int = 64,
+        idle_ttl_sec: float = 3600.0,
+        on_remove: Callable[[str], None] | None = None,
+    ):
+        self._shards = [_Shard() for _ in range(max(1, int(num_shards)))]
+        self.idle_ttl_sec = float(idle_ttl_sec)
+        # Gọi với key mỗi khi một session bị xoá (remove / clear / hết hạn idle) — vd. giải phóng hàng IdentityStore.
+        self._on_remove = on_remove
+        # MSSV enroll gần nhất — dùng khi request không gửi student_id (máy chủ đơn, hành vi cũ).
+        self._default_key: str | None = None
+
+    def _shard(self, key: str) -> _Shard:
+        # crc32 thay vì hash(): ổn định giữa các tiến trình (PYTHONHASHSEED).
+        return self._shards[zlib.crc32(key.encode("utf-8")) % len(self._shards)]
+
+    def _evict_idle(self, shard: _Shard, now: float) -> None:
+        if self.idle_ttl_sec <= 0:
+            return
+        stale = [k for k, st in shard.sessions.items() if now - st.last_seen > self.idle_ttl_sec]
+        for k in stale:
+            del shard.sessions[k]
+            if self._on_remove is not None:
+                self._on_remove(k)
+
+    @contextmanager
+    def session(self, key: str, student_id: str | None = None) -> Iterator[SessionState]:
+        """Giữ lock của shard chứa *key*; tạo SessionState nếu chưa có."""
+        shard = self._shard(key)
+        with shard.lock:
+            now = time.monotonic()
+            st = shard.sessions.get(key)
+            if st is None:
+                self._evict_idle(shard, now)
+                st = SessionState(key=key, student_id=student_id)
+                shard.sessions[key] = st
+            elif student_id and not st.student_id:
+                st.student_id = student_id
+            st.last_seen = now
+            yield st
+
+    @contextmanager
+    def peek(self, key: str) -> Iterator[Optional[SessionState]]:
+        """Như session() nhưng không tạo mới — yield None khi chưa có."""
+        shard = self._shard(key)
+        with shard.lock:
+            yield shard.sessions.get(key)
+
+    @property
+    def default_key(self) -> str | None:
+        return self._default_key
+
+    def set_default_key(self, key: str | None) -> None:
+        self._default_key = key
+
+    def remove(self, key: str) -> None:
+        shard = self._shard(key)
+        with shard.lock:
+            removed = shard.sessions.pop(key, None)
+        if removed is not None and self._on_remove is not None:
+            self._on_remove(key)
+        if self._default_key == key:
+            self._default_key = None
+
+    def clear(self) -> None:
+        for shard in self._shards:
+            with shard.lock:
+                keys = list(shard.sessions)
+                shard.sessions.clear()
+            if self._on_remove is not None:
+                for k in keys:
+                    self._on_remove(k)
+        self._default_key = None
+
+    def __len__(self) -> int:
+        return sum(len(s.sessions) for s in self._shards)
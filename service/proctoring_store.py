@@ -0,0 +1,226 @@
+import json
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any
+
+import numpy as np
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS enrollment (
+    key TEXT PRIMARY KEY,
+    student_id TEXT,
+    samples INTEGER NOT NULL,
+    dim INTEGER NOT NULL,
+    descriptor_sum BLOB NOT NULL,
+    enroll_seq TEXT,
+    updated_at REAL NOT NULL
+)
+"""
+
+
+@dataclass
+class EnrollmentRecord:
+    """Trạng thái enroll bền của một thí sinh: tổng mô tả mặt (IdentityStore) + số mẫu + bước pose."""
+
+    key: str
+    student_id: str | None
+    samples: int
+    descriptor_sum: np.ndarray
+    enroll_seq: dict[str, Any] | None
+    updated_at: float = 0.0
+
+
+class EnrollmentStore:
+    """
+    Lưu enroll xuống SQLite để restart service không bắt thí sinh enroll lại.
+
+    put()/delete() chỉ ghi vào dict chờ (gộp theo key — nhiều lần enroll liên tiếp chỉ ghi bản cuối);
+    một thread nền ghi cả lô trong một transaction sau tối đa *flush_interval_ms*, ngoài đường đi của request.
+    """
+
+    def __init__(self, path: str, flush_interval_ms: float = 250.0):
+        self.path = path
+        self.flush_interval_sec = max(0.0, float(flush_interval_ms)) / 1000.0
+        self._cond = threading.Condition()
+        self._pending: dict[str, EnrollmentRecord | None] = {}
+        # clear() chờ ghi: xoá cả bảng trước lô kế tiếp.
+        self._clear_pending = False
+        # Một lần flush tại một thời điểm — lô cũ không thể ghi đè sau clear()/delete mới hơn.
+        self._flush_lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+        self._stopping = False
+        self._batches = 0
+        self._writes = 0
+        self._errors = 0
+        conn = self._connect()
+        try:
+            conn.execute(_SCHEMA)
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=5.0, check_same_thread=False)
+        # WAL: đọc lúc khởi động không chặn ghi; NORMAL đủ an toàn cho dữ liệu enroll (mất tối đa lô cuối khi mất điện).
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def load(self) -> list[EnrollmentRecord]:
+        """Mọi bản ghi, cũ trước mới sau (bản cuối = thí sinh enroll gần nhất)."""
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                "SELECT key, student_id, samples, dim, descriptor_sum, enroll_seq, updated_at "
+                "FROM enrollment ORDER BY updated_at"
+            ).fetchall()
+        finally:
+            conn.close()
+        records = [self._record(row) for row in rows]
+        return [rec for rec in records if rec is not None]
+
+    @staticmethod
+    def _record(row: tuple) -> EnrollmentRecord | None:
+        key, student_id, samples, dim, blob, seq_json, updated_at = row
+        desc = np.frombuffer(blob, dtype=np.float32)
+        if desc.size != int(dim):
+            return None
+        try:
+            seq = json.loads(seq_json) if seq_json else None
+        except ValueError:
+            seq = None
+        return EnrollmentRecord(
+            key=key,
+            student_id=student_id,
+            samples=int(samples),
+            descriptor_sum=desc.copy(),
+            enroll_seq=seq if isinstance(seq, dict) else None,
+            updated_at=float(updated_at),
+        )
+
+    def get(self, key: str) -> EnrollmentRecord | None:
+        """Bản ghi của *key* (kể cả bản còn chờ ghi); None khi chưa có / đã xoá."""
+        # Giữ _flush_lock: lô đang ghi đã rời _pending nhưng chưa xuống đĩa — đọc sau khi nó commit.
+        with self._flush_lock:
+            with self._cond:
+                if key in self._pending:
+                    return self._pending[key]
+                if self._clear_pending:
+                    # Bảng sắp bị xoá: bản trên đĩa đã hết hiệu lực.
+                    return None
+            conn = self._connect()
+            try:
+                row = conn.execute(
+                    "SELECT key, student_id, samples, dim, descriptor_sum, enroll_seq, updated_at "
+                    "FROM enrollment WHERE key = ?",
+                    (key,),
+                ).fetchone()
+            finally:
+                conn.close()
+        return self._record(row) if row is not None else None
+
+    def put(self, record: EnrollmentRecord) -> None:
+        if not record.updated_at:
+            record.updated_at = time.time()
+        self._enqueue(record.key, record)
+
+    def delete(self, key: str) -> None:
+        self._enqueue(key, None)
+
+    def clear(self) -> None:
+        """Xoá mọi bản ghi (kể cả các bản còn chờ ghi)."""
+        with self._cond:
+            self._pending = {}
+            self._clear_pending = True
+            self._cond.notify()
+        if self._thread is None:
+            self.flush()
+
+    def _enqueue(self, key: str, record: EnrollmentRecord | None) -> None:
+        with self._cond:
+            self._pending[key] = record
+            self._cond.notify()
+        if self._thread is None:
+            # Chưa start (vd. script/CLI): ghi ngay trên thread gọi.
+            self.flush()
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stopping = False
+        self._thread = threading.Thread(target=self._loop, name="enrollment-store", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Dừng thread nền và ghi nốt phần còn chờ."""
+        if self._thread is not None:
+            with self._cond:
+                self._stopping = True
+                self._cond.notify()
+            self._thread.join(timeout=5.0)
+            self._thread = None
+        self.flush()
+
+    def flush(self) -> None:
+        with self._flush_lock:
+            with self._cond:
+                batch, self._pending = self._pending, {}
+                clear_all, self._clear_pending = self._clear_pending, False
+            if batch or clear_all:
+                self._write(batch, clear_all)
+
+    def _loop(self) -> None:
+        while True:
+            with self._cond:
+                while not self._pending and not self._clear_pending and not self._stopping:
+                    self._cond.wait()
+                if self._stopping:
+                    return
+            # Chờ thêm một nhịp để gộp các lần enroll dồn dập (3 pose x vài frame) vào một transaction.
+            time.sleep(self.flush_interval_sec)
+            self.flush()
+
+    def _write(self, batch: dict[str, EnrollmentRecord | None], clear_all: bool = False) -> None:
+        upserts = []
+        deletes = []
+        for key, rec in batch.items():
+            if rec is None:
+                deletes.append((key,))
+                continue
+            desc = np.ascontiguousarray(rec.descriptor_sum, dtype=np.float32).reshape(-1)
+            seq = json.dumps(rec.enroll_seq) if rec.enroll_seq is not None else None
+            upserts.append((key, rec.student_id, int(rec.samples), int(desc.size), desc.tobytes(), seq, rec.updated_at))
+        try:
+            conn = self._connect()
+            try:
+                with conn:
+                    if clear_all:
+                        conn.execute("DELETE FROM enrollment")
+                    if deletes:
+                        conn.executemany("DELETE FROM enrollment WHERE key = ?", deletes)
+                    if upserts:
+                        conn.executemany("INSERT OR REPLACE INTO enrollment VALUES (?, ?, ?, ?, ?, ?, ?)", upserts)
+            finally:
+                conn.close()
+        except sqlite3.Error:
+            # Không làm hỏng request: trạng thái in-memory vẫn đúng, chỉ mất khả năng khôi phục cho lô này.
+            with self._cond:
+                self._errors += 1
+                if clear_all:
+                    self._clear_pending = True
+            return
+        with self._cond:
+            self._batches += 1
+            self._writes += len(batch)
+
+    def stats(self) -> dict[str, Any]:
+        with self._cond:
+            return {
+                "path": self.path,
+                "batches": self._batches,
+                "writes": self._writes,
+                "errors": self._errors,
+                "pending": len(self._pending) + int(self._clear_pending),
+            }
@@ -0,0 +1,123 @@
+from typing import Any
+
+import cv2
+import numpy as np
+
+# Ảnh xám dùng cho optical flow: thu nhỏ về cạnh dài này (mặt webcam vẫn đủ góc/điểm đặc trưng).
+TRACK_MAX_SIDE = 320
+
+_LK_PARAMS: dict[str, Any] = dict(
+    winSize=(15, 15),
+    maxLevel=2,
+    criteria=(cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 10, 0.03),
+)
+
+
+def tracking_gray(frame_bgr: np.ndarray, max_side: int = TRACK_MAX_SIDE) -> tuple[np.ndarray, float]:
+    """Frame BGR -> (ảnh xám thu nhỏ, scale so với frame gốc)."""
+    gray = cv2.cvtColor(frame_bgr, cv2.COLOR_BGR2GRAY)
+    h, w = gray.shape[:2]
+    scale = 1.0
+    if max_side > 0 and max(h, w) > max_side:
+        scale = max_side / float(max(h, w))
+        gray = cv2.resize(gray, (max(1, int(round(w * scale))), max(1, int(round(h * scale)))), interpolation=cv2.INTER_AREA)
+    return gray, scale
+
+
+def _propagate_one(
+    prev_gray: np.ndarray, gray: np.ndarray, box: np.ndarray, min_points: int, fb_max_px: float
+) -> tuple[np.ndarray, float]:
+    h, w = prev_gray.shape[:2]
+    x1, y1, x2, y2 = box[:4]
+    # ROI = vùng giữa box (bỏ viền dễ dính nền/tóc).
+    mx, my = 0.15 * (x2 - x1), 0.10 * (y2 - y1)
+    rx1, ry1 = int(max(0, x1 + mx)), int(max(0, y1 + my))
+    rx2, ry2 = int(min(w, x2 - mx)), int(min(h, y2 - my))
+    if rx2 - rx1 < 8 or ry2 - ry1 < 8:
+        return box, 0.0
+
+    mask = np.zeros_like(prev_gray)
+    mask[ry1:ry2, rx1:rx2] = 255
+    p0 = cv2.goodFeaturesToTrack(prev_gray, maxCorners=40, qualityLevel=0.01, minDistance=3, mask=mask)
+    if p0 is None or len(p0) < min_points:
+        return box, 0.0
+
+    p1, st1, _ = cv2.calcOpticalFlowPyrLK(prev_gray, gray, p0, None, **_LK_PARAMS)
+    if p1 is None:
+        return box, 0.0
+    # Forward-backward check: bỏ điểm không quay về đúng chỗ cũ.
+    p0r, st0, _ = cv2.calcOpticalFlowPyrLK(gray, prev_gray, p1, None, **_LK_PARAMS)
+    if p0r is None:
+        return box, 0.0
+    fb = np.linalg.norm((p0 - p0r).reshape(-1, 2), axis=1)
+    good = (st1.reshape(-1) == 1) & (st0.reshape(-1) == 1) & (fb < fb_max_px)
+    n_good = int(good.sum())
+    if n_good < min_points:
+        return box, 0.0
+
+    a = p0.reshape(-1, 2)[good]
+    b = p1.reshape(-1, 2)[good]
+    dx, dy = np.median(b - a, axis=0)
+
+    # Scale = median tỉ lệ khoảng cách từng cặp điểm (ổn định khi thí sinh tiến/lùi).
+    s = 1.0
+    if n_good >= 3:
+        i, j = np.triu_indices(n_good, k=1)
+        d0 = np.linalg.norm(a[i] - a[j], axis=1)
+        d1 = np.linalg.norm(b[i] - b[j], axis=1)
+        ok = d0 > 1.0
+        if ok.any():
+            s = float(np.clip(np.median(d1[ok] / d0[ok]), 0.8, 1.25))
+
+    cx, cy = 0.5 * (x1 + x2) + dx, 0.5 * (y1 + y2) + dy
+    hw, hh = 0.5 * (x2 - x1) * s, 0.5 * (y2 - y1) * s
+    out = np.array([cx - hw, cy - hh, cx + hw, cy + hh], dtype=np.float32)
+    out[0::2] = np.clip(out[0::2], 0, w)
+    out[1::2] = np.clip(out[1::2], 0, h)
+    if out[2] - out[0] < 2 or out[3] - out[1] < 2:
+        return box, 0.0
+    return out, n_good / float(len(p0))
+
+
+def propagate_boxes(
+    prev_gray: np.ndarray,
+    gray: np.ndarray,
+    boxes: np.ndarray,
+    scale: float,
+    min_points: int = 6,
+    fb_max_px: float = 1.5,
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Dời bbox (toạ độ frame gốc) từ prev_gray sang gray bằng Lucas-Kanade thưa trên vùng mặt.
+    Trả (boxes mới, confidence 0..1 mỗi box = tỉ lệ điểm qua forward-backward check);
+    box không theo được giữ nguyên với confidence 0.
+    """
+    if boxes.size == 0 or prev_gray.shape != gray.shape:
+        return boxes, np.zeros((int(boxes.shape[0]),), dtype=np.float32)
+    out = boxes.astype(np.float32).copy()
+    conf = np.zeros((int(boxes.shape[0]),), dtype=np.float32)
+    for k in range(int(boxes.shape[0])):
+        small = boxes[k, :4].astype(np.float32) * scale
+        moved, c = _propagate_one(prev_gray, gray, small, min_points, fb_max_px)
+        if c > 0.0:
+            out[k, :4] = moved / scale
+            conf[k] = c
+    return out, conf
+
+
+def motion_energy(prev_gray: np.ndarray, gray: np.ndarray, boxes: np.ndarray, scale: float) -> float:
+    """
+    Trung bình |gray - prev_gray| (mức xám 0..255) ngoài các bbox mặt đã biết (toạ độ frame gốc).
+    Chuyển động bên trong bbox do tracker lo; năng lượng bên ngoài tăng khi có người/vật mới vào khung hình.
+    """
+    if prev_gray.shape != gray.shape:
+        return float("inf")
+    diff = cv2.absdiff(prev_gray, gray)
+    mask = np.ones(diff.shape[:2], dtype=bool)
+    h, w = diff.shape[:2]
+    for box in boxes:
+        x1, y1, x2, y2 = (np.asarray(box[:4], dtype=np.float32) * scale).tolist()
+        mask[int(max(0, y1)):int(min(h, y2)), int(max(0, x1)):int(min(w, x2))] = False
+    if not mask.any():
+        return 0.0
+    return float(diff[mask].mean())
@@ -0,0 +1,257 @@
+import multiprocessing as mp
+import os
+import queue
+import threading
+from multiprocessing.shared_memory import SharedMemory
+from typing import Any
+
+import numpy as np
+import torch
+
+from l2cs import Pipeline
+
+
+def _worker_main(conn: Any, shm_name: str, cfg: dict[str, Any]) -> None:
+    """
+    Tiến trình suy luận: load Pipeline với trọng số mmap (các worker dùng chung page cache của file),
+    nhận input qua shared memory, trả kết quả nhỏ (box / pitch-yaw) qua pipe.
+    """
+    shm: SharedMemory | None = None
+    try:
+        pipeline = Pipeline(
+            weights=cfg["weights"],
+            arch=cfg["arch"],
+            device=torch.device(cfg["device"]),
+            include_detector=True,
+            confidence_threshold=float(cfg["confidence_threshold"]),
+            mmap_weights=True,
+            input_size=int(cfg["input_size"]),
+            backend=cfg["backend"],
+            backend_path=cfg["backend_path"],
+            channels_last=bool(cfg["channels_last"]),
+            bf16=bool(cfg["bf16"]),
+            num_threads=max(1, int(cfg["num_threads"])),
+        )
+        shm = SharedMemory(name=shm_name)
+    except Exception as e:  # noqa: BLE001
+        conn.send(("error", f"Failed to load model: {e}"))
+        return
+    conn.send(("ready", os.getpid()))
+
+    while True:
+        try:
+            msg = conn.recv()
+        except EOFError:
+            break
+        if msg is None:
+            break
+        op, shape, dtype, inline = msg
+        arr = inline if inline is not None else np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf)
+        try:
+            with torch.inference_mode():
+                if op == "gaze":
+                    pitch, yaw = pipeline.predict_gaze(arr)
+                    result: Any = (np.asarray(pitch), np.asarray(yaw))
+                elif op == "detect":
+                    faces = pipeline.detector(arr if arr.ndim == 3 else list(arr))
+                    result = _plain_faces(faces, batched=arr.ndim == 4)
+                else:
+                    raise ValueError(f"Unknown op {op!r}")
+            conn.send(("ok", result))
+        except Exception as e:  # noqa: BLE001
+            conn.send(("error", repr(e)))
+        finally:
+            del arr
+    shm.close()
+
+
+def _plain_faces(faces: Any, batched: bool) -> Any:
+    """Kết quả RetinaFace -> tuple numpy thuần (pickle gọn qua pipe)."""
+    def one(fs: Any) -> list[tuple[np.ndarray, np.ndarray, float]]:
+        if fs is None:
+            return []
+        return [(np.asarray(b, dtype=np.float32), np.asarray(l, dtype=np.float32), float(s)) for b, l, s in fs]
+
+    return [one(fs) for fs in faces] if batched else one(faces)
+
+
+class _WorkerHandle:
+    def __init__(self, process: Any, conn: Any, shm: SharedMemory):
+        self.process = process
+        self.conn = conn
+        self.shm = shm
+
+
+class InferenceWorkerPool:
+    """
+    K tiến trình suy luận đứng sau api_server. Có cùng các thuộc tính Pipeline mà server dùng
+    (predict_gaze, detector, include_detector, confidence_threshold, input_size) nên thay thế trực tiếp Pipeline.
+
+    Input (crop / frame) được ghi thẳng vào vùng shared memory riêng của từng worker thay vì pickle;
+    input lớn hơn slot mới gửi qua pipe.
+    """
+
+    include_detector = True
+    # Chu kỳ kiểm tra lại pool khi đang chờ worker rảnh (worker cuối chết / spawn lỗi trong lúc chờ).
+    _WAIT_POLL_SEC = 0.5
+
+    def __init__(
+        self,
+        num_workers: int,
+        weights: str,
+        arch: str,
+        device: str,
+        confidence_threshold: float,
+        num_threads: int,
+        slot_bytes: int,
+        start_timeout_sec: float = 300.0,
+        call_timeout_sec: float = 60.0,
+        input_size: int = 448,
+        backend: str = "eager",
+        backend_path: str | None = None,
+        channels_last: bool = False,
+        bf16: bool = False,
+    ):
+        self.num_workers = max(1, int(num_workers))
+        self.confidence_threshold = float(confidence_threshold)
+        self.input_size = int(input_size)
+        self.slot_bytes = max(1, int(slot_bytes))
+        self.start_timeout_sec = float(start_timeout_sec)
+        # Worker không trả lời sau chừng này giây (treo) thì bị kill và thay; <= 0 = chờ không giới hạn.
+        self.call_timeout_sec = float(call_timeout_sec)
+        self._cfg = {
+            "weights": weights,
+            "arch": arch,
+            "device": device,
+            "confidence_threshold": confidence_threshold,
+            "num_threads": num_threads,
+            "input_size": self.input_size,
+            "backend": backend,
+            "backend_path": backend_path,
+            "channels_last": channels_last,
+            "bf16": bf16,
+        }
+        self._ctx = mp.get_context("spawn")
+        self._free: "queue.Queue[_WorkerHandle]" = queue.Queue()
+        self._handles: list[_WorkerHandle] = []
+        self._lock = threading.Lock()
+        # Số worker đang spawn lại (ngoài lock) — khi đó _handles rỗng chưa có nghĩa là hết worker.
+        self._respawning = 0
+        self._closed = False
+        try:
+            for _ in range(self.num_workers):
+                h = self._spawn()
+                self._handles.append(h)
+                self._free.put(h)
+        except Exception:
+            self.close()
+            raise
+
+    def _spawn(self) -> _WorkerHandle:
+        shm = SharedMemory(create=True, size=self.slot_bytes)
+        parent_conn, child_conn = self._ctx.Pipe()
+        proc = self._ctx.Process(
+            target=_worker_main, args=(child_conn, shm.name, self._cfg), name="l2cs-worker", daemon=True
+        )
+        proc.start()
+        child_conn.close()
+        h = _WorkerHandle(proc, parent_conn, shm)
+        if not parent_conn.poll(self.start_timeout_sec):
+            self._terminate(h)
+            raise RuntimeError("Inference worker did not start in time")
+        status, payload = parent_conn.recv()
+        if status != "ready":
+            self._terminate(h)
+            raise RuntimeError(str(payload))
+        return h
+
+    def _terminate(self, h: _WorkerHandle) -> None:
+        try:
+            h.conn.send(None)
+        except (OSError, ValueError):
+            pass
+        h.process.join(timeout=2.0)
+        if h.process.is_alive():
+            h.process.kill()
+        h.conn.close()
+        h.shm.close()
+        h.shm.unlink()
+
+    def _acquire(self) -> _WorkerHandle:
+        while True:
+            with self._lock:
+                if not self._handles and self._respawning == 0:
+                    # Mọi worker đã chết và không spawn lại được: báo lỗi thay vì chờ mãi trên _free.
+                    raise RuntimeError("No inference worker available")
+            try:
+                return self._free.get(timeout=self._WAIT_POLL_SEC)
+            except queue.Empty:
+                continue
+
+    def _call(self, op: str, arr: np.ndarray) -> Any:
+        h = self._acquire()
+        try:
+            if arr.nbytes <= self.slot_bytes:
+                np.ndarray(arr.shape, dtype=arr.dtype, buffer=h.shm.buf)[...] = arr
+                h.conn.send((op, arr.shape, arr.dtype.str, None))
+            else:
+                h.conn.send((op, arr.shape, arr.dtype.str, arr))
+            ready = h.conn.poll(self.call_timeout_sec if self.call_timeout_sec > 0 else None)
+            if ready:
+                status, payload = h.conn.recv()
+        except (EOFError, OSError) as e:
+            # Worker chết: thay bằng tiến trình mới rồi báo lỗi cho request hiện tại. Chỉ handle mới (khoẻ)
+            # quay lại _free; spawn lỗi thì handle chết đã bị bỏ khỏi pool.
+            self._free.put(self._replace(h))
+            raise RuntimeError(f"Inference worker crashed: {e}") from e
+        except BaseException:
+            self._free.put(h)
+            raise
+        if not ready:
+            # Worker còn sống nhưng treo (vd. deadlock trong torch / RetinaFace): kill và thay như khi crash.
+            self._free.put(self._replace(h))
+            raise RuntimeError(f"Inference worker did not answer within {self.call_timeout_sec:g}s")
+        self._free.put(h)
+        if status != "ok":
+            raise RuntimeError(str(payload))
+        return payload
+
+    def _replace(self, dead: _WorkerHandle) -> _WorkerHandle:
+        # Spawn (load model, tới start_timeout_sec) ngoài lock: các worker khoẻ vẫn nhận request trong lúc đó.
+        with self._lock:
+            self._handles = [x for x in self._handles if x is not dead]
+            self._respawning += 1
+        try:
+            try:
+                self._terminate(dead)
+            except OSError:
+                pass
+            h = self._spawn()
+        except BaseException:
+            with self._lock:
+                self._respawning -= 1
+            raise
+        with self._lock:
+            self._respawning -= 1
+            if not self._closed:
+                self._handles.append(h)
+                return h
+        # close() chạy trong lúc spawn: không để lại tiến trình mồ côi.
+        self._terminate(h)
+        raise RuntimeError("Inference worker pool is closed")
+
+    def predict_gaze(self, face_imgs: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        return self._call("gaze", np.ascontiguousarray(face_imgs))
+
+    def detector(self, frames: Any) -> Any:
+        if isinstance(frames, list):
+            # DetectBatcher gửi list frame đã pad về cùng shape.
+            return self._call("detect", np.ascontiguousarray(np.stack(frames)))
+        return self._call("detect", np.ascontiguousarray(frames))
+
+    def close(self) -> None:
+        with self._lock:
+            self._closed = True
+            handles, self._handles = self._handles, []
+        for h in handles:
+            self._terminate(h)
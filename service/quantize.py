@@ -0,0 +1,168 @@
+import argparse
+import glob
+import os
+import time
+
+import cv2
+import numpy as np
+import torch
+
+from l2cs import Gaze360, angular, gazeto3d, getArch
+from l2cs.quantization import INT8_SUFFIX, default_engine, quantize_l2cs
+from l2cs.utils import load_state_dict, prep_input_numpy
+
+
+def parse_args():
+    """Parse input arguments."""
+    parser = argparse.ArgumentParser(
+        description='Post-training static INT8 quantization of L2CS-Net (CPU serving).')
+    parser.add_argument(
+        '--snapshot', dest='snapshot', help='Path of the FP32 model snapshot.',
+        default='models/L2CSNet_gaze360.pkl', type=str)
+    parser.add_argument(
+        '--arch', dest='arch', help='Network architecture: ResNet18, ResNet34, [ResNet50], ResNet101, ResNet152',
+        default='ResNet50', type=str)
+    parser.add_argument(
+        '--calib_dir', dest='calib_dir', help='Folder of face crops (jpg/png) for calibration.',
+        default='datasets/Gaze360/Image', type=str)
+    parser.add_argument(
+        '--num_calib', dest='num_calib', help='Number of crops used for calibration.',
+        default=256, type=int)
+    parser.add_argument(
+        '--num_eval', dest='num_eval', help='Held-out crops for the FP32 vs INT8 comparison.',
+        default=256, type=int)
+    parser.add_argument(
+        '--batch_size', dest='batch_size', help='Batch size.',
+        default=16, type=int)
+    parser.add_argument(
+        '--input_size', dest='input_size', help='Network input resolution (PROCTORING_INPUT_SIZE).',
+        default=448, type=int)
+    parser.add_argument(
+        '--engine', dest='engine', help='Quantized engine: x86, fbgemm, qnnpack (default: best available).',
+        default=None, type=str)
+    parser.add_argument(
+        '--output', dest='output', help='Output checkpoint (default: snapshot name + _int8.pkl).',
+        default=None, type=str)
+    parser.add_argument(
+        '--gaze360label_dir', dest='gaze360label_dir', help='Optional Gaze360 test labels for MAE vs ground truth.',
+        default='datasets/Gaze360/Label/test.label', type=str)
+    parser.add_argument(
+        '--gaze360image_dir', dest='gaze360image_dir', help='Directory path for Gaze360 images.',
+        default='datasets/Gaze360/Image', type=str)
+    return parser.parse_args()
+
+
+def load_crops(paths, input_size):
+    crops = []
+    for path in paths:
+        img = cv2.imread(path)
+        if img is None:
+            continue
+        img = cv2.resize(img, (input_size, input_size))
+        crops.append(cv2.cvtColor(img, cv2.COLOR_BGR2RGB))
+    return np.stack(crops) if len(crops) > 0 else np.empty((0, input_size, input_size, 3), dtype=np.uint8)
+
+
+def batches(crops, batch_size, input_size):
+    for i in range(0, len(crops), batch_size):
+        yield prep_input_numpy(crops[i:i + batch_size], 'cpu', input_size)
+
+
+def predict_angles(model, images):
+    """Same decoding as Pipeline.predict_gaze, in radians."""
+    idx_tensor = torch.arange(90, dtype=torch.float32)
+    with torch.no_grad():
+        gaze_pitch, gaze_yaw = model(images)
+    pitch = torch.sum(torch.softmax(gaze_pitch, dim=1) * idx_tensor, dim=1) * 4 - 180
+    yaw = torch.sum(torch.softmax(gaze_yaw, dim=1) * idx_tensor, dim=1) * 4 - 180
+    return pitch.numpy() * np.pi / 180.0, yaw.numpy() * np.pi / 180.0
+
+
+def mean_angular(a_pitch, a_yaw, b_pitch, b_yaw):
+    errors = [angular(gazeto3d([p, y]), gazeto3d([pl, yl])) for p, y, pl, yl in zip(a_pitch, a_yaw, b_pitch, b_yaw)]
+    return float(np.mean(errors)) if errors else float('nan')
+
+
+def latency_ms(model, input_size, batch_size):
+    img = torch.randn(batch_size, 3, input_size, input_size)
+    times = []
+    with torch.no_grad():
+        for i in range(10):
+            t0 = time.perf_counter()
+            model(img)
+            if i >= 3:
+                times.append((time.perf_counter() - t0) * 1000.0)
+    return float(np.median(times))
+
+
+def gaze360_mae(model, args):
+    from torchvision import transforms
+
+    transformations = transforms.Compose([
+        transforms.Resize(args.input_size),
+        transforms.ToTensor(),
+        transforms.Normalize(
+            mean=[0.485, 0.456, 0.406],
+            std=[0.229, 0.224, 0.225]
+        )
+    ])
+    dataset = Gaze360(args.gaze360label_dir, args.gaze360image_dir, transformations, 180, 4, train=False)
+    loader = torch.utils.data.DataLoader(dataset, batch_size=args.batch_size, shuffle=False, num_workers=4)
+    pitch, yaw, label_pitch, label_yaw = [], [], [], []
+    for images, _labels, cont_labels, _name in loader:
+        p, y = predict_angles(model, images)
+        pitch.append(p)
+        yaw.append(y)
+        label_pitch.append(cont_labels[:, 0].numpy() * np.pi / 180)
+        label_yaw.append(cont_labels[:, 1].numpy() * np.pi / 180)
+    return mean_angular(np.concatenate(pitch), np.concatenate(yaw), np.concatenate(label_pitch), np.concatenate(label_yaw))
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    engine = args.engine or default_engine()
+    output = args.output or args.snapshot.rsplit('.', 1)[0] + '_int8.pkl'
+
+    paths = sorted(
+        glob.glob(os.path.join(args.calib_dir, '**', '*.jpg'), recursive=True)
+        + glob.glob(os.path.join(args.calib_dir, '**', '*.png'), recursive=True)
+    )
+    if len(paths) == 0:
+        raise SystemExit(f"No face crops found in '{args.calib_dir}'")
+    rng = np.random.default_rng(0)
+    paths = [paths[i] for i in rng.permutation(len(paths))]
+    calib = load_crops(paths[:args.num_calib], args.input_size)
+    held_out = load_crops(paths[args.num_calib:args.num_calib + args.num_eval], args.input_size)
+    if len(held_out) == 0:
+        # Small folder: compare on the calibration crops instead.
+        held_out = calib
+    print(f"Calibrating on {len(calib)} crops, comparing on {len(held_out)} ({engine} engine)")
+
+    float_state = load_state_dict(args.snapshot, 'cpu')
+    fp32 = getArch(args.arch, 90)
+    fp32.load_state_dict(float_state)
+    fp32.eval()
+
+    int8 = quantize_l2cs(float_state, args.arch, 90, batches(calib, args.batch_size, args.input_size), engine)
+    torch.save(int8.state_dict(), output)
+    print(f"Saved {output} — load with Pipeline(weights='{output}', arch='{args.arch}{INT8_SUFFIX}')")
+
+    # Accuracy report
+    f_pitch, f_yaw, q_pitch, q_yaw = [], [], [], []
+    for images in batches(held_out, args.batch_size, args.input_size):
+        p, y = predict_angles(fp32, images)
+        f_pitch.append(p)
+        f_yaw.append(y)
+        p, y = predict_angles(int8, images)
+        q_pitch.append(p)
+        q_yaw.append(y)
+    drift = mean_angular(np.concatenate(q_pitch), np.concatenate(q_yaw), np.concatenate(f_pitch), np.concatenate(f_yaw))
+    print(f"Mean angular difference INT8 vs FP32: {drift:.3f} deg")
+
+    if os.path.isfile(args.gaze360label_dir) and os.path.isdir(args.gaze360image_dir):
+        print(f"Gaze360 MAE  FP32: {gaze360_mae(fp32, args):.3f} deg  INT8: {gaze360_mae(int8, args):.3f} deg")
+
+    for batch_size in (1, 8):
+        t_fp32 = latency_ms(fp32, args.input_size, batch_size)
+        t_int8 = latency_ms(int8, args.input_size, batch_size)
+        print(f"batch {batch_size}: FP32 {t_fp32:.1f} ms  INT8 {t_int8:.1f} ms  ({t_fp32 / t_int8:.2f}x)")
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Các module service (api_server, proctoring_*) import phẳng từ thư mục service/.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,373 @@
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+import api_server
+
+app = api_server.app
+
+
+@pytest.fixture(autouse=True)
+def _restore_app_state():
+    # Test chỉnh app.state trực tiếp (không chạy lifespan / không load model); trả lại như cũ sau mỗi test.
+    saved = dict(app.state._state)
+    yield
+    app.state._state.clear()
+    app.state._state.update(saved)
+
+
+@pytest.fixture
+def client():
+    return TestClient(app)
+
+
+def test_frame_upload_without_body_is_no_frame(client):
+    r = client.post("/gaze/estimate/frame", content=b"", headers={"X-Student-Id": "SV01"})
+    assert r.status_code == 200
+    assert r.json()["violation_type"] == "no_frame"
+
+
+def test_frame_upload_validates_student_id_and_annotate(client):
+    assert client.post("/proctoring/enroll/frame", content=b"x").status_code == 422
+    r = client.post("/gaze/estimate/frame", content=b"x", headers={"X-Student-Id": "S" * 65})
+    assert r.status_code == 422
+    assert client.post("/gaze/estimate/frame?annotate=sometimes", content=b"x").status_code == 422
+
+
+def test_frame_upload_without_model_is_503(client):
+    app.state.gaze_pipeline = None
+    app.state.gaze_load_error = "not loaded"
+    r = client.post("/gaze/estimate/frame", content=b"\xff\xd8jpeg", headers={"X-Student-Id": "SV01"})
+    assert r.status_code == 503
+
+
+def test_ws_rejects_invalid_student_id(client):
+    from starlette.websockets import WebSocketDisconnect
+
+    with pytest.raises(WebSocketDisconnect) as exc:
+        with client.websocket_connect("/ws/proctoring/" + "S" * 65) as ws:
+            ws.receive_json()
+    assert exc.value.code == 1008
+
+
+def test_ws_verdict_is_compact_and_carries_snapshot_only_on_violation():
+    face = {"id": "SV01", "bbox": [1.0, 2.0, 3.0, 4.0], "theta": 0.1, "score": 0.9, "draw_gaze_arrow": True}
+    ok = api_server.GazeEstimateResponse(faces=[face], faces_count=1, annotated_image_base64="img")
+    out = api_server._ws_verdict(ok, dropped=2)
+    assert out["faces"] == [{"id": "SV01", "bbox": [1.0, 2.0, 3.0, 4.0], "theta": 0.1}]
+    assert out["dropped"] == 2
+    assert "annotated_image_base64" not in out
+    bad = api_server.GazeEstimateResponse(violation=True, violation_type="no_face", annotated_image_base64="img")
+    assert api_server._ws_verdict(bad, dropped=0)["annotated_image_base64"] == "img"
+
+
+def test_source_jpeg_is_returned_as_is_instead_of_reencoding():
+    jpeg = b"\xff\xd8\xff\xe0rest"
+    assert api_server._source_jpeg_base64(jpeg, "given-b64") == "given-b64"
+    assert api_server._source_jpeg_base64(jpeg, None) == "/9j/4HJlc3Q="
+    # PNG (hoặc không có nguồn) phải encode lại từ frame.
+    assert api_server._source_jpeg_base64(b"\x89PNG....", None) is None
+    assert api_server._source_jpeg_base64(None, None) is None
+
+
+def test_annotate_mode_is_validated(client):
+    r = client.post("/gaze/estimate", json={"image_base64": "", "annotate": "sometimes"})
+    assert r.status_code == 422
+    r = client.post("/gaze/estimate", json={"image_base64": "", "annotate": "never"})
+    assert r.json()["annotated_image_base64"] is None
+
+
+def test_saturated_executor_maps_to_429_with_retry_after():
+    import asyncio
+
+    from fastapi import HTTPException
+
+    from proctoring_executor import BoundedInferenceExecutor
+
+    class _Full(BoundedInferenceExecutor):
+        def _try_acquire(self):
+            return False
+
+    app.state.inference_executor = _Full(workers=1, max_queue=0)
+    app.state.retry_after_sec = 3
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(api_server._run_inference(lambda: None, path="gaze_estimate"))
+    assert exc.value.status_code == 429
+    assert exc.value.headers == {"Retry-After": "3"}
+
+
+class _CountingPipeline:
+    input_size = 64
+
+    def __init__(self):
+        self.calls = 0
+
+    def predict_gaze(self, crops):
+        self.calls += 1
+        n = len(crops)
+        return np.full(n, 0.1 * self.calls), np.full(n, -0.1 * self.calls)
+
+
+def test_gaze_cache_reuses_result_until_crop_changes():
+    from proctoring_cache import CacheStats
+    from proctoring_state import SessionRegistry
+
+    registry = SessionRegistry(num_shards=1)
+    with registry.session("SV01") as sess:
+        sess.last_ids = [1, 2]
+    app.state.gaze_batcher = None
+    app.state.gaze_cache_max_age_sec = 60.0
+    app.state.gaze_cache_max_diff = 2.5
+    app.state.gaze_cache_stats = stats = CacheStats()
+    pipe = _CountingPipeline()
+    rng = np.random.default_rng(0)
+    frame = rng.integers(0, 256, (120, 160, 3), dtype=np.uint8)
+    bb = [40.0, 20.0, 100.0, 80.0]
+
+    first = api_server._cached_gaze(pipe, registry, "SV01", 1, frame, bb)
+    assert api_server._cached_gaze(pipe, registry, "SV01", 1, frame, bb) == first
+    assert pipe.calls == 1
+    # Track khác không dùng chung kết quả; crop đổi thì tính lại.
+    api_server._cached_gaze(pipe, registry, "SV01", 2, frame, bb)
+    changed = rng.integers(0, 256, frame.shape, dtype=np.uint8)
+    assert api_server._cached_gaze(pipe, registry, "SV01", 1, changed, bb) != first
+    assert pipe.calls == 3
+    assert stats.stats()["miss_reasons"] == {"changed": 1, "cold": 2}
+    # Track không còn trong last_ids bị bỏ khỏi cache ở lần ghi sau.
+    with registry.session("SV01") as sess:
+        sess.last_ids = [1]
+    api_server._cached_gaze(pipe, registry, "SV01", 1, frame, bb)
+    with registry.session("SV01") as sess:
+        assert set(sess.gaze_cache) == {1}
+
+    app.state.gaze_cache_max_age_sec = 0.0
+    api_server._cached_gaze(pipe, registry, "SV01", 1, changed, bb)
+    assert pipe.calls == 5
+
+
+def test_identity_score_reused_between_detections_while_box_holds():
+    from proctoring_identity import IdentityStore
+    from proctoring_state import SessionRegistry
+
+    class CountingStore(IdentityStore):
+        scored = 0
+
+        def similarities(self, key, descriptors):
+            CountingStore.scored += len(descriptors)
+            return super().similarities(key, descriptors)
+
+    rng = np.random.default_rng(0)
+    frame = rng.integers(0, 256, (120, 160, 3), dtype=np.uint8)
+    bb = [40.0, 20.0, 100.0, 80.0]
+    app.state.gaze_pipeline = _CountingPipeline()
+    app.state.gaze_batcher = None
+    app.state.sessions = registry = SessionRegistry(num_shards=1)
+    app.state.identity_store = store = CountingStore()
+    app.state.enrollment_store = None
+    descs, _ = api_server._face_descriptors(frame, [bb])
+    store.enroll("sv01", descs[0])
+    with registry.session("sv01", student_id="SV01") as sess:
+        sess.enrolled_samples = 1
+
+    detections = [(np.array(bb), np.zeros((5, 2)), 0.99)]
+    first = api_server._gaze_estimate_frame(frame, "SV01", annotate="never", detections=detections)
+    assert first.faces_count == 1 and CountingStore.scored == 1
+    # Frame tĩnh, không detect: box giữ nguyên -> dùng lại độ khớp đã cache.
+    api_server._gaze_estimate_frame(frame, "SV01", annotate="never")
+    assert CountingStore.scored == 1
+    # Enroll lại (phiên bản đổi) -> tính lại.
+    with registry.session("sv01") as sess:
+        sess.enrolled_samples = 2
+    api_server._gaze_estimate_frame(frame, "SV01", annotate="never")
+    assert CountingStore.scored == 2
+    # Frame detect luôn tính lại.
+    api_server._gaze_estimate_frame(frame, "SV01", annotate="never", detections=detections)
+    assert CountingStore.scored == 3
+
+
+def test_evicted_enrollment_restored_once_from_store(tmp_path):
+    from proctoring_identity import IdentityStore
+    from proctoring_state import SessionRegistry
+    from proctoring_store import EnrollmentStore
+
+    app.state.sessions = registry = SessionRegistry(num_shards=1)
+    app.state.identity_store = identity = IdentityStore(dim=8)
+    app.state.enrollment_store = store = EnrollmentStore(str(tmp_path / "enroll.sqlite3"))
+    identity.enroll("sv01", np.ones(8, np.float32))
+    identity.enroll("sv01", np.ones(8, np.float32))
+    api_server._persist_enrollment("sv01", "SV01", {"step": 3, "gaze_ok_since": 12.5})
+
+    # Hết hạn idle: bộ nhớ mất, bản lưu còn.
+    registry.remove("sv01")
+    identity.remove("sv01")
+    api_server._restore_evicted_enrollment("sv01")
+    with registry.session("sv01") as sess:
+        assert (sess.student_id, sess.enrolled_samples) == ("SV01", 2)
+        assert sess.enroll_seq == {"step": 3, "gaze_ok_since": None}
+    assert identity.export("sv01")[1] == 2
+
+    # Key chưa từng enroll: chỉ tra DB một lần cho mỗi session.
+    api_server._restore_evicted_enrollment("sv02")
+    store.put(api_server.EnrollmentRecord("sv02", "SV02", 1, np.ones(8, np.float32), None))
+    api_server._restore_evicted_enrollment("sv02")
+    assert "sv02" not in identity
+
+    # Mô tả khác số chiều (phiên bản cũ) bị bỏ khỏi DB.
+    store.put(api_server.EnrollmentRecord("sv03", "SV03", 1, np.ones(4, np.float32), None))
+    api_server._restore_evicted_enrollment("sv03")
+    assert "sv03" not in identity and store.get("sv03") is None
+
+
+def _textured_jpeg_b64(seed: int = 0) -> str:
+    import base64
+
+    import cv2
+
+    rng = np.random.default_rng(seed)
+    frame = cv2.GaussianBlur(rng.integers(0, 256, (240, 320, 3), dtype=np.uint8), (5, 5), 0)
+    ok, buf = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, 95])
+    assert ok
+    return base64.b64encode(buf.tobytes()).decode("ascii")
+
+
+class _DetectingPipeline(_CountingPipeline):
+    include_detector = True
+    confidence_threshold = 0.5
+
+    def __init__(self):
+        super().__init__()
+        self.detects = 0
+        self.crops = 0
+
+    def detector(self, frame):
+        self.detects += 1
+        return [(np.array([80.0, 40.0, 200.0, 180.0]), np.zeros((5, 2)), 0.99)]
+
+    def predict_gaze(self, crops):
+        self.crops += len(crops)
+        return super().predict_gaze(crops)
+
+
+def _tick_state():
+    from proctoring_identity import IdentityStore
+    from proctoring_state import SessionRegistry
+
+    app.state.gaze_pipeline = pipe = _DetectingPipeline()
+    app.state.gaze_load_error = None
+    app.state.inference_executor = None
+    app.state.gaze_batcher = None
+    app.state.detect_batcher = None
+    app.state.enrollment_store = None
+    app.state.dup_max_reuse = 0
+    app.state.sessions = SessionRegistry(num_shards=1)
+    app.state.identity_store = IdentityStore()
+    return pipe
+
+
+def test_tick_enrolls_and_estimates_with_one_detect_and_one_gaze(client):
+    pipe = _tick_state()
+    r = client.post("/proctoring/tick", json={"image_base64": _textured_jpeg_b64(), "student_id": "SV01"})
+    assert r.status_code == 200
+    body = r.json()
+    assert body["enroll"]["enrolled"] is True
+    assert body["faces_count"] == 1
+    assert (pipe.detects, pipe.crops) == (1, 1)
+    assert "sv01" in app.state.identity_store
+
+
+def test_tick_without_enroll_is_a_plain_estimate(client):
+    pipe = _tick_state()
+    payload = {"image_base64": _textured_jpeg_b64(), "student_id": "SV01", "enroll": False}
+    body = client.post("/proctoring/tick", json=payload).json()
+    assert body["enroll"] is None
+    assert pipe.detects == 1
+    assert "sv01" not in app.state.identity_store
+
+
+def _capture_state(load: float | None = None):
+    app.state.capture_base_ms = 500
+    app.state.capture_min_ms = 250
+    app.state.capture_max_ms = 1500
+    app.state.capture_ramp_sec = 10.0
+    app.state.inference_executor = None
+    if load is not None:
+
+        class _Loaded:
+            def load(self):
+                return load
+
+        app.state.inference_executor = _Loaded()
+
+
+def test_next_capture_ramps_up_while_calm_and_resets_on_activity():
+    from proctoring_state import SessionState
+
+    _capture_state()
+    sess = SessionState("sv01")
+    assert api_server._next_capture_ms(sess, 100.0, calm=True) == 500
+    assert api_server._next_capture_ms(sess, 105.0, calm=True) == 1000
+    assert api_server._next_capture_ms(sess, 130.0, calm=True) == 1500
+    assert api_server._next_capture_ms(sess, 131.0, calm=False) == 500
+    assert sess.calm_since is None
+    assert api_server._next_capture_ms(sess, 132.0, calm=True) == 500
+
+
+def test_next_capture_is_min_while_a_dwell_timer_runs():
+    from proctoring_state import SessionState
+
+    _capture_state()
+    sess = SessionState("sv01")
+    sess.no_face_since = 10.0
+    assert api_server._next_capture_ms(sess, 11.0, calm=True) == 250
+    # Đã báo vi phạm: không còn mốc nào đang chờ.
+    sess.no_face_emitted = True
+    assert api_server._next_capture_ms(sess, 12.0, calm=False) == 500
+
+
+def test_next_capture_backs_off_when_executor_is_busy():
+    from proctoring_state import SessionState
+
+    _capture_state(load=0.5)
+    assert api_server._next_capture_ms(SessionState("sv01"), 1.0, calm=False) == 500
+    _capture_state(load=1.0)
+    assert api_server._next_capture_ms(SessionState("sv01"), 1.0, calm=False) == 1000
+    # Trần 2x MAX.
+    sess = SessionState("sv01")
+    api_server._next_capture_ms(sess, 0.0, calm=True)
+    assert api_server._next_capture_ms(sess, 100.0, calm=True) == 3000
+
+
+def test_near_duplicate_frames_reuse_the_last_observation(client):
+    from proctoring_cache import CacheStats
+
+    pipe = _tick_state()
+    app.state.dup_max_reuse = 2
+    app.state.dup_max_age_sec = 60.0
+    app.state.dup_max_diff = 1.0
+    app.state.dup_frame_stats = stats = CacheStats()
+    payload = {"image_base64": _textured_jpeg_b64(), "student_id": "SV01"}
+
+    bodies = [client.post("/gaze/estimate", json=payload).json() for _ in range(4)]
+    assert pipe.detects == 1
+    assert all(b["faces_count"] == bodies[0]["faces_count"] for b in bodies)
+    # Frame 1 lạnh, 2-3 dùng lại, 4 vượt PROCTORING_DUP_MAX_REUSE -> xử lý đầy đủ.
+    assert stats.stats()["hits"] == 2
+    assert stats.stats()["miss_reasons"] == {"cold": 1, "max_reuse": 1}
+
+    client.post("/gaze/estimate", json={**payload, "image_base64": _textured_jpeg_b64(seed=1)})
+    assert stats.stats()["miss_reasons"]["changed"] == 1
+
+
+def test_metrics_endpoint_renders_prometheus_text(client):
+    from proctoring_metrics import ServiceMetrics
+
+    _tick_state()
+    app.state.metrics = ServiceMetrics()
+    client.post("/proctoring/tick", json={"image_base64": _textured_jpeg_b64(), "student_id": "SV01"})
+    r = client.get("/metrics")
+    assert r.status_code == 200
+    assert r.headers["content-type"].startswith("text/plain")
+    text = r.text
+    assert "proctoring_active_sessions 1" in text
+    assert 'proctoring_stage_seconds_count{path="other",stage="detect"} 1' in text
+    assert "# TYPE proctoring_request_seconds histogram" in text
@@ -0,0 +1,26 @@
+import pytest
+import torch
+
+from l2cs import getArch
+from l2cs.backends import export_torchscript, load_backend
+
+
+def test_torchscript_export_matches_eager_for_any_batch(tmp_path):
+    torch.manual_seed(0)
+    model = getArch("ResNet18", 90).eval()
+    path = export_torchscript(model, tmp_path / "l2cs.pt", input_size=64)
+    traced = load_backend("torchscript", path)
+
+    # Trace với batch 1, chạy lại với batch 3.
+    x = torch.randn(3, 3, 64, 64)
+    with torch.no_grad():
+        ref = model(x)
+        out = traced(x)
+    for a, b in zip(out, ref):
+        assert a.shape == (3, 90)
+        torch.testing.assert_close(a, b, atol=1e-4, rtol=1e-4)
+
+
+def test_load_backend_rejects_unknown_backend(tmp_path):
+    with pytest.raises(ValueError, match="Unknown backend"):
+        load_backend("tensorrt", tmp_path / "l2cs.plan")
@@ -0,0 +1,35 @@
+import numpy as np
+import pytest
+import torch
+
+from l2cs import Pipeline, getArch
+
+
+@pytest.fixture(scope="module")
+def weights(tmp_path_factory):
+    torch.manual_seed(0)
+    path = tmp_path_factory.mktemp("l2cs") / "resnet18.pkl"
+    torch.save(getArch("ResNet18", 90).state_dict(), path)
+    return path
+
+
+def _pipeline(weights, **kwargs):
+    return Pipeline(weights=weights, arch="ResNet18", device=torch.device("cpu"), include_detector=False, input_size=64, **kwargs)
+
+
+def test_channels_last_converts_conv_weights(weights):
+    pipe = _pipeline(weights, channels_last=True)
+    assert pipe.model.conv1.weight.is_contiguous(memory_format=torch.channels_last)
+
+
+def test_channels_last_keeps_mmap_weights_shared(weights):
+    pipe = _pipeline(weights, channels_last=True, mmap_weights=True)
+    # Không chuyển layout -> tensor vẫn là view của file mmap, không có bản sao riêng.
+    assert pipe.model.conv1.weight.is_contiguous()
+    assert not pipe.model.conv1.weight.is_contiguous(memory_format=torch.channels_last)
+
+    crops = np.random.default_rng(0).integers(0, 256, (2, 64, 64, 3), dtype=np.uint8)
+    pitch, yaw = pipe.predict_gaze(crops)
+    ref_pitch, ref_yaw = _pipeline(weights).predict_gaze(crops)
+    np.testing.assert_allclose(pitch, ref_pitch, atol=1e-4)
+    np.testing.assert_allclose(yaw, ref_yaw, atol=1e-4)
@@ -0,0 +1,32 @@
+import torch
+
+from l2cs import getArch
+from l2cs.quantization import base_arch, is_quantized_arch, quantize_l2cs, quantized_arch
+
+
+def test_arch_suffix_helpers():
+    assert is_quantized_arch("ResNet50-int8")
+    assert not is_quantized_arch("ResNet50")
+    assert base_arch("ResNet50-int8") == "ResNet50"
+    assert base_arch("ResNet50") == "ResNet50"
+
+
+def test_quantized_model_tracks_float_and_reloads():
+    torch.manual_seed(0)
+    fp32 = getArch("ResNet18", 90).eval()
+    calibration = [torch.randn(2, 3, 64, 64) for _ in range(4)]
+    int8 = quantize_l2cs(fp32.state_dict(), "ResNet18", 90, calibration)
+
+    x = torch.randn(2, 3, 64, 64)
+    with torch.no_grad():
+        ref_yaw, ref_pitch = fp32(x)
+        yaw, pitch = int8(x)
+    assert yaw.shape == pitch.shape == (2, 90)
+    # Head vẫn FP32; sai số chỉ đến từ backbone INT8.
+    assert torch.corrcoef(torch.stack([yaw.flatten(), ref_yaw.flatten()]))[0, 1] > 0.9
+
+    # Checkpoint INT8 nạp lại được vào khung rỗng của quantized_arch.
+    reloaded = quantized_arch("ResNet18", 90)
+    reloaded.load_state_dict(int8.state_dict())
+    with torch.no_grad():
+        torch.testing.assert_close(reloaded(x)[0], yaw)
@@ -0,0 +1,60 @@
+import numpy as np
+
+from l2cs.utils import rescale_faces, resize_for_detection
+
+
+def test_resize_for_detection_keeps_aspect_and_reports_scale():
+    frame = np.zeros((720, 1280, 3), dtype=np.uint8)
+    small, scale = resize_for_detection(frame, 480)
+    assert small.shape[:2] == (270, 480)
+    assert scale == 1280 / 480
+    same, scale1 = resize_for_detection(frame, 0)
+    assert same is frame and scale1 == 1.0
+    same, scale1 = resize_for_detection(frame, 2000)
+    assert same is frame and scale1 == 1.0
+
+
+def test_rescale_faces_maps_boxes_and_landmarks_back():
+    faces = [(np.array([10, 20, 30, 40], dtype=np.float32), np.ones((5, 2), dtype=np.float32), 0.9)]
+    (box, landmarks, score), = rescale_faces(faces, 2.5)
+    assert box.tolist() == [25, 50, 75, 100]
+    assert np.all(landmarks == 2.5)
+    assert score == 0.9
+    assert rescale_faces(None, 2.0) == []
+    assert rescale_faces(faces, 1.0) == faces
+
+
+def test_crop_faces_returns_rgb_crops_at_input_size():
+    from l2cs.utils import crop_faces
+
+    frame = np.zeros((100, 100, 3), dtype=np.uint8)
+    frame[..., 0] = 255  # BGR: xanh dương
+    crops, kept = crop_faces(frame, [[10, 10, 50, 60], [200, 200, 300, 300], [0, 0, 100, 100]], input_size=64)
+    assert kept == [0, 2]
+    assert crops.shape == (2, 64, 64, 3)
+    assert np.all(crops[..., 2] == 255) and np.all(crops[..., 0] == 0)
+
+
+def test_prep_input_numpy_matches_pil_transform():
+    import torch
+
+    from l2cs.utils import prep_input_numpy, transformations
+
+    rng = np.random.default_rng(0)
+    crops = rng.integers(0, 256, (3, 448, 448, 3), dtype=np.uint8)
+    ref = torch.stack([transformations(c) for c in crops])
+    out = prep_input_numpy(crops, "cpu", 448)
+    assert out.shape == ref.shape == (3, 3, 448, 448)
+    torch.testing.assert_close(out, ref, atol=1e-5, rtol=1e-5)
+    # Một ảnh HWC đơn lẻ -> batch 1; channels_last chỉ đổi layout, không đổi giá trị.
+    single = prep_input_numpy(crops[0], "cpu", 448, channels_last=True)
+    assert single.shape == (1, 3, 448, 448)
+    assert single.is_contiguous(memory_format=torch.channels_last)
+    torch.testing.assert_close(single, ref[:1], atol=1e-5, rtol=1e-5)
+
+
+def test_prep_input_numpy_resizes_shorter_side_to_input_size():
+    from l2cs.utils import prep_input_numpy
+
+    out = prep_input_numpy(np.zeros((2, 100, 200, 3), dtype=np.uint8), "cpu", 64)
+    assert out.shape == (2, 3, 64, 128)
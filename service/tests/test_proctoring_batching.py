@@ -0,0 +1,123 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from proctoring_batching import GazeBatcher, MicroBatcher
+
+
+def _fake_predict(calls):
+    def predict(stack):
+        calls.append(int(stack.shape[0]))
+        # pitch = giá trị pixel đầu tiên của từng crop để kiểm tra thứ tự trả về.
+        v = stack[:, 0, 0, 0].astype(np.float32)
+        return v[:, None], -v[:, None]
+    return predict
+
+
+def test_gaze_batcher_returns_each_request_its_own_rows():
+    calls = []
+    batcher = GazeBatcher(_fake_predict(calls), max_batch=16, max_wait_ms=50.0)
+    batcher.start()
+    results = {}
+
+    def go(i):
+        crops = np.full((i % 3 + 1, 4, 4, 3), i, dtype=np.uint8)
+        results[i] = batcher.predict(crops)
+
+    threads = [threading.Thread(target=go, args=(i,)) for i in range(8)]
+    try:
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join(5.0)
+    finally:
+        batcher.stop()
+    for i in range(8):
+        pitch, yaw = results[i]
+        assert pitch.shape == (i % 3 + 1, 1)
+        assert np.all(pitch == i) and np.all(yaw == -i)
+    # Nhiều request được gộp vào ít lần gọi model hơn.
+    assert len(calls) < 8
+    assert batcher.stats()["items"] == sum(i % 3 + 1 for i in range(8))
+
+
+def test_disabled_batcher_runs_inline():
+    calls = []
+    batcher = GazeBatcher(_fake_predict(calls), max_batch=1)
+    batcher.start()
+    pitch, _ = batcher.predict(np.full((2, 4, 4, 3), 7, dtype=np.uint8))
+    assert calls == [2]
+    assert np.all(pitch == 7)
+
+
+class _Slow(MicroBatcher):
+    def _run_batch(self, items):
+        time.sleep(0.2)
+        return items
+
+
+class _Short(MicroBatcher):
+    def _run_batch(self, items):
+        return []
+
+
+def test_stop_fails_items_left_in_queue():
+    batcher = _Slow("slow", max_batch=2)
+    batcher.start()
+    results = {}
+
+    def go(i):
+        try:
+            results[i] = batcher.submit(i)
+        except RuntimeError as e:
+            results[i] = e
+
+    first = threading.Thread(target=go, args=(0,))
+    first.start()
+    time.sleep(0.05)
+    stopper = threading.Thread(target=batcher.stop)
+    stopper.start()
+    time.sleep(0.05)
+    late = [threading.Thread(target=go, args=(i,)) for i in (1, 2)]
+    for t in late:
+        t.start()
+    for t in [first, stopper] + late:
+        t.join(5.0)
+    assert not any(t.is_alive() for t in late)
+    assert results[0] == 0
+    assert isinstance(results[1], RuntimeError) and isinstance(results[2], RuntimeError)
+
+
+def test_short_result_list_fails_the_batch():
+    batcher = _Short("short", max_batch=2)
+    batcher.start()
+    try:
+        with pytest.raises(RuntimeError, match="0 results for 1 items"):
+            batcher.submit(1)
+    finally:
+        batcher.stop()
+
+
+def test_detect_batcher_pads_frames_and_clips_boxes_to_each_frame():
+    from proctoring_batching import DetectBatcher
+
+    seen_shapes = []
+
+    def detect(frames):
+        frames = frames if isinstance(frames, list) else [frames]
+        seen_shapes.append([f.shape for f in frames])
+        # Một box phủ toàn ảnh đã pad: sau khi trả về phải bị kẹp về kích thước frame gốc.
+        out = [[(np.array([0, 0, f.shape[1], f.shape[0]], dtype=np.float32), None, 0.9)] for f in frames]
+        return out if len(out) > 1 else out[0]
+
+    batcher = DetectBatcher(detect, min_fill=0.5, max_batch=4)
+    items = [np.zeros((100, 120, 3), np.uint8), np.zeros((90, 120, 3), np.uint8), np.zeros((20, 20, 3), np.uint8)]
+    out = batcher._run_batch(items)
+    # Hai frame gần cỡ nhau chạy chung (pad về 100x120); frame nhỏ tách nhóm riêng.
+    assert sorted(len(s) for s in seen_shapes) == [1, 2]
+    assert all(s == (100, 120, 3) for group in seen_shapes if len(group) == 2 for s in group)
+    for frame, faces in zip(items, out):
+        box = faces[0][0]
+        assert box.tolist() == [0, 0, frame.shape[1], frame.shape[0]]
@@ -0,0 +1,73 @@
+import numpy as np
+
+from proctoring_cache import CacheStats, crop_signature, signature_distance
+
+
+def _face_frame(seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    frame = np.full((120, 160, 3), 90, dtype=np.uint8)
+    frame[30:90, 50:110] = rng.integers(0, 256, (60, 60, 3), dtype=np.uint8)
+    return frame
+
+
+def test_signature_ignores_global_brightness_but_not_content():
+    frame = _face_frame()
+    bb = [50.0, 30.0, 110.0, 90.0]
+    sig = crop_signature(frame, bb)
+    assert sig.shape == (32, 32) and sig.dtype == np.float32
+    brighter = np.clip(frame.astype(np.int16) + 20, 0, 255).astype(np.uint8)
+    # Dưới ngưỡng mặc định PROCTORING_GAZE_CACHE_MAX_DIFF (2.5); phần dư do pixel bị kẹp ở 255.
+    assert signature_distance(sig, crop_signature(brighter, bb)) < 2.5
+    assert signature_distance(sig, crop_signature(_face_frame(1), bb)) > 10.0
+
+
+def test_signature_of_tiny_or_outside_box_is_none():
+    frame = _face_frame()
+    assert crop_signature(frame, [10.0, 10.0, 12.0, 40.0]) is None
+    assert crop_signature(frame, [200.0, 10.0, 260.0, 60.0]) is None
+    # Box tràn biên bị kẹp vào frame.
+    assert crop_signature(frame, [-20.0, -20.0, 40.0, 40.0]) is not None
+
+
+def test_distance_of_mismatched_shapes_is_inf():
+    assert signature_distance(np.zeros((32, 32)), np.zeros((16, 16))) == float("inf")
+
+
+def test_cache_stats_counts_hits_and_miss_reasons():
+    stats = CacheStats()
+    assert stats.stats()["hit_rate"] == 0.0
+    stats.hit()
+    stats.hit()
+    stats.miss("expired")
+    stats.miss("cold")
+    assert stats.stats() == {
+        "hits": 2,
+        "misses": 2,
+        "miss_reasons": {"cold": 1, "expired": 1},
+        "hit_rate": 0.5,
+    }
+
+
+def _jpeg(frame: np.ndarray, quality: int) -> bytes:
+    import cv2
+
+    ok, buf = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    assert ok
+    return buf.tobytes()
+
+
+def test_frame_thumbnail_is_eighth_size_and_tolerates_reencoding():
+    import cv2
+
+    from proctoring_cache import frame_thumbnail
+
+    rng = np.random.default_rng(0)
+    frame = cv2.GaussianBlur(rng.integers(0, 256, (240, 320, 3), dtype=np.uint8), (9, 9), 0)
+    thumb = frame_thumbnail(_jpeg(frame, 90))
+    assert thumb.shape == (30, 40) and thumb.dtype == np.float32
+    assert abs(float(thumb.mean())) < 1e-3
+    # Cùng cảnh, nén lại khác chất lượng (nhiễu JPEG) -> gần; cảnh khác -> xa.
+    assert signature_distance(thumb, frame_thumbnail(_jpeg(frame, 70))) < 1.0
+    other = cv2.GaussianBlur(rng.integers(0, 256, frame.shape, dtype=np.uint8), (9, 9), 0)
+    assert signature_distance(thumb, frame_thumbnail(_jpeg(other, 90))) > 1.0
+    assert frame_thumbnail(b"not an image") is None
@@ -0,0 +1,47 @@
+import asyncio
+import threading
+
+import pytest
+
+from proctoring_executor import BoundedInferenceExecutor, InferenceSaturated
+
+
+def test_rejects_work_beyond_capacity():
+    async def main():
+        ex = BoundedInferenceExecutor(workers=1, max_queue=1)
+        gate = threading.Event()
+        running = [asyncio.create_task(ex.run(gate.wait)) for _ in range(2)]
+        await asyncio.sleep(0.05)
+        assert ex.in_flight == 1 and ex.queue_depth == 1 and ex.load() == 1.0
+        with pytest.raises(InferenceSaturated):
+            await ex.run(lambda: None)
+        gate.set()
+        await asyncio.gather(*running)
+        assert ex.pending == 0
+        assert await ex.run(lambda x: x * 2, 21) == 42
+        ex.shutdown()
+
+    asyncio.run(main())
+
+
+def test_cancelled_caller_keeps_slot_until_job_finishes():
+    async def main():
+        ex = BoundedInferenceExecutor(workers=1, max_queue=0)
+        gate = threading.Event()
+        task = asyncio.create_task(ex.run(gate.wait))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        await asyncio.sleep(0.05)
+        # Job vẫn chạy trong pool: slot chưa được trả.
+        assert ex.pending == 1
+        with pytest.raises(InferenceSaturated):
+            await ex.run(lambda: None)
+        gate.set()
+        for _ in range(50):
+            if ex.pending == 0:
+                break
+            await asyncio.sleep(0.01)
+        assert ex.pending == 0
+        ex.shutdown()
+
+    asyncio.run(main())
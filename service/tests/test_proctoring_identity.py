@@ -0,0 +1,70 @@
+import numpy as np
+
+from proctoring_identity import DESCRIPTOR_DIM, IdentityStore, face_descriptors
+
+
+def _faces(n: int, seed: int = 0) -> np.ndarray:
+    return np.random.default_rng(seed).integers(0, 256, (n, 112, 112), dtype=np.uint8)
+
+
+def test_descriptors_are_unit_norm_and_lighting_invariant():
+    faces = _faces(3)
+    desc = face_descriptors(faces)
+    assert desc.shape == (3, DESCRIPTOR_DIM) and desc.dtype == np.float32
+    np.testing.assert_allclose(np.linalg.norm(desc, axis=1), 1.0, rtol=1e-5)
+    # Thay đổi sáng đơn điệu (tương phản x2, sáng thêm) giữ nguyên thứ tự pixel -> cùng mã LBP.
+    dim = faces // 2
+    ref = face_descriptors(dim)
+    np.testing.assert_allclose(face_descriptors(dim * 2), ref, atol=1e-6)
+    np.testing.assert_allclose(face_descriptors(dim + 60), ref, atol=1e-6)
+    assert face_descriptors(np.empty((0, 112, 112), dtype=np.uint8)).shape == (0, DESCRIPTOR_DIM)
+
+
+def test_batch_matches_one_by_one():
+    faces = _faces(4)
+    batch = face_descriptors(faces)
+    for i in range(4):
+        np.testing.assert_allclose(face_descriptors(faces[i]), batch[i : i + 1], atol=1e-6)
+
+
+def test_enroll_keeps_running_average_and_similarities():
+    store = IdentityStore(capacity=1)
+    a, b = face_descriptors(_faces(2))
+    assert store.similarities("sv01", a[None]) is None
+    assert store.enroll("sv01", a) == 1
+    assert abs(store.similarities("sv01", a[None])[0] - 1.0) < 1e-5
+    assert store.enroll("sv01", b) == 2
+    mean = (a + b) / np.linalg.norm(a + b)
+    np.testing.assert_allclose(store.similarities("sv01", np.stack([a, b])), np.stack([a, b]) @ mean, atol=1e-5)
+    assert store.enroll("sv01", b, reset=True) == 1
+    assert abs(store.similarities("sv01", b[None])[0] - 1.0) < 1e-5
+
+
+def test_remove_moves_last_row_and_store_grows():
+    store = IdentityStore(capacity=1)
+    descs = face_descriptors(_faces(3))
+    for i, d in enumerate(descs):
+        store.enroll(f"sv{i}", d)
+    assert len(store) == 3
+    store.remove("sv0")
+    store.remove("missing")
+    assert len(store) == 2 and "sv0" not in store
+    # sv2 đã được chuyển vào hàng của sv0, vẫn khớp đúng mô tả của nó.
+    assert abs(store.similarities("sv2", descs[2:])[0] - 1.0) < 1e-5
+    assert abs(store.similarities("sv1", descs[1:2])[0] - 1.0) < 1e-5
+
+
+def test_export_restore_continues_running_average():
+    a, b = face_descriptors(_faces(2))
+    src = IdentityStore()
+    src.enroll("sv01", a)
+    src.enroll("sv01", b)
+    total, samples = src.export("sv01")
+    assert samples == 2 and src.export("missing") is None
+
+    dst = IdentityStore()
+    dst.restore("sv01", total, samples)
+    assert dst.export("sv01")[1] == 2
+    src.enroll("sv01", a)
+    assert dst.enroll("sv01", a) == 3
+    np.testing.assert_allclose(dst.similarities("sv01", b[None]), src.similarities("sv01", b[None]), atol=1e-6)
@@ -0,0 +1,78 @@
+import threading
+
+import pytest
+
+from proctoring_metrics import Counter, Histogram, ServiceMetrics, counter, counts_histogram, gauge
+
+
+def _samples(lines: list[str]) -> dict[str, float]:
+    return {k: float(v) for k, v in (line.rsplit(" ", 1) for line in lines if not line.startswith("#"))}
+
+
+def test_histogram_buckets_are_cumulative_with_inf_sum_and_count():
+    hist = Histogram("t_seconds", "Test.", ("path",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        hist.observe(value, "tick")
+    lines = hist.collect()
+    assert lines[:2] == ["# HELP t_seconds Test.", "# TYPE t_seconds histogram"]
+    assert _samples(lines) == pytest.approx({
+        't_seconds_bucket{path="tick",le="0.1"}': 2,
+        't_seconds_bucket{path="tick",le="1.0"}': 3,
+        't_seconds_bucket{path="tick",le="+Inf"}': 4,
+        't_seconds_sum{path="tick"}': 3.65,
+        't_seconds_count{path="tick"}': 4,
+    })
+
+
+def test_counter_merges_thread_shards():
+    c = Counter("t_errors", "Test.", ("error",))
+
+    def work():
+        for _ in range(1000):
+            c.inc("Boom")
+
+    threads = [threading.Thread(target=work) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    c.inc("Other", amount=5)
+    assert _samples(c.collect()) == {'t_errors_total{error="Boom"}': 4000, 't_errors_total{error="Other"}': 5}
+
+
+def test_label_values_are_escaped():
+    lines = gauge("t_gauge", "Test.", {('a"b\\c\nd',): 1}, ("name",))
+    assert lines[-1] == 't_gauge{name="a\\"b\\\\c\\nd"} 1'
+    assert counter("t", "Test.", {(): 3})[-1] == "t_total 3"
+
+
+def test_counts_histogram_uses_power_of_two_buckets():
+    lines = counts_histogram("t_batch", "Test.", {("gaze",): {1: 4, 3: 2, 8: 1}}, ("model",))
+    assert _samples(lines) == {
+        't_batch_bucket{model="gaze",le="1.0"}': 4,
+        't_batch_bucket{model="gaze",le="2.0"}': 4,
+        't_batch_bucket{model="gaze",le="4.0"}': 6,
+        't_batch_bucket{model="gaze",le="8.0"}': 7,
+        't_batch_bucket{model="gaze",le="+Inf"}': 7,
+        't_batch_sum{model="gaze"}': 18,
+        't_batch_count{model="gaze"}': 7,
+    }
+
+
+def test_stages_take_the_path_of_the_enclosing_request():
+    m = ServiceMetrics()
+    with m.request("tick"):
+        with m.stage("decode"):
+            pass
+        m.frame("detect")
+    with m.stage("decode"):
+        pass
+    with pytest.raises(ValueError):
+        with m.request("enroll"):
+            raise ValueError
+    samples = _samples(m.collect())
+    assert samples['proctoring_stage_seconds_count{path="tick",stage="decode"}'] == 1
+    assert samples['proctoring_stage_seconds_count{path="other",stage="decode"}'] == 1
+    assert samples['proctoring_frames_total{path="tick",source="detect"}'] == 1
+    assert samples['proctoring_request_seconds_count{path="enroll"}'] == 1
+    assert samples['proctoring_request_errors_total{path="enroll",error="ValueError"}'] == 1
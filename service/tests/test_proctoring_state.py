@@ -0,0 +1,52 @@
+import time
+
+from proctoring_state import SessionRegistry
+
+
+def test_session_created_once_and_peek_does_not_create():
+    registry = SessionRegistry(num_shards=4)
+    with registry.peek("a") as st:
+        assert st is None
+    with registry.session("a", student_id="A") as st:
+        st.frame_counter += 1
+    with registry.session("a") as st:
+        assert st.frame_counter == 1
+        assert st.student_id == "A"
+    assert len(registry) == 1
+
+
+def test_keys_spread_over_shards_deterministically():
+    registry = SessionRegistry(num_shards=8)
+    keys = [f"sv{i}" for i in range(64)]
+    assert len({id(registry._shard(k)) for k in keys}) > 1
+    assert all(registry._shard(k) is registry._shard(k) for k in keys)
+
+
+def test_idle_sessions_evicted_with_callback():
+    removed = []
+    registry = SessionRegistry(num_shards=1, idle_ttl_sec=0.05, on_remove=removed.append)
+    with registry.session("old"):
+        pass
+    time.sleep(0.1)
+    # Eviction chạy khi tạo session mới trên cùng shard.
+    with registry.session("new"):
+        pass
+    assert removed == ["old"]
+    with registry.peek("old") as st:
+        assert st is None
+
+
+def test_remove_and_clear_call_on_remove_and_reset_default_key():
+    removed = []
+    registry = SessionRegistry(num_shards=4, on_remove=removed.append)
+    for k in ("a", "b", "c"):
+        with registry.session(k):
+            pass
+    registry.set_default_key("a")
+    registry.remove("a")
+    registry.remove("missing")
+    assert removed == ["a"]
+    assert registry.default_key is None
+    registry.clear()
+    assert sorted(removed) == ["a", "b", "c"]
+    assert len(registry) == 0
@@ -0,0 +1,64 @@
+import numpy as np
+
+from proctoring_store import EnrollmentRecord, EnrollmentStore
+
+
+def _record(key: str, samples: int = 1) -> EnrollmentRecord:
+    return EnrollmentRecord(
+        key=key, student_id=key.upper(), samples=samples, descriptor_sum=np.full(8, samples, np.float32), enroll_seq=None
+    )
+
+
+def test_get_ignores_rows_a_pending_clear_will_delete(tmp_path):
+    store = EnrollmentStore(str(tmp_path / "enroll.sqlite3"), flush_interval_ms=1000)
+    store.put(_record("sv01"))
+    store.start()
+    try:
+        store.clear()
+        assert store.get("sv01") is None
+        store.put(_record("sv02"))
+        assert store.get("sv02").samples == 1
+    finally:
+        store.stop()
+    assert [r.key for r in store.load()] == ["sv02"]
+
+
+def test_round_trip_delete_and_corrupt_rows(tmp_path):
+    path = str(tmp_path / "enroll.sqlite3")
+    store = EnrollmentStore(path)
+    seq = {"step": 2, "gaze_ok_since": None}
+    store.put(EnrollmentRecord("sv01", "SV01", 3, np.arange(8, dtype=np.float32), seq))
+    store.put(_record("sv02"))
+    store.put(_record("sv03"))
+    store.delete("sv03")
+
+    # Chưa start(): mỗi lệnh ghi ngay — một instance mới đọc được.
+    records = EnrollmentStore(path).load()
+    assert [r.key for r in records] == ["sv01", "sv02"]
+    rec = records[0]
+    assert (rec.student_id, rec.samples, rec.enroll_seq) == ("SV01", 3, seq)
+    np.testing.assert_array_equal(rec.descriptor_sum, np.arange(8, dtype=np.float32))
+    assert store.get("sv03") is None and store.get("missing") is None
+
+    store.clear()
+    assert store.load() == []
+    assert store.stats()["pending"] == 0
+
+
+def test_background_writer_batches_and_get_sees_pending(tmp_path):
+    store = EnrollmentStore(str(tmp_path / "enroll.sqlite3"), flush_interval_ms=1000)
+    store.start()
+    try:
+        for samples in (1, 2, 3):
+            store.put(_record("sv01", samples))
+        store.put(_record("sv02"))
+        store.delete("sv02")
+        assert store.load() == []
+        assert store.get("sv01").samples == 3
+        assert store.get("sv02") is None
+    finally:
+        store.stop()
+    # Các put cùng key gộp lại: một lô, bản cuối thắng.
+    assert [(r.key, r.samples) for r in store.load()] == [("sv01", 3)]
+    stats = store.stats()
+    assert stats["batches"] == 1 and stats["pending"] == 0
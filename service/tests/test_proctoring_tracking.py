@@ -0,0 +1,47 @@
+import numpy as np
+
+from proctoring_tracking import motion_energy, propagate_boxes, tracking_gray
+
+
+def _textured(h=240, w=320, seed=0):
+    rng = np.random.default_rng(seed)
+    import cv2
+
+    noise = rng.integers(0, 255, (h // 4, w // 4), dtype=np.uint8)
+    return cv2.resize(noise, (w, h), interpolation=cv2.INTER_LINEAR)
+
+
+def test_tracking_gray_downscales_long_side():
+    frame = np.zeros((480, 640, 3), dtype=np.uint8)
+    gray, scale = tracking_gray(frame, max_side=320)
+    assert gray.shape == (240, 320)
+    assert scale == 0.5
+
+
+def test_propagate_boxes_follows_a_shift():
+    prev = _textured()
+    cur = np.roll(prev, shift=(3, 5), axis=(0, 1))
+    boxes = np.array([[100, 60, 200, 180]], dtype=np.float32)
+    moved, conf = propagate_boxes(prev, cur, boxes, scale=1.0)
+    assert conf[0] > 0.5
+    np.testing.assert_allclose(moved[0], boxes[0] + [5, 3, 5, 3], atol=1.0)
+
+
+def test_propagate_boxes_gives_zero_confidence_on_flat_region():
+    flat = np.full((240, 320), 128, dtype=np.uint8)
+    boxes = np.array([[100, 60, 200, 180]], dtype=np.float32)
+    moved, conf = propagate_boxes(flat, flat, boxes, scale=1.0)
+    assert conf[0] == 0.0
+    assert np.array_equal(moved, boxes)
+
+
+def test_motion_energy_ignores_changes_inside_known_faces():
+    prev = np.zeros((240, 320), dtype=np.uint8)
+    inside = prev.copy()
+    inside[60:180, 100:200] = 200
+    boxes = np.array([[200, 120, 400, 360]], dtype=np.float32)  # toạ độ frame gốc, scale 0.5
+    assert motion_energy(prev, inside, boxes, scale=0.5) == 0.0
+    outside = prev.copy()
+    outside[:, :50] = 200
+    assert motion_energy(prev, outside, boxes, scale=0.5) > 20.0
+    assert motion_energy(prev, np.zeros((10, 10), np.uint8), boxes, scale=0.5) == float("inf")
@@ -0,0 +1,162 @@
+import threading
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from proctoring_workers import InferenceWorkerPool
+
+
+class _Conn:
+    def __init__(self):
+        self.dead = False
+        # Xoá gate = worker đang bận/treo: poll() chờ tới khi gate mở hoặc hết timeout.
+        self.gate = threading.Event()
+        self.gate.set()
+
+    def send(self, msg):
+        if self.dead:
+            raise BrokenPipeError("worker gone")
+        self.last = msg
+
+    def poll(self, timeout=None):
+        return self.gate.wait(timeout)
+
+    def recv(self):
+        if self.dead:
+            raise EOFError
+        op, shape, _dtype, _inline = self.last
+        return "ok", (op, shape)
+
+
+class _FakePool(InferenceWorkerPool):
+    """Handle giả trong cùng tiến trình: chỉ kiểm tra việc quản lý handle (không spawn model thật)."""
+
+    def __init__(self, num_workers, fail_spawn=False, call_timeout_sec=60.0):
+        self.spawned = []
+        self.fail_spawn = fail_spawn
+        # Xoá để giữ spawn lại (như đang load model) cho tới khi test mở.
+        self.spawn_gate = threading.Event()
+        self.spawn_gate.set()
+        super().__init__(
+            num_workers, "w.pkl", "ResNet50", "cpu", 0.5, 1, slot_bytes=1 << 16, call_timeout_sec=call_timeout_sec
+        )
+
+    def _spawn(self):
+        self.spawn_gate.wait(5.0)
+        if self.fail_spawn:
+            raise RuntimeError("spawn failed")
+        h = SimpleNamespace(conn=_Conn(), shm=SimpleNamespace(buf=bytearray(1 << 16)))
+        self.spawned.append(h)
+        return h
+
+    def _terminate(self, h):
+        h.conn.dead = True
+
+
+def _crops():
+    return np.zeros((2, 8, 8, 3), dtype=np.uint8)
+
+
+def test_calls_round_trip_through_a_free_worker():
+    pool = _FakePool(2)
+    assert pool.predict_gaze(_crops()) == ("gaze", (2, 8, 8, 3))
+    assert pool._free.qsize() == 2
+
+
+def test_crashed_worker_is_replaced():
+    pool = _FakePool(1)
+    dead = pool._handles[0]
+    dead.conn.dead = True
+    with pytest.raises(RuntimeError, match="crashed"):
+        pool.predict_gaze(_crops())
+    assert dead not in pool._handles and len(pool._handles) == 1
+    assert pool.predict_gaze(_crops()) == ("gaze", (2, 8, 8, 3))
+
+
+def test_failed_respawn_drops_the_dead_handle():
+    pool = _FakePool(1)
+    pool._handles[0].conn.dead = True
+    pool.fail_spawn = True
+    with pytest.raises(RuntimeError, match="spawn failed"):
+        pool.predict_gaze(_crops())
+    assert pool._handles == [] and pool._free.qsize() == 0
+    # Không còn worker: lỗi ngay thay vì chờ mãi trên hàng đợi rỗng.
+    with pytest.raises(RuntimeError, match="No inference worker"):
+        pool.predict_gaze(_crops())
+
+
+def _in_thread(fn):
+    out = {}
+
+    def run():
+        try:
+            out["result"] = fn()
+        except Exception as e:  # noqa: BLE001
+            out["error"] = e
+
+    t = threading.Thread(target=run, daemon=True)
+    t.start()
+    return t, out
+
+
+def test_waiter_fails_when_last_worker_dies_while_it_waits():
+    pool = _FakePool(1)
+    h = pool._handles[0]
+    h.conn.gate.clear()
+    busy, busy_out = _in_thread(lambda: pool.predict_gaze(_crops()))
+    waiter, waiter_out = _in_thread(lambda: pool.predict_gaze(_crops()))
+    # waiter đang chờ trên _free khi worker duy nhất chết và không spawn lại được.
+    pool.fail_spawn = True
+    h.conn.dead = True
+    h.conn.gate.set()
+    busy.join(5.0)
+    waiter.join(5.0)
+    assert not busy.is_alive() and not waiter.is_alive()
+    assert "spawn failed" in str(busy_out["error"])
+    assert "No inference worker" in str(waiter_out["error"])
+
+
+def test_waiter_keeps_waiting_while_the_last_worker_respawns():
+    pool = _FakePool(1)
+    pool._handles[0].conn.dead = True
+    pool.spawn_gate.clear()
+    crashed, crashed_out = _in_thread(lambda: pool.predict_gaze(_crops()))
+    waiter, waiter_out = _in_thread(lambda: pool.predict_gaze(_crops()))
+    waiter.join(pool._WAIT_POLL_SEC * 3)
+    # Đang spawn lại: pool rỗng tạm thời nhưng chưa phải "hết worker".
+    assert waiter.is_alive()
+    pool.spawn_gate.set()
+    crashed.join(5.0)
+    waiter.join(5.0)
+    assert "crashed" in str(crashed_out["error"])
+    assert waiter_out["result"] == ("gaze", (2, 8, 8, 3))
+
+
+def test_respawn_does_not_block_healthy_workers():
+    pool = _FakePool(2)
+    dead = pool._handles[0]
+    dead.conn.dead = True
+    pool.spawn_gate.clear()
+    crashed, _ = _in_thread(lambda: pool.predict_gaze(_crops()))
+    # Lấy worker chết ra trước để call sau chắc chắn vào worker khoẻ.
+    while dead in pool._handles:
+        crashed.join(0.01)
+    healthy, healthy_out = _in_thread(lambda: pool.predict_gaze(_crops()))
+    healthy.join(2.0)
+    assert healthy_out.get("result") == ("gaze", (2, 8, 8, 3))
+    assert crashed.is_alive()
+    pool.spawn_gate.set()
+    crashed.join(5.0)
+    assert len(pool._handles) == 2
+
+
+def test_hung_worker_is_killed_and_replaced_after_call_timeout():
+    pool = _FakePool(1, call_timeout_sec=0.05)
+    hung = pool._handles[0]
+    hung.conn.gate.clear()
+    with pytest.raises(RuntimeError, match="did not answer"):
+        pool.predict_gaze(_crops())
+    assert hung.conn.dead
+    assert pool._handles == [pool.spawned[-1]] and pool._free.qsize() == 1
+    assert pool.predict_gaze(_crops()) == ("gaze", (2, 8, 8, 3))
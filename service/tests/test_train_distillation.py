@@ -0,0 +1,37 @@
+import torch
+
+from l2cs import L2CSMobileNet, getArch
+from train import distillation_loss, get_fc_params, get_ignored_params, get_non_ignored_params
+
+
+def test_distillation_loss_is_zero_only_when_distributions_match():
+    torch.manual_seed(0)
+    teacher = torch.randn(4, 90)
+    assert distillation_loss(teacher.clone(), teacher, 2.0).item() < 1e-6
+    assert distillation_loss(torch.randn(4, 90), teacher, 2.0).item() > 0
+
+
+def test_distillation_loss_gradient_moves_student_towards_teacher():
+    torch.manual_seed(0)
+    teacher = torch.randn(2, 90)
+    student = torch.zeros(2, 90, requires_grad=True)
+    before = distillation_loss(student, teacher, 4.0)
+    before.backward()
+    with torch.no_grad():
+        after = distillation_loss(student - 1.0 * student.grad, teacher, 4.0)
+    assert after.item() < before.item()
+
+
+def test_mobilenet_student_is_a_drop_in_arch():
+    model = getArch("MobileNetV3_Small", 90).eval()
+    assert isinstance(model, L2CSMobileNet)
+    with torch.no_grad():
+        yaw, pitch = model(torch.randn(2, 3, 64, 64))
+    assert yaw.shape == pitch.shape == (2, 90)
+
+    # Các nhóm tham số của optimizer phủ toàn bộ backbone + head.
+    assert list(get_ignored_params(model)) == []
+    backbone = {id(p) for p in get_non_ignored_params(model)}
+    heads = {id(p) for p in get_fc_params(model)}
+    assert not backbone & heads
+    assert backbone | heads == {id(p) for p in model.parameters()}
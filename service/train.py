@@ -5,13 +5,14 @@ import time
 import torch.utils.model_zoo as model_zoo
 import torch
 import torch.nn as nn
+import torch.nn.functional as F
 from torch.autograd import Variable
 from torch.utils.data import DataLoader
 from torchvision import transforms
 import torch.backends.cudnn as cudnn
 import torchvision
 
-from l2cs import L2CS, select_device, Gaze360, Mpiigaze
+from l2cs import L2CS, L2CSMobileNet, select_device, Gaze360, Mpiigaze, getArch
 
 
 def parse_args():
@@ -53,7 +54,7 @@ def parse_args():
         '--batch_size', dest='batch_size', help='Batch size.',
         default=1, type=int)
     parser.add_argument(
-        '--arch', dest='arch', help='Network architecture, can be: ResNet18, ResNet34, [ResNet50], ''ResNet101, ResNet152, Squeezenet_1_0, Squeezenet_1_1, MobileNetV2',
+        '--arch', dest='arch', help='Network architecture, can be: ResNet18, ResNet34, [ResNet50], ''ResNet101, ResNet152, MobileNetV3 (= MobileNetV3_Large), MobileNetV3_Small',
         default='ResNet50', type=str)
     parser.add_argument(
         '--alpha', dest='alpha', help='Regression loss coefficient.',
@@ -61,6 +62,19 @@ def parse_args():
     parser.add_argument(
         '--lr', dest='lr', help='Base learning rate.',
         default=0.00001, type=float)
+    # Knowledge distillation (gaze360) -------------------------------------------------------------------------------------
+    parser.add_argument(
+        '--distill_from', '--distill-from', dest='distill_from', help='Teacher snapshot: train --arch as a student on its soft 90-bin outputs.',
+        default='', type=str)
+    parser.add_argument(
+        '--teacher_arch', dest='teacher_arch', help='Teacher network architecture.',
+        default='ResNet50', type=str)
+    parser.add_argument(
+        '--distill_beta', dest='distill_beta', help='Distillation (KL) loss coefficient.',
+        default=1.0, type=float)
+    parser.add_argument(
+        '--distill_temperature', dest='distill_temperature', help='Softmax temperature for teacher/student bins.',
+        default=2.0, type=float)
     # ---------------------------------------------------------------------------------------------------------------------
     # Important args ------------------------------------------------------------------------------------------------------
     args = parser.parse_args()
@@ -68,7 +82,7 @@ def parse_args():
 
 def get_ignored_params(model):
     # Generator function that yields ignored params.
-    b = [model.conv1, model.bn1, model.fc_finetune]
+    b = [model.conv1, model.bn1, model.fc_finetune] if isinstance(model, L2CS) else []
     for i in range(len(b)):
         for module_name, module in b[i].named_modules():
             if 'bn' in module_name:
@@ -78,7 +92,10 @@ def get_ignored_params(model):
 
 def get_non_ignored_params(model):
     # Generator function that yields params that will be optimized.
-    b = [model.layer1, model.layer2, model.layer3, model.layer4]
+    if isinstance(model, L2CSMobileNet):
+        b = [model.features]
+    else:
+        b = [model.layer1, model.layer2, model.layer3, model.layer4]
     for i in range(len(b)):
         for module_name, module in b[i].named_modules():
             if 'bn' in module_name:
@@ -102,8 +119,22 @@ def load_filtered_state_dict(model, snapshot):
     model.load_state_dict(model_dict)
 
 
+def distillation_loss(student_logits, teacher_logits, temperature):
+    # KL(teacher || student) on temperature-softened bin distributions, scaled by T^2 (Hinton et al.)
+    return F.kl_div(
+        F.log_softmax(student_logits / temperature, dim=1),
+        F.softmax(teacher_logits / temperature, dim=1),
+        reduction='batchmean') * temperature * temperature
+
+
 def getArch_weights(arch, bins):
-    if arch == 'ResNet18':
+    if arch in ('MobileNetV3', 'MobileNetV3_Large'):
+        model = L2CSMobileNet('large', bins)
+        pre_url = torchvision.models.MobileNet_V3_Large_Weights.IMAGENET1K_V1.url
+    elif arch == 'MobileNetV3_Small':
+        model = L2CSMobileNet('small', bins)
+        pre_url = torchvision.models.MobileNet_V3_Small_Weights.IMAGENET1K_V1.url
+    elif arch == 'ResNet18':
         model = L2CS(torchvision.models.resnet.BasicBlock, [2, 2, 2, 2], bins)
         pre_url = 'https://download.pytorch.org/models/resnet18-5c106cde.pth'
     elif arch == 'ResNet34':
@@ -156,6 +187,18 @@ if __name__ == '__main__':
         
         
         model.cuda(gpu)
+
+        teacher = None
+        if args.distill_from:
+            # Frozen teacher; the student also learns its soft pitch/yaw bin distributions.
+            teacher = getArch(args.teacher_arch, 90)
+            teacher.load_state_dict(torch.load(args.distill_from, map_location='cpu'))
+            teacher.cuda(gpu)
+            teacher.eval()
+            for param in teacher.parameters():
+                param.requires_grad = False
+            print(f'Distilling {args.teacher_arch} ({args.distill_from}) -> {args.arch}')
+
         dataset=Gaze360(args.gaze360label_dir, args.gaze360image_dir, transformations, 180, 4)
         print('Loading data.')
         train_loader_gaze = DataLoader(
@@ -166,7 +209,7 @@ if __name__ == '__main__':
             pin_memory=True)
         torch.backends.cudnn.benchmark = True
 
-        summary_name = '{}_{}'.format('L2CS-gaze360-', int(time.time()))
+        summary_name = '{}_{}'.format('L2CS-gaze360-' + ('distill-' + args.arch if teacher is not None else ''), int(time.time()))
         output=os.path.join(output, summary_name)
         if not os.path.exists(output):
             os.makedirs(output)
@@ -228,6 +271,15 @@ if __name__ == '__main__':
                 loss_pitch_gaze += alpha * loss_reg_pitch
                 loss_yaw_gaze += alpha * loss_reg_yaw
 
+                # Distillation loss
+                if teacher is not None:
+                    with torch.no_grad():
+                        teacher_pitch, teacher_yaw = teacher(images_gaze)
+                    loss_pitch_gaze += args.distill_beta * distillation_loss(
+                        pitch, teacher_pitch, args.distill_temperature)
+                    loss_yaw_gaze += args.distill_beta * distillation_loss(
+                        yaw, teacher_yaw, args.distill_temperature)
+
                 sum_loss_pitch_gaze += loss_pitch_gaze
                 sum_loss_yaw_gaze += loss_yaw_gaze
 
@@ -263,6 +315,9 @@ if __name__ == '__main__':
 
    
     elif data_set=="mpiigaze":
+        if args.distill_from:
+            # The released teachers are 90-bin Gaze360 models; MPIIGaze uses 28 bins.
+            raise SystemExit('--distill_from is only supported with --dataset gaze360')
         folder = os.listdir(args.gazeMpiilabel_dir)
         folder.sort()
         testlabelpathombined = [os.path.join(args.gazeMpiilabel_dir, j) for j in folder]